@@ -0,0 +1,107 @@
+##############################
+# ROLLING AND GROWTH METRICS #
+##############################
+
+# 7-day averages, week-over-week growth, doubling time and an Rt-style growth
+# proxy for every country, computed once per data load on a (countries x
+# dates) matrix: every 7-day window sum is a difference of two columns of a
+# cumulative sum, so no window is ever summed day by day and no country is
+# handled on its own. The results are laid out like the rows of
+# grouped_country, so CountryIndex serves them next to the raw series.
+#
+# For a metric M (Confirmed or Deaths) the columns are
+#
+#   avg7M          mean of newM over the last 7 days
+#   weeklyGrowthM  % change of that 7-day sum from the previous 7 days
+#   doublingTimeM  days for cumulative M to double at the last 7 days' rate
+#   rtM            (7-day sum / previous 7-day sum) ** (SERIAL_INTERVAL / 7),
+#                  a reproduction number proxy
+#
+# Each is NaN where its windows are incomplete or the ratio is undefined.
+
+import numpy as np
+import pandas as pd
+
+WINDOW = 7
+
+# Mean days between the infections of a case and of the cases it causes
+SERIAL_INTERVAL = 5
+
+METRICS = ['Confirmed', 'Deaths']
+
+KINDS = ['avg7', 'weeklyGrowth', 'doublingTime', 'rt']
+
+
+def _matrix(codes, positions, values, shape):
+    matrix = np.full(shape, np.nan)
+    matrix[codes, positions] = values
+    return matrix
+
+
+def _window_sums(daily, window=WINDOW):
+    """Sums of the last `window` days, NaN where one of them is missing."""
+    present = ~np.isnan(daily)
+    sums = np.cumsum(np.where(present, daily, 0), axis=1)
+    counts = np.cumsum(present, axis=1)
+    # Window ending at day t is column t of the cumsum minus column t - window
+    sums[:, window:] -= sums[:, :-window].copy()
+    counts[:, window:] -= counts[:, :-window].copy()
+    sums[counts < window] = np.nan
+    return sums
+
+
+def _lagged(matrix, lag):
+    lagged = np.full_like(matrix, np.nan)
+    lagged[:, lag:] = matrix[:, :-lag]
+    return lagged
+
+
+def growth_metrics(cumulative, daily, window=WINDOW,
+                   serial_interval=SERIAL_INTERVAL):
+    """The four metrics of a (countries x dates) cumulative and daily matrix."""
+    current = _window_sums(daily, window)
+    previous = _lagged(current, window)
+    before = _lagged(cumulative, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(previous > 0, current / previous, np.nan)
+        growth = np.where(before > 0, np.log(cumulative / before) / window,
+                          np.nan)
+        return {
+            'avg7': current / window,
+            'weeklyGrowth': (ratio - 1) * 100,
+            'doublingTime': np.where(growth > 0, np.log(2) / growth, np.nan),
+            'rt': ratio**(serial_interval / window),
+        }
+
+
+def compute(grouped_country, metrics=METRICS):
+    """Columns name -> float32 array aligned with the rows of
+    grouped_country, for every metric and kind."""
+    codes, _ = pd.factorize(grouped_country['Country'])
+    dates = grouped_country['Date'].to_numpy()
+    unique_dates = np.unique(dates)
+    positions = np.searchsorted(unique_dates, dates)
+    shape = (codes.max() + 1 if len(codes) else 0, len(unique_dates))
+
+    columns = {}
+    for metric in metrics:
+        cumulative = _matrix(codes, positions,
+                             grouped_country[metric].to_numpy(), shape)
+        daily = _matrix(codes, positions,
+                        grouped_country['new' + metric].to_numpy(), shape)
+        for kind, matrix in growth_metrics(cumulative, daily).items():
+            columns[kind + metric] = matrix[codes, positions].astype(np.float32)
+    return columns
+
+
+def series_metrics(series, metrics=METRICS):
+    """The same columns for a single region's series, a dict of arrays like
+    the ones CountryIndex.series() returns."""
+    columns = {}
+    for metric in metrics:
+        cumulative = np.asarray(series[metric], dtype=np.float64)[None]
+        daily = np.asarray(series['new' + metric], dtype=np.float64)[None]
+        for kind, matrix in growth_metrics(cumulative, daily).items():
+            columns[kind + metric] = matrix[0].astype(np.float32)
+    return columns
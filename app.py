@@ -2,11 +2,14 @@
 # LIBRARIES #
 #############
 
+import json
+import logging
+import os
+
 import pandas as pd
 import numpy as np
-from datetime import datetime, date, time, timezone
-import pycountry
 
+import plotly
 import plotly.express as px
 import plotly.graph_objects as go
 import folium
@@ -17,11 +20,35 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
+from flask import jsonify, request
+
+import analytics
+import correlations
+import data_api
+import geometry
+from comparison import ALIGN_OPTIONS, compare
+from country_index import CountryIndex
+from data_refresh import DataRefresher
+from datasets import append_data, reference_version, transform_data
+from figure_cache import FigureCache
+from http_cache import ResponseCache
+from instrumentation import instrument, memory_report
+from map_frames import ChoroplethFrames
+from us_counties import US_COUNTIES, USCounties
 
 #############
 
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
+# Where plotly.js loads the country shapes of the world maps from (as
+# world_110m.json), at the detail that suits the client; see geometry.py
+TOPOJSON_URL = app.config.requests_pathname_prefix + 'geometry/'
+
+# Map layers the served geometry has no shapes for, which the template turns on
+BASE_LAYERS_OFF = dict(showland=False, showlakes=False)
+
 ####################################################
 # GATHERING AND PARSING DATA FOR CHARTS AND GRAPHS #
 ####################################################
@@ -29,121 +56,26 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 base_url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/"
 
 
-# Functions for gathering datasets from John Hopkins's repository
-def world_data():
-    data = pd.read_csv(
-        'https://raw.githubusercontent.com/datasets/covid-19/master/data/countries-aggregated.csv',
-        parse_dates=['Date'])
-    return data
-
-
-# def usData(fileName, columnName):
-#     data = pd.read_csv(base_url + fileName) \
-#              .melt(id_vars=['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2', 'Province_State',
-#        'Country_Region', 'Lat', 'Long_', 'Combined_Key'], var_name='date', value_name=columnName) \
-#              .fillna('<all>')
-#     # Get names of indexes for which column Date has extra strings has value 30
-#     indexNames = data[data['date'] == 'Population'].index
-#     # Delete these row indexes from dataFrame
-#     data.drop(indexNames, inplace=True)
-#     #data['date'] = data['date'].astype('datetime64[ns]')
-#     return data
-
-# ########################
-
-# # US data
-# us_data = usData("time_series_covid19_confirmed_US.csv", "Confirmed") \
-#     .merge(usData("time_series_covid19_deaths_US.csv", "Deaths"))
-# us_data.head()
-
-# World data
-world_data = world_data()
-#world_data.head()
+# World data is loaded in the background by data_refresh.DataRefresher, see
+# build_state() below for everything derived from it.
 
-########################
 
-# Transforming datasets
-#sorting based on confirmed cases to identify top-10 countries with highest confirmed cases
-grouped = world_data.groupby(['Country']).agg({
-    'Confirmed': 'max',
-    'Deaths': 'max'
-}).sort_values(by=['Confirmed'], ascending=False).reset_index()
-grouped['fatalityRate'] = grouped.Deaths / grouped.Confirmed * 100
-top_10 = list(grouped.Country[0:10])
-
-grouped['fatalityRate'] = round(grouped.Deaths / grouped.Confirmed * 100, 2)
-
-# grouped['newConfirmed'] = grouped['Confirmed'].diff().fillna(0)
-# grouped['newDeaths'] = grouped['Deaths'].diff().fillna(0)
-
-grouped_country = world_data.groupby(['Country', 'Date']).agg({
-    'Confirmed': 'max',
-    'Deaths': 'max'
-}).reset_index()
-grouped_country['newConfirmed'] = grouped_country['Confirmed'].diff().fillna(0)
-grouped_country['newDeaths'] = grouped_country['Deaths'].diff().fillna(0)
-
-df_select = world_data[world_data['Country'].isin(top_10)].copy()
-
-# grouped_states = us_data.groupby(
-#     ['date', 'Province_State', 'FIPS', 'Lat', 'Long_']).agg({
-#         'Confirmed': 'max',
-#         'Deaths': 'max'
-#     }).reset_index()
-
-# Opening pickled country code dictionary and Mapping codes to countries in dataset
-complete_country_code_dict = pd.read_pickle(
-    'pickled_files/complete_country_code_dict.pkl')
-# print(complete_country_code_dict)
-grouped['code'] = grouped['Country'].map(complete_country_code_dict)
-# Double checking missing values
-# missing_codes = len(grouped[grouped.code == 'Unknown code'][['Country']])
-# print(f'There are {missing_codes} missing 3-letter codes in dataset')
-# print('-------')
-# #grouped.head()
-
-# Adding population data
-complete_country_pop_dict = pd.read_pickle(
-    'pickled_files/complete_country_pop_dict.pkl')
-
-# Mapping population data to countries
-grouped['over_65'] = grouped['Country'].map(complete_country_pop_dict)
-
-# Opening pickled dictionary with population data and mapping to countries
-pop_dict = pd.read_pickle('./pickled_files/population_dict.pkl')
-
-# Mapping populations to countries in dataset
-world_data['population'] = world_data['Country'].map(pop_dict)
-
-# Double checking missing values
-missing_populations = len(
-    world_data[world_data.population.isna()][['population']])
-# print(f'There are {missing_populations} missing populations in dataset')
-# print('-------')
-# world_data.head()
-
-# # Calculating cases per 100,000 population
-# world_data['casesPerCapita'] = world_data['Confirmed'] / world_data[
-#     'population'] * 100000
-# world_data['deathsPerCapita'] = world_data['Deaths'] / world_data[
-#     'population'] * 100000
+# The US county files are loaded in the background as well, by
+# us_counties.USCounties, and drilled down into from the country charts.
 
 # # Last time data was updated
 
-def update_time():
+def update_time(state):
     #last_update = world_data.Date.max().strftime("%d-%b-%Y")
-    last_update = datetime.now().strftime("%B %dth %Y %H:%M:%S")
+    last_update = state['loaded_at'].strftime("%B %dth %Y %H:%M:%S")
     return last_update
 
 
-
-print('Data Succefully Loaded')
-
 ##############
 # CHOROPLETH #
 ##############
 
-def world_map():
+def world_map(grouped):
 
     fig = px.choropleth(
         grouped,
@@ -187,50 +119,145 @@ def world_map():
         ),
         geo=dict(showframe=False,
                  showcoastlines=False,
-                 projection_type='equirectangular'))
-
-    fig.update_traces(hovertemplate='<b>' + grouped['Country'] + '</b>' +
-                      '<br>' + 'Confirmed Cases: ' +
-                      grouped['Confirmed'].astype(str) + '<br>' + 'Deaths: ' +
-                      grouped['Deaths'].astype(str))
+                 projection_type='equirectangular',
+                 **BASE_LAYERS_OFF))
+
+    # hover_name and hover_data fill hovertext and customdata, so a single
+    # template serves every country
+    fig.update_traces(hovertemplate='<b>%{hovertext}</b>' + '<br>' +
+                      'Confirmed Cases: %{customdata[0]}' + '<br>' +
+                      'Deaths: %{customdata[1]}')
     return fig
 
-world_map = world_map()
+########################
+# CHOROPLETH OVER TIME #
+########################
+
+def mapHistory(map_frames, page):
+    # The trace holds the locations and names once; the frames of the page
+    # only replace z (see map_frames)
+    positions = map_frames.page_dates(page)
+    labels = [map_frames.label(position) for position in positions]
+    if not labels:
+        # No date to show, e.g. the source had no rows
+        fig = go.Figure()
+        fig.update_layout(template="plotly_dark")
+        return fig
+
+    fig = go.Figure(
+        data=[
+            go.Choropleth(
+                locations=map_frames.locations,
+                z=map_frames.values(positions[-1]),
+                hovertext=map_frames.names,
+                zmin=0,
+                zmax=map_frames.zmax,
+                colorscale='Reds',
+                marker_line_width=0.5,
+                colorbar=dict(
+                    title="<b>Confirmed Cases</b>",
+                    tickvals=[1, 2, 3, 4, 5, 6, 7],
+                    ticktext=["10", "100", "1k", "10k", "100k", "1M", "10M"],
+                    thicknessmode="pixels",
+                    thickness=10,
+                ),
+                hovertemplate='<b>%{hovertext}</b>' + '<br>' +
+                'Confirmed Cases (log10): %{z:.2f}<extra></extra>')
+        ],
+        frames=map_frames.frames(page))
+    fig.update_layout(
+        template="plotly_dark",
+        margin={
+            "r": 0,
+            "t": 0,
+            "l": 0,
+            "b": 0
+        },
+        geo=dict(showframe=False,
+                 showcoastlines=False,
+                 projection_type='equirectangular',
+                 **BASE_LAYERS_OFF),
+        updatemenus=[
+            dict(type='buttons',
+                 showactive=False,
+                 x=0,
+                 y=0,
+                 xanchor='right',
+                 yanchor='top',
+                 buttons=[
+                     dict(label='Play',
+                          method='animate',
+                          args=[None, {
+                              'frame': {
+                                  'duration': 300,
+                                  'redraw': True
+                              },
+                              'fromcurrent': True
+                          }]),
+                     dict(label='Pause',
+                          method='animate',
+                          args=[[None], {
+                              'frame': {
+                                  'duration': 0,
+                                  'redraw': False
+                              },
+                              'mode': 'immediate'
+                          }]),
+                 ])
+        ],
+        sliders=[
+            dict(active=len(labels) - 1,
+                 currentvalue={'prefix': 'Date: '},
+                 steps=[
+                     dict(label=label,
+                          method='animate',
+                          args=[[label], {
+                              'mode': 'immediate',
+                              'frame': {
+                                  'duration': 0,
+                                  'redraw': True
+                              }
+                          }]) for label in labels
+                 ])
+        ])
+    return fig
 
 ################
 # TOTALS CARDS #
 ################
 
-total_confirmed = grouped.Confirmed.sum()
-total_deaths = grouped.Deaths.sum()
+def totalsCards(grouped):
 
-card_content1 = [
-    dbc.CardHeader("CONFIRMED CASES"),
-    dbc.CardBody([
-        html.H5(f'{total_confirmed:,}', className="aggregates"),
-        html.P(
-            "                     ",
-            className="card-text",
-        ),
-    ]),
-]
+    total_confirmed = grouped.Confirmed.sum()
+    total_deaths = grouped.Deaths.sum()
+
+    card_content1 = [
+        dbc.CardHeader("CONFIRMED CASES"),
+        dbc.CardBody([
+            html.H5(f'{total_confirmed:,}', className="aggregates"),
+            html.P(
+                "                     ",
+                className="card-text",
+            ),
+        ]),
+    ]
+
+    card_content2 = [
+        dbc.CardHeader("DEATHS"),
+        dbc.CardBody([
+            html.H5(f'{total_deaths:,}', className="aggregates"),
+        ]),
+    ]
 
-card_content2 = [
-    dbc.CardHeader("DEATHS"),
-    dbc.CardBody([
-        html.H5(f'{total_deaths:,}', className="aggregates"),
-    ]),
-]
+    return card_content1, card_content2
 
 ##############
 # LINE CHART #
 ##############
 
-def lineChart(country, metrics, yaxis_type, yaxisTitle=""):
+def lineChart(series, metrics, yaxis_type, yaxisTitle=""):
 
-    fig = px.line(world_data,
-                  x=world_data[world_data['Country'] == country]['Date'],
-                  y=world_data[world_data['Country'] == country][metrics])
+    fig = px.line(x=series['Date'], y=series[metrics])
     fig.update_xaxes(title='')
     fig.update_yaxes(title='Cummulative Cases')
     # fig.update_traces(textposition='top center')
@@ -252,8 +279,7 @@ def lineChart(country, metrics, yaxis_type, yaxisTitle=""):
     fig.update_xaxes(showspikes=False, spikethickness=1)
     fig.update_yaxes(showspikes=False, spikethickness=1, type=yaxis_type)
 
-    fig.update_traces(hovertemplate='Total Cases: ' + grouped_country[
-        grouped_country['Country'] == country][metrics].astype(str))
+    fig.update_traces(hovertemplate='Total Cases: %{y:d}')
 
     return fig
 
@@ -282,13 +308,9 @@ def lineChart(country, metrics, yaxis_type, yaxisTitle=""):
 # BAR CHART #
 #############
 
-def newCases(country, metrics, yaxis_type, yaxisTitle=""):
+def newCases(series, metrics, yaxis_type, yaxisTitle="", overlays=()):
 
-    figure = px.bar(
-        grouped_country,
-        x=grouped_country[grouped_country['Country'] == country]['Date'][1:],
-        y=grouped_country[grouped_country['Country'] == country]['new' +
-                                                                 metrics][1:])
+    figure = px.bar(x=series['Date'], y=series['new' + metrics])
 
     figure.update_layout(hovermode='closest',
                          template="plotly_dark",
@@ -304,22 +326,102 @@ def newCases(country, metrics, yaxis_type, yaxisTitle=""):
     figure.update_xaxes(title='')
     figure.update_yaxes(title='New Cases per Day', type=yaxis_type)
 
-    figure.update_traces(hovertemplate='Date: ' + grouped_country[
-        grouped_country['Country'] == country]['Date'][1:].astype(str) +
-                         '<br>' + 'New Cases: ' +
-                         grouped_country[grouped_country['Country'] == country]
-                         ['new' + metrics][1:].astype(str))
+    figure.update_traces(hovertemplate='Date: %{x|%Y-%m-%d}' + '<br>' +
+                         'New Cases: %{y:d}')
+
+    if 'avg7' in overlays:
+        # Rounded, as float32 values print with 8 needless digits in JSON
+        figure.add_scatter(x=series['Date'],
+                           y=np.round(series['avg7' + metrics].astype(np.float64), 2),
+                           name='7-day average',
+                           mode='lines',
+                           line={'color': '#FFA15A'},
+                           hovertemplate='7-day average: %{y:,.1f}<extra></extra>')
 
     return figure
 
 
 # bar_chart = newCases()
 
+################
+# GROWTH CHART #
+################
+
+GROWTH_METRICS = {
+    'weeklyGrowth': 'Week-over-week growth (%)',
+    'doublingTime': 'Doubling time (days)',
+    'rt': 'Growth proxy (Rt)',
+}
+
+
+def growthChart(series, metrics, kind):
+
+    figure = px.line(x=series['Date'],
+                     y=np.round(series[kind + metrics].astype(np.float64), 2))
+    figure.update_layout(hovermode='x',
+                         template="plotly_dark",
+                         legend_orientation="h",
+                         margin={
+                             "r": 0,
+                             "t": 50,
+                             "l": 0,
+                             "b": 50
+                         })
+    figure.update_xaxes(title='')
+    figure.update_yaxes(title=GROWTH_METRICS[kind])
+    if kind == 'rt':
+        # Above 1 the weekly number of new cases is growing
+        figure.add_shape(type='line',
+                         xref='paper',
+                         x0=0,
+                         x1=1,
+                         y0=1,
+                         y1=1,
+                         line={
+                             'dash': 'dot',
+                             'color': 'grey'
+                         })
+    figure.update_traces(hovertemplate='Date: %{x|%Y-%m-%d}' + '<br>' +
+                         GROWTH_METRICS[kind] + ': %{y:,.2f}')
+    return figure
+
+#####################
+# COMPARISON CHARTS #
+#####################
+
+def comparisonChart(curves, column, yaxis_type, yaxisTitle="", xaxisTitle="",
+                    valueFormat=",.0f"):
+    # `column` picks the cumulative (2) or daily (3) values of the curves.
+    # Plain dict traces are validated once, by the figure, so 20+ countries
+    # do not cost 20+ go.Scatter validations on top
+    hovertemplate = ('<b>%{fullData.name}</b><br>' + 'Cases: %{y:' +
+                     valueFormat + '}<extra></extra>')
+    figure = go.Figure(data=[
+        dict(type='scatter',
+             name=curve[0],
+             x=curve[1],
+             y=curve[column],
+             mode='lines',
+             hovertemplate=hovertemplate) for curve in curves
+    ])
+    figure.update_layout(hovermode='closest',
+                         template="plotly_dark",
+                         legend_orientation="h",
+                         margin={
+                             "r": 0,
+                             "t": 50,
+                             "l": 0,
+                             "b": 50
+                         })
+    figure.update_xaxes(title=xaxisTitle)
+    figure.update_yaxes(title=yaxisTitle, type=yaxis_type)
+    return figure
+
 ######################
 # Fatality Bar Chart #
 ######################
 
-def fatalityRate():
+def fatalityRate(grouped):
     # Limiting graph to countries with more than 1000 cases
     x = grouped[grouped.Confirmed > 1000]["Country"]
     y = grouped[grouped.Confirmed > 1000]["fatalityRate"]
@@ -350,50 +452,67 @@ def fatalityRate():
             "b": 0
         },
         transition={'duration': 500})
-    fig.update_traces(
-        hovertemplate='Country: ' +
-        grouped[grouped.Confirmed > 1000]["Country"].astype(str) + '<br>' +
-        'Fatality Rate: ' + round(
-            grouped[grouped.Confirmed > 1000]["fatalityRate"], 2).astype(str) +
-        '%')
+    fig.update_traces(hovertemplate='Country: %{x}' + '<br>' +
+                      'Fatality Rate: %{y:.2f}%')
 
     return fig
 
-fatalityChart = fatalityRate()
-
 
 ####################
 # CFR bubble chart #
 ####################
 
-# Scatter of fatality rate vs population over 65
-grouped['fatalityRate'] = grouped.Deaths / grouped.Confirmed * 100
-grouped.loc[grouped['Deaths'] > 3000, 'Annotation'] = grouped['Country']
-grouped.loc[grouped['Deaths'] <= 3000, 'Annotation'] = ''
+# Axis titles of the factors the CFR is correlated with
+CORRELATION_TITLES = {
+    'over_65': 'Population of age 65 and above (% of total population)',
+    'humanDevelopmentIndex': 'Human Development Index',
+    'population': 'Population (thousands)',
+}
 
 
-def fatalityRate_65():
-    # Limiting graph to countries with more than 1000 cases
-    x = grouped["over_65"]
-    y = grouped["fatalityRate"]
+def fatalityCorrelation(grouped, factor, correlation):
+    """CFR against `factor` for the countries correlations.compute() used,
+    with the least squares line and the Pearson r and its interval."""
+    rows = grouped[grouped.Confirmed > correlations.MIN_CASES]
+    rows = rows[rows[factor].notna()]
+    log_x = correlations.FACTORS[factor] is not None
+    x = rows[factor]
+    y = rows["fatalityRate"]
 
-    fig = px.scatter(grouped,
+    fig = px.scatter(rows,
                      x=x,
                      y=y,
-                     size=grouped['Deaths'],
-                     hover_name=grouped["Country"],
-                     text='Annotation')
+                     size=rows['Deaths'],
+                     hover_name=rows["Country"],
+                     text='Annotation',
+                     log_x=log_x)
     fig.update_traces(marker_color='purple',
                       marker_line_color='red',
                       marker_line_width=1.5,
                       opacity=0.8,
                       textposition='top right')
+
+    # The fit is over the same (transformed) values as r
+    fit_x = np.log10(x) if log_x else x
+    if len(rows) > 1 and np.isfinite(correlation['r']):
+        slope, intercept = np.polyfit(fit_x, y, 1)
+        ends = np.array([fit_x.min(), fit_x.max()])
+        fig.add_scatter(x=10**ends if log_x else ends,
+                        y=intercept + slope * ends,
+                        mode='lines',
+                        line={'color': 'white', 'dash': 'dash'},
+                        hoverinfo='skip',
+                        showlegend=False)
+        fig.add_annotation(
+            text=f"Pearson r = {correlation['r']:.2f} "
+            f"({correlations.CONFIDENCE:.0%} CI {correlation['low']:.2f} to "
+            f"{correlation['high']:.2f}), {correlation['n']} countries",
+            xref='paper', yref='paper', x=0.01, y=0.99,
+            xanchor='left', yanchor='top', showarrow=False)
     fig.update_layout(
         template="plotly_dark",
         yaxis={'title': 'Case Fatality Rate (%)'},
-        xaxis={
-            'title': 'Population of age 65 and above (% of total population)'
-        },
+        xaxis={'title': CORRELATION_TITLES[factor]},
         uniformtext_minsize=14,
         uniformtext_mode='hide',
         margin={
@@ -403,15 +522,187 @@ def fatalityRate_65():
             "b": 0
         })
 
-    fig.update_traces(hovertemplate='<b>' + grouped['Country'] + '</b>' +
-                      '<br>' + 'CFR (%): ' +
-                      round(grouped['fatalityRate'], 2).astype(str) + '<br>' + 'Population over 65: ' + grouped['over_65'].astype(str) + '<br>' +
-                      'Confirmed Cases: ' + grouped['Confirmed'].astype(str) +
-                      '<br>' + 'Deaths: ' + grouped['Deaths'].astype(str))
+    fig.update_traces(customdata=rows[['Confirmed', 'Deaths']].to_numpy(),
+                      hovertemplate='<b>%{hovertext}</b>' + '<br>' +
+                      'CFR (%): %{y:.2f}' + '<br>' +
+                      CORRELATION_TITLES[factor] + ': %{x}' + '<br>' +
+                      'Confirmed Cases: %{customdata[0]}' + '<br>' +
+                      'Deaths: %{customdata[1]}',
+                      selector={'mode': 'markers+text'})
     return fig
 
 
-fatalityRate_65 = fatalityRate_65()
+
+#######################
+# DATA REFRESH ENGINE #
+#######################
+
+def build_state(frames):
+    """Builds the figures served until the next refresh."""
+
+    state = dict(frames)
+    grouped = state['grouped'].copy()
+    state['grouped'] = grouped
+
+    #sorting based on confirmed cases to identify top-10 countries with highest confirmed cases
+    top_10 = list(grouped.Country[0:10])
+    state['top_10'] = top_10
+
+    # Per-country row slices for the country dropdown callbacks, with the
+    # rolling and growth metrics of every country next to the raw series
+    state['country_index'] = CountryIndex(
+        state['grouped_country'],
+        extra=analytics.compute(state['grouped_country']))
+    state['country_options'] = [{
+        'label': c,
+        'value': c
+    } for c in state['country_index'].countries()]
+
+    # Population per country for the per 100,000 comparisons
+    state['country_population'] = dict(zip(grouped['Country'],
+                                           grouped['population']))
+
+    state['world_map'] = world_map(grouped)
+    state['map_frames'] = ChoroplethFrames(
+        state['grouped_country'], dict(zip(grouped['Country'], grouped['code'])))
+    state['card_content1'], state['card_content2'] = totalsCards(grouped)
+    state['fatalityChart'] = fatalityRate(grouped)
+
+    # Scatters of fatality rate vs population over 65, development index and
+    # population, with their correlations (see correlations.py)
+    grouped['fatalityRate'] = grouped.Deaths / grouped.Confirmed * 100
+    grouped.loc[grouped['Deaths'] > 3000, 'Annotation'] = grouped['Country']
+    grouped.loc[grouped['Deaths'] <= 3000, 'Annotation'] = ''
+
+    state['correlations'] = correlations.compute(grouped)
+    for factor, name in [('over_65', 'fatalityRate_65'),
+                         ('humanDevelopmentIndex', 'fatalityRate_hdi'),
+                         ('population', 'fatalityRate_population')]:
+        state[name] = fatalityCorrelation(grouped, factor,
+                                          state['correlations'][factor])
+
+    # Columns served by the data API (see data_api.py)
+    state['api_tables'] = data_api.tables(grouped)
+
+    return state
+
+
+#########################
+# COUNTRY FIGURES CACHE #
+#########################
+
+figure_cache = FigureCache()
+
+# Prebuild the figures of the most viewed countries after each data load
+FIGURE_CACHE_WARMUP = os.environ.get('FIGURE_CACHE_WARMUP', '1') == '1'
+
+
+def countryCharts(state, country, metrics, yaxis_type, us_state=None,
+                  us_county=None, overlays=('avg7',), growth='weeklyGrowth'):
+    """Returns the line, bar and growth chart figures of `country`, or of a
+    US state or county, cached per data version."""
+
+    version = state['version']
+    hierarchy = us_counties.hierarchy if us_counties is not None else None
+    if country == 'US' and us_state and hierarchy is not None:
+        # The US data has its own version, which is part of the key
+        region = (country, us_state, us_county or None, hierarchy.version)
+        lookup = lambda: hierarchy.series(us_state, us_county or None)
+    else:
+        region = country
+        lookup = lambda: state['country_index'].series(country)
+    series = []
+
+    def extract():
+        # Extracted at most once, and only if a figure has to be built
+        if not series:
+            series.append(lookup())
+        return series[0]
+
+    line = figure_cache.get(
+        version, ('lineChart', region, metrics, yaxis_type),
+        lambda: lineChart(extract(), metrics, yaxis_type, yaxisTitle="Daily Increase"))
+    overlays = tuple(sorted(overlays or ()))
+    bar = figure_cache.get(
+        version, ('newCases', region, metrics, yaxis_type, overlays),
+        lambda: newCases(extract(), metrics, yaxis_type,
+                         yaxisTitle="Daily Increase", overlays=overlays))
+    growth_chart = figure_cache.get(
+        version, ('growthChart', region, metrics, growth),
+        lambda: growthChart(extract(), metrics, growth))
+    return line, bar, growth_chart
+
+
+def comparisonCharts(state, countries, metrics, yaxis_type, align, scale):
+    """Returns the cumulative and daily comparison figures of `countries`,
+    cached per data version."""
+
+    version = state['version']
+    key = (tuple(countries), metrics, yaxis_type, align, scale)
+    per_100k = scale == 'per100k'
+    curves = []
+
+    def extract():
+        if not curves:
+            curves.append(compare(
+                state['country_index'], countries, metrics,
+                population=state['country_population'] if per_100k else None,
+                align=ALIGN_OPTIONS.get(align)))
+        return curves[0]
+
+    xaxisTitle = '' if ALIGN_OPTIONS.get(align) is None else (
+        f'Days since the {ALIGN_OPTIONS[align]:,}th confirmed case')
+    unit = ' per 100,000 people' if per_100k else ''
+    valueFormat = ',.2f' if per_100k else ',.0f'
+    cumulative = figure_cache.get(
+        version, ('compareCumulative',) + key,
+        lambda: comparisonChart(extract(), 2, yaxis_type,
+                                'Cummulative Cases' + unit, xaxisTitle,
+                                valueFormat))
+    daily = figure_cache.get(
+        version, ('compareDaily',) + key,
+        lambda: comparisonChart(extract(), 3, yaxis_type,
+                                'New Cases per Day' + unit, xaxisTitle,
+                                valueFormat))
+    return cumulative, daily
+
+
+def mapPageMarks(map_frames, count=8):
+    # Labels a few pages with the month of their first date
+    every = max(-(-map_frames.pages // count), 1)
+    return {
+        page: pd.Timestamp(map_frames.dates[page * map_frames.page_days]).strftime('%b %Y')
+        for page in range(0, map_frames.pages, every)
+        if page * map_frames.page_days < len(map_frames.dates)
+    }
+
+
+def mapHistoryChart(state, page):
+    """Returns the animated map of the dates on `page`, cached per data
+    version."""
+    map_frames = state['map_frames']
+    page = min(max(int(page), 0), map_frames.pages - 1)
+    return figure_cache.get(state['version'], ('mapHistory', page),
+                            lambda: mapHistory(map_frames, page))
+
+
+def on_load(state):
+    figure_cache.reset(state['version'])
+    if FIGURE_CACHE_WARMUP:
+        for country in state['top_10']:
+            for metrics in ['Confirmed', 'Deaths']:
+                for yaxis_type in ['linear', 'log']:
+                    countryCharts(state, country, metrics, yaxis_type)
+
+
+# Workers start serving right away, the data is loaded in the background
+refresher = DataRefresher(transform_data,
+                          build_state,
+                          on_load=on_load,
+                          append=append_data,
+                          reference=reference_version()).start()
+
+us_counties = USCounties().start() if US_COUNTIES else None
 
 
 #########################################
@@ -421,9 +712,35 @@ fatalityRate_65 = fatalityRate_65()
 # DASHBOARD LAYOUT #
 ####################
 
+def loading_layout():
+
+    return dbc.Container([
+        dbc.Jumbotron([
+            html.H1("COVID-19 CORONAVIRUS PANDEMIC", className="display-3"),
+            html.P(
+                "The latest data is being loaded, please refresh the page in a few seconds.",
+                className="lead",
+            )
+        ])
+    ])
+
+
 def serve_layout():
 
-    last_update = update_time()
+    state = refresher.state
+    if state is None:
+        return loading_layout()
+
+    # The component tree only depends on the data, build it once per version
+    layout = state.get('layout')
+    if layout is None:
+        layout = state['layout'] = dashboard_layout(state)
+    return layout
+
+
+def dashboard_layout(state):
+
+    last_update = update_time(state)
 
     layout = dbc.Container([
         dbc.Jumbotron([
@@ -441,18 +758,37 @@ def serve_layout():
         dbc.Row([
             dbc.Col(html.Div(
                 dcc.Graph(id='choropleth',
-                        figure=world_map,
-                        config={'displayModeBar': False})),
+                        figure=state['world_map'],
+                        config={'displayModeBar': False,
+                                'topojsonURL': TOPOJSON_URL})),
                     width='16'),
             dbc.Col(children=[
                 dbc.Row(
-                    dbc.Col(dbc.Card(card_content1, color="dark", inverse=True),
+                    dbc.Col(dbc.Card(state['card_content1'], color="dark", inverse=True),
                             width="12")),
                 dbc.Row(
-                    dbc.Col(dbc.Card(card_content2, color="dark", inverse=True),
+                    dbc.Col(dbc.Card(state['card_content2'], color="dark", inverse=True),
                             width="12"))
             ]),
         ]),
+        html.H5("Confirmed COVID-19 cases over time - (Select a period, then press Play)",
+                id="history-title"),
+        dbc.Row([
+            dbc.Col(html.Div(
+                dcc.Graph(id='mapHistory',
+                          config={'displayModeBar': False,
+                                  'topojsonURL': TOPOJSON_URL})),
+                    width='12'),
+        ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Slider(id='map_page',
+                           min=0,
+                           max=state['map_frames'].pages - 1,
+                           value=state['map_frames'].pages - 1,
+                           marks=mapPageMarks(state['map_frames']),
+                           step=1))
+        ]),
         html.
         H5("Confirmed COVID-19 cases and deaths - (Select country and metric below)",
         id="chart-title"),
@@ -477,14 +813,30 @@ def serve_layout():
                             value='linear',
                             labelStyle={'display': 'inline-block'})),
             dbc.Col(
-                dcc.Dropdown(id='country',
+                dcc.Checklist(id='overlays',
                             options=[{
-                                'label': c,
-                                'value': c
-                            } for c in world_data.Country.unique()],
+                                'label': '7-day average',
+                                'value': 'avg7'
+                            }],
+                            value=['avg7'],
+                            labelStyle={'display': 'inline-block'})),
+            dbc.Col(
+                dcc.Dropdown(id='country',
+                            options=state['country_options'],
                             value='US',
                             multi=False))
         ]),
+        # State and county drill-down, shown for the US only
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(id='us_state',
+                            placeholder='All states',
+                            multi=False)),
+            dbc.Col(
+                dcc.Dropdown(id='us_county',
+                            placeholder='All counties',
+                            multi=False)),
+        ], id='us_drilldown', style={'display': 'none'}),
         dbc.Row([
             dbc.Col(html.Div(
                 dcc.Graph(id='lineChart', config={'displayModeBar': False})),
@@ -493,6 +845,69 @@ def serve_layout():
                 dcc.Graph(id='barChart', config={'displayModeBar': False})),
                     width='6'),
         ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.RadioItems(id='growth_metric',
+                            options=[{
+                                'label': label,
+                                'value': kind
+                            } for kind, label in GROWTH_METRICS.items()],
+                            value='weeklyGrowth',
+                            labelStyle={'display': 'inline-block'})),
+        ]),
+        dbc.Row([
+            dbc.Col(html.Div(
+                dcc.Graph(id='growthChart', config={'displayModeBar': False})),
+                    width='12'),
+        ]),
+        html.
+        H5("Compare countries - (Select countries, alignment and scale below)",
+        id="compare-title"),
+        html.
+        P("Note: Countries without population data are left out of the per 100k comparison.",
+        id="note-compare"),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(id='compare_countries',
+                            options=state['country_options'],
+                            value=state['top_10'],
+                            multi=True),
+                    width='6'),
+            dbc.Col(
+                dcc.RadioItems(id='compare_align',
+                            options=[{
+                                'label': 'Date',
+                                'value': 'date'
+                            }, {
+                                'label': 'Days since 100th case',
+                                'value': 'case100'
+                            }, {
+                                'label': 'Days since 1,000th case',
+                                'value': 'case1000'
+                            }],
+                            value='date',
+                            labelStyle={'display': 'inline-block'})),
+            dbc.Col(
+                dcc.RadioItems(id='compare_scale',
+                            options=[{
+                                'label': 'Total',
+                                'value': 'total'
+                            }, {
+                                'label': 'Per 100k',
+                                'value': 'per100k'
+                            }],
+                            value='total',
+                            labelStyle={'display': 'inline-block'})),
+        ]),
+        dbc.Row([
+            dbc.Col(html.Div(
+                dcc.Graph(id='compareCumulative',
+                          config={'displayModeBar': False})),
+                    width='6'),
+            dbc.Col(html.Div(
+                dcc.Graph(id='compareDaily', config={'displayModeBar': False})),
+                    width='6'),
+        ]),
         html.Div([
             html.
             H5("Current confirmed Case Fatality Rates (CFR) for countries with more than 1000 confirmed cases)",
@@ -503,20 +918,35 @@ def serve_layout():
             dbc.Row([
                 dbc.Col(
                     dcc.Graph(id='fatalityChart',
-                            figure=fatalityChart,
+                            figure=state['fatalityChart'],
                             config={'displayModeBar': False}))
             ]),
             html.
             H5("Case fatality rate (CFR) of COVID-19 vs proportion of population over 65 years old)",
             id="fatality65-chart"),
             html.
-            P("Note: The size of the bubble corresponds to the total confirmed deaths up to that date.",
+            P("Note: The size of the bubble corresponds to the total confirmed deaths up to that date. Only countries with more than 1000 confirmed cases are included; the interval of the Pearson correlation is a 95% bootstrap confidence interval.",
             id="note3"),
             dbc.Row([
                 dbc.Col(
                     dcc.Graph(id='fatalityRate_65',
-                            figure=fatalityRate_65,
+                            figure=state['fatalityRate_65'],
                             config={'displayModeBar': False}))
+            ]),
+            html.
+            H5("Case fatality rate (CFR) of COVID-19 vs human development index and population",
+            id="fatality-development-chart"),
+            dbc.Row([
+                dbc.Col(
+                    dcc.Graph(id='fatalityRate_hdi',
+                            figure=state['fatalityRate_hdi'],
+                            config={'displayModeBar': False}),
+                    width='6'),
+                dbc.Col(
+                    dcc.Graph(id='fatalityRate_population',
+                            figure=state['fatalityRate_population'],
+                            config={'displayModeBar': False}),
+                    width='6'),
             ])
         ])
     ])
@@ -530,25 +960,137 @@ app.layout = serve_layout
 #######################
 
 
-@app.callback(Output('barChart', 'figure'), [
+# Both charts share their inputs, so one callback extracts the country's
+# series once and answers with both figures in a single round-trip
+@app.callback([
+    Output('lineChart', 'figure'),
+    Output('barChart', 'figure'),
+    Output('growthChart', 'figure'),
+], [
     Input('country', 'value'),
     Input('metrics', 'value'),
     Input('yaxis_type', 'value'),
+    Input('us_state', 'value'),
+    Input('us_county', 'value'),
+    Input('overlays', 'value'),
+    Input('growth_metric', 'value'),
 ])
-def update_plot(country, metrics, yaxis_type):
-    return newCases(country, metrics, yaxis_type, yaxisTitle="Daily Increase")
+def update_plots(country, metrics, yaxis_type, us_state, us_county, overlays,
+                 growth_metric):
+    return countryCharts(refresher.state, country, metrics, yaxis_type,
+                         us_state, us_county, overlays, growth_metric)
 
 
-@app.callback(Output('lineChart', 'figure'), [
-    Input('country', 'value'),
+@app.callback(Output('mapHistory', 'figure'), [Input('map_page', 'value')])
+def update_map_history(page):
+    state = refresher.state
+    return mapHistoryChart(state, state['map_frames'].pages - 1
+                           if page is None else page)
+
+
+# All selected countries are gathered at once, see comparison.compare()
+@app.callback([
+    Output('compareCumulative', 'figure'),
+    Output('compareDaily', 'figure'),
+], [
+    Input('compare_countries', 'value'),
     Input('metrics', 'value'),
     Input('yaxis_type', 'value'),
+    Input('compare_align', 'value'),
+    Input('compare_scale', 'value'),
 ])
-def update_plot_total(country, metrics, yaxis_type):
-    return lineChart(country, metrics, yaxis_type, yaxisTitle="Daily Increase")
-
-
-server = app.server
+def update_comparison(countries, metrics, yaxis_type, align, scale):
+    return comparisonCharts(refresher.state, countries or [], metrics,
+                            yaxis_type, align, scale)
+
+
+@app.callback([
+    Output('us_drilldown', 'style'),
+    Output('us_state', 'options'),
+    Output('us_state', 'value'),
+], [Input('country', 'value')])
+def update_us_states(country):
+    hierarchy = us_counties.hierarchy if us_counties is not None else None
+    if country != 'US' or hierarchy is None:
+        return {'display': 'none'}, [], None
+    options = [{'label': s, 'value': s} for s in hierarchy.state_names]
+    return {}, options, None
+
+
+@app.callback([
+    Output('us_county', 'options'),
+    Output('us_county', 'value'),
+], [Input('us_state', 'value')])
+def update_us_counties(us_state):
+    hierarchy = us_counties.hierarchy if us_counties is not None else None
+    if not us_state or hierarchy is None:
+        return [], None
+    options = [{'label': c, 'value': c} for c in hierarchy.counties_of(us_state)]
+    return options, None
+
+
+server = instrument(app.server)
+
+# The layout (with the choropleth and the fatality charts) only changes
+# with the data, so it is serialized and compressed once per data version
+layout_cache = ResponseCache()
+
+
+@server.before_request
+def cached_layout():
+    if request.path != app.config.requests_pathname_prefix + '_dash-layout':
+        return None
+    state = refresher.state
+    if state is None:
+        # Let Dash serve the loading page
+        return None
+    layout = layout_cache.get(
+        'layout', state['version'],
+        lambda: json.dumps(serve_layout(), cls=plotly.utils.PlotlyJSONEncoder))
+    return layout.respond(request)
+
+
+# Read-only JSON/CSV endpoints under /api/v1, so that partners do not have
+# to scrape the charts, and the bulk export of the frames
+data_api.register(server, lambda: refresher.state, refresher.snapshot_dir)
+
+# The country shapes at each detail, serialized and compressed once
+geometry_cache = ResponseCache()
+
+
+@server.route('/geometry/countries.<any(geojson, topojson):kind>')
+def country_geometry(kind):
+    version, variants = geometry.geometry()
+    detail = geometry.detail_for(request.headers, request.args)
+    response = geometry_cache.get(
+        f'{detail}.{kind}', version,
+        lambda: json.dumps(variants[detail][kind], separators=(',', ':')),
+        mimetype='application/geo+json' if kind == 'geojson' else 'application/json'
+    ).respond(request)
+    # The detail depends on these as well
+    response.headers['Vary'] += ', Save-Data, User-Agent'
+    return response
+
+
+@server.route('/geometry/world_110m.json')
+def base_map():
+    # Where plotly.js looks for the shapes of the world maps (TOPOJSON_URL)
+    return country_geometry('topojson')
+
+
+@server.route('/stats/figure-cache')
+def figure_cache_stats():
+    return jsonify(figure_cache.stats())
+
+
+@server.route('/stats/memory')
+def memory_stats():
+    state = refresher.state
+    frames = {} if state is None else {
+        name: state[name]
+        for name in ['world_data', 'grouped', 'grouped_country']
+    }
+    return jsonify(memory_report(frames))
 
 if __name__ == '__main__':
     app.run_server(debug=False)
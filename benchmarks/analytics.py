@@ -0,0 +1,76 @@
+"""Rolling and growth metrics: one vectorized pass vs pandas rolling.
+
+Checks every column of analytics.compute() against a per-country pandas
+rolling() reference, then times computing all countries at once (done once
+per data load) against computing one country with pandas in a callback, and
+against reading the precomputed columns through the CountryIndex. Run from
+the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/analytics.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+from country_index import CountryIndex
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+from datasets import transform_data
+
+NUMBER = 20
+
+
+def rolling_reference(rows, metric):
+    """The four metrics of one country with pandas rolling/shift."""
+    daily = rows['new' + metric].astype(float)
+    cumulative = rows[metric].astype(float)
+    current = daily.rolling(analytics.WINDOW).sum()
+    previous = current.shift(analytics.WINDOW)
+    before = cumulative.shift(analytics.WINDOW)
+    ratio = (current / previous).where(previous > 0)
+    growth = np.log(cumulative / before).where(before > 0) / analytics.WINDOW
+    return {
+        'avg7': current / analytics.WINDOW,
+        'weeklyGrowth': (ratio - 1) * 100,
+        'doublingTime': (np.log(2) / growth).where(growth > 0),
+        'rt': ratio**(analytics.SERIAL_INTERVAL / analytics.WINDOW),
+    }
+
+
+def main():
+    frames = transform_data(parse_world_data(read_source(DATA_SOURCE)))
+    grouped_country = frames['grouped_country']
+
+    columns = analytics.compute(grouped_country)
+    by_country = grouped_country.groupby('Country', observed=True)
+    for country, rows in by_country:
+        positions = rows.index.to_numpy()
+        for metric in analytics.METRICS:
+            for kind, expected in rolling_reference(rows, metric).items():
+                assert np.allclose(columns[kind + metric][positions],
+                                   expected.to_numpy(), rtol=1e-5,
+                                   equal_nan=True), (country, kind, metric)
+    print(f'{by_country.ngroups} countries match pandas rolling()')
+
+    index = CountryIndex(grouped_country, extra=columns)
+    country = index.countries()[0]
+    rows = grouped_country[grouped_country['Country'] == country]
+
+    every = timeit.timeit(lambda: analytics.compute(grouped_country),
+                          number=NUMBER) / NUMBER
+    one = timeit.timeit(
+        lambda: [rolling_reference(rows, metric) for metric in analytics.METRICS],
+        number=NUMBER) / NUMBER
+    lookup = timeit.timeit(lambda: index.series(country), number=NUMBER) / NUMBER
+    print(f'all countries, once per load     {every * 1000:>8.2f} ms')
+    print(f'one country, pandas per request  {one * 1000:>8.2f} ms')
+    print(f'one country, precomputed lookup  {lookup * 1000:>8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
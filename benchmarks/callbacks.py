@@ -0,0 +1,66 @@
+"""Latency of extracting one country's series for the chart callbacks.
+
+Compares the boolean-mask scans lineChart()/newCases() used to run with a
+CountryIndex lookup, over synthetic histories of growing size:
+
+    python benchmarks/callbacks.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from country_index import CountryIndex
+
+SIZES = [(50, 100), (200, 100), (200, 400), (1000, 400)]
+NUMBER = 50
+
+
+def synthetic_grouped_country(n_countries, n_days):
+    countries = np.repeat([f'Country {i:04d}' for i in range(n_countries)],
+                          n_days)
+    dates = np.tile(pd.date_range('2020-01-22', periods=n_days), n_countries)
+    confirmed = np.random.randint(0, 1000, size=n_countries * n_days).cumsum()
+    deaths = confirmed // 20
+    frame = pd.DataFrame({
+        'Country': countries,
+        'Date': dates,
+        'Confirmed': confirmed,
+        'Deaths': deaths,
+    })
+    frame['newConfirmed'] = frame['Confirmed'].diff().fillna(0)
+    frame['newDeaths'] = frame['Deaths'].diff().fillna(0)
+    return frame
+
+
+def masked(frame, country):
+    # The six full scans the two callbacks made per interaction
+    for column in ['Date', 'Confirmed', 'Confirmed', 'Date', 'newConfirmed',
+                   'newConfirmed']:
+        frame[frame['Country'] == country][column]
+
+
+def indexed(index, country):
+    index.series(country)
+    index.series(country)
+
+
+def main():
+    print(f'{"countries":>10} {"days":>6} {"mask (ms)":>10} {"index (ms)":>11}')
+    for n_countries, n_days in SIZES:
+        frame = synthetic_grouped_country(n_countries, n_days)
+        index = CountryIndex(frame)
+        country = f'Country {n_countries // 2:04d}'
+        mask = timeit.timeit(lambda: masked(frame, country), number=NUMBER)
+        lookup = timeit.timeit(lambda: indexed(index, country), number=NUMBER)
+        print(f'{n_countries:>10} {n_days:>6} {mask / NUMBER * 1000:>10.3f} '
+              f'{lookup / NUMBER * 1000:>11.4f}')
+
+
+if __name__ == '__main__':
+    main()
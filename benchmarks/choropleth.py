@@ -0,0 +1,98 @@
+"""Payload of the animated choropleth: px animation_frame vs paged frames.
+
+Builds the map over the whole history with px.choropleth(animation_frame=...)
+and with the precomputed frames (map_frames), one page at a time, and
+compares JSON sizes (raw and gzipped, as sent with compression) and build
+times. The frame values are checked against the log10 of grouped_country
+first. Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/choropleth.py
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import plotly
+import plotly.express as px
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+from datasets import transform_data
+from map_frames import ChoroplethFrames
+
+
+def animation_frame_map(grouped_country, codes):
+    """The whole history through px, as the commented-out animation_frame
+    in world_map() would have it."""
+    data = grouped_country[grouped_country['Country'].astype(str).isin(codes)].copy()
+    data['code'] = data['Country'].astype(str).map(codes)
+    data['logConfirmed'] = np.log10(data['Confirmed'].where(data['Confirmed'] > 0))
+    return px.choropleth(data,
+                         locations='code',
+                         hover_name='Country',
+                         color='logConfirmed',
+                         color_continuous_scale='Reds',
+                         animation_frame=data['Date'].dt.strftime('%Y-%m-%d'),
+                         template='plotly_dark')
+
+
+def sizes(figure):
+    body = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder).encode()
+    return len(body), len(gzip.compress(body))
+
+
+def check(map_frames, grouped_country):
+    for column, name in enumerate(map_frames.names):
+        rows = grouped_country[grouped_country['Country'].astype(str) == name]
+        expected = np.full(len(map_frames.dates), np.nan)
+        positions = np.searchsorted(map_frames.dates, rows['Date'].to_numpy())
+        confirmed = rows['Confirmed'].to_numpy().astype(np.float64)
+        expected[positions] = np.where(confirmed > 0,
+                                       np.log10(np.maximum(confirmed, 1)), np.nan)
+        assert np.allclose(map_frames.z[:, column], expected, atol=1e-6,
+                           equal_nan=True), name
+
+
+def main():
+    # Importing app below starts its refreshers; the US files are not needed
+    os.environ['US_COUNTIES'] = '0'
+    frames = transform_data(parse_world_data(read_source(DATA_SOURCE)))
+    grouped_country, grouped = frames['grouped_country'], frames['grouped']
+    codes = {country: code for country, code in zip(grouped['Country'], grouped['code'])
+             if isinstance(code, str)}
+
+    start = time.perf_counter()
+    map_frames = ChoroplethFrames(grouped_country, codes)
+    matrix_time = time.perf_counter() - start
+    check(map_frames, grouped_country)
+    print(f'{len(map_frames.names)} countries x {len(map_frames.dates)} dates '
+          f'match log10(Confirmed), matrix built in {matrix_time * 1000:.0f} ms')
+
+    from app import mapHistory
+
+    start = time.perf_counter()
+    naive = animation_frame_map(grouped_country, codes)
+    naive_time = time.perf_counter() - start
+    raw, compressed = sizes(naive)
+    print(f'{"px animation_frame":<24} {raw / 1000:>8.0f} kB {compressed / 1000:>7.0f} kB gz '
+          f'{naive_time:>6.2f} s')
+
+    page_sizes = []
+    start = time.perf_counter()
+    for page in range(map_frames.pages):
+        page_sizes.append(sizes(mapHistory(map_frames, page)))
+    paged_time = (time.perf_counter() - start) / map_frames.pages
+    raw, compressed = page_sizes[-1]
+    print(f'{"one page":<24} {raw / 1000:>8.0f} kB {compressed / 1000:>7.0f} kB gz '
+          f'{paged_time:>6.2f} s')
+    raw, compressed = np.sum(page_sizes, axis=0)
+    print(f'{f"all {map_frames.pages} pages":<24} {raw / 1000:>8.0f} kB {compressed / 1000:>7.0f} kB gz')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Batched gather of the comparison curves vs one filter per country.
+
+Checks the per 100k scaling on a hand-computed case, and the curves of
+random selections (aligned on the 100th case or not, per 100k or not)
+against per-country boolean filters of grouped_country, then times both as the number of selected countries grows. Run from the
+repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/comparison.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comparison import compare
+from country_index import CountryIndex
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+from datasets import transform_data
+
+CHECKS = 50
+SELECTED = [1, 5, 10, 20, 40]
+NUMBER = 100
+
+
+def filtered(grouped_country, country, population, align):
+    """One country's curve with a boolean filter, as a reference."""
+    rows = grouped_country[grouped_country['Country'] == country]
+    if align is not None:
+        rows = rows[rows['Confirmed'] >= align]
+        x = np.arange(len(rows))
+    else:
+        x = rows['Date'].to_numpy()
+    # Populations are in thousands: cases per 100k are cases per thousand
+    # people divided by 100
+    scale = 1 / (population[country] / 100) if population else 1
+    return (x, rows['Confirmed'].to_numpy() * scale,
+            rows['newConfirmed'].to_numpy() * scale)
+
+
+def check_per_100k():
+    """15,088 cases among Italy's 60,461,826 people are 24.95 per 100k."""
+    grouped_country = pd.DataFrame({
+        'Country': ['Italy'] * 2,
+        'Date': pd.to_datetime(['2020-03-13', '2020-03-14']),
+        'Confirmed': [12462, 15088], 'Deaths': [827, 1016],
+        'newConfirmed': [2651, 2626], 'newDeaths': [196, 189],
+    })
+    [(_, _, cumulative, daily)] = compare(CountryIndex(grouped_country),
+                                          ['Italy'], 'Confirmed',
+                                          {'Italy': 60461.826})
+    assert np.allclose(cumulative, [20.61, 24.95], atol=0.01), cumulative
+    assert np.allclose(daily, [4.38, 4.34], atol=0.01), daily
+
+
+def check(index, grouped_country, population, rng):
+    countries = index.countries()
+    for _ in range(CHECKS):
+        selected = list(rng.choice(countries, size=rng.integers(1, 25),
+                                   replace=False))
+        for align in [None, 100]:
+            for people in [None, population]:
+                for country, x, cumulative, daily in compare(
+                        index, selected, 'Confirmed', people, align):
+                    expected = filtered(grouped_country, country, people, align)
+                    assert np.array_equal(x, expected[0]), country
+                    assert np.allclose(cumulative, expected[1]), country
+                    assert np.allclose(daily, expected[2]), country
+
+
+def main():
+    frames = transform_data(parse_world_data(read_source(DATA_SOURCE)))
+    grouped_country = frames['grouped_country']
+    grouped = frames['grouped']
+    population = dict(zip(grouped['Country'], grouped['population']))
+    index = CountryIndex(grouped_country)
+
+    check_per_100k()
+    check(index, grouped_country, population, np.random.default_rng(0))
+    print(f'{CHECKS} random selections match the per-country filters')
+
+    countries = index.countries()
+    print(f'{"countries":>9} {"gather (ms)":>12} {"filters (ms)":>13}')
+    for n in SELECTED:
+        selected = countries[:n]
+        gather = timeit.timeit(
+            lambda: compare(index, selected, 'Confirmed', population, 100),
+            number=NUMBER) / NUMBER
+        filters = timeit.timeit(
+            lambda: [filtered(grouped_country, c, population, 100)
+                     for c in selected],
+            number=NUMBER) / NUMBER
+        print(f'{n:>9} {gather * 1000:>12.2f} {filters * 1000:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bootstrap of the CFR correlations: one resample at a time vs vectorized.
+
+Checks correlations.pearson() against np.corrcoef and the vectorized
+bootstrap against a loop computing np.corrcoef of the same resamples, then
+times both, and times correlations.compute() in process and through a
+spawned pool of one process, cold and cached. Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/correlations.py
+"""
+
+import os
+import sys
+import time
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import correlations
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+from datasets import transform_data
+
+NUMBER = 5
+
+
+def loop_bootstrap(x, y, resamples, confidence, seed):
+    """The notebook way: one np.corrcoef per resample."""
+    picks = np.random.default_rng(seed).integers(0, len(x), (resamples, len(x)))
+    r = np.array([np.corrcoef(x[p], y[p])[0, 1] for p in picks])
+    r = r[np.isfinite(r)]
+    tail = (1 - confidence) / 2 * 100
+    return tuple(np.percentile(r, [tail, 100 - tail]))
+
+
+def main():
+    frames = transform_data(parse_world_data(read_source(DATA_SOURCE)))
+    cfr, factors = correlations.inputs(frames['grouped'])
+
+    resamples, confidence = correlations.RESAMPLES, correlations.CONFIDENCE
+    for name, values in factors.items():
+        known = np.isfinite(cfr) & np.isfinite(values)
+        x, y = values[known], cfr[known]
+        assert np.isclose(correlations.pearson(x, y), np.corrcoef(x, y)[0, 1])
+        assert np.allclose(correlations.bootstrap(x, y, resamples, confidence),
+                           loop_bootstrap(x, y, resamples, confidence, 0))
+        loop = timeit.timeit(
+            lambda: loop_bootstrap(x, y, resamples, confidence, 0),
+            number=NUMBER) / NUMBER
+        vectorized = timeit.timeit(
+            lambda: correlations.bootstrap(x, y, resamples, confidence),
+            number=NUMBER) / NUMBER
+        print(f'{name:<24} n={len(x):<4} loop {loop * 1000:>8.1f} ms   '
+              f'vectorized {vectorized * 1000:>6.1f} ms')
+
+    for workers in [0, 1]:
+        correlations._results.clear()
+        start = time.perf_counter()
+        results = correlations.compute(frames['grouped'], workers=workers)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        correlations.compute(frames['grouped'], workers=workers)
+        cached = time.perf_counter() - start
+        print(f'compute(), {workers} workers {cold * 1000:6.0f} ms, '
+              f'same data version {cached * 1000:.2f} ms')
+    for name, result in results.items():
+        print(f"{name:<24} r={result['r']:+.3f} "
+              f"[{result['low']:+.3f}, {result['high']:+.3f}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Country name -> ISO3 codes: pycountry loop vs the country_codes resolver.
+
+Resolves the countries of the data source the old way (importing pycountry,
+indexing every country by name, then the hand-made fixes), and with
+country_codes, both cold (no seed, no persisted table, so pycountry and the
+fuzzy match do the work) and warm (seeded from country_metadata.csv and the
+persisted table, without importing pycountry). The codes of both ways are
+checked to agree. Each timing runs in a fresh interpreter, so that the
+import of pycountry is counted. Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/country_codes.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PRELUDE = f'''
+import sys, time
+sys.path.insert(0, {ROOT!r})
+import pandas as pd
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+names = sorted(parse_world_data(read_source(DATA_SOURCE))['Country'].unique())
+start = time.perf_counter()
+'''
+
+# As version_1/app2.py did before the resolver, with its fixes by name
+PYCOUNTRY_LOOP = PRELUDE + '''
+import pycountry
+from country_codes import ALIASES
+countries = {}
+for country in pycountry.countries:
+    countries[country.name] = country.alpha_3
+codes = [ALIASES.get(name, countries.get(name)) for name in names]
+'''
+
+RESOLVER = PRELUDE + '''
+import country_codes
+resolver = {make}
+codes = resolver.resolve_all(names)
+'''
+
+REPORT = '''
+elapsed = time.perf_counter() - start
+print(repr((elapsed, 'pycountry' in sys.modules, codes)))
+'''
+
+
+def run(script, **env):
+    output = subprocess.run([sys.executable, '-c', script + REPORT],
+                            env=dict(os.environ, **env), check=True,
+                            stdout=subprocess.PIPE).stdout
+    return eval(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        table = os.path.join(tmp, 'codes.json')
+        runs = [
+            ('pycountry loop', PYCOUNTRY_LOOP),
+            ('resolver, cold',
+             RESOLVER.format(make=f'country_codes.CountryCodes({table!r})')),
+            ('resolver, persisted',
+             RESOLVER.format(make=f'country_codes.CountryCodes({table!r})')),
+            ('resolver, seeded', RESOLVER.format(
+                make='country_codes.CountryCodes(None, '
+                'country_codes._metadata_codes())')),
+        ]
+        results = {name: run(script, SNAPSHOT_DIR=tmp) for name, script in runs}
+
+    expected = results['pycountry loop'][2]
+    for name, (elapsed, imported, codes) in results.items():
+        differ = [(a, b) for a, b in zip(expected, codes) if a != b]
+        print(f'{name:<20} {elapsed * 1000:>8.1f} ms  '
+              f'pycountry imported: {imported!s:<5}  '
+              f'codes differing from the loop: {len(differ)} {differ[:5]}')
+
+
+if __name__ == '__main__':
+    main()
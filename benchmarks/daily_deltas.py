@@ -0,0 +1,48 @@
+"""Segmented daily deltas vs a per-country groupby().diff() reference.
+
+tests/test_daily_deltas.py checks that both give the same deltas; this
+times them. Run from the repository root:
+
+    python benchmarks/daily_deltas.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daily_deltas import segment_starts, segmented_diff
+
+NUMBER = 20
+
+
+def random_history(rng, n_countries, n_days):
+    frame = pd.DataFrame({
+        'Country': np.repeat(np.arange(n_countries), n_days),
+        'Confirmed': rng.integers(0, 100, size=n_countries * n_days),
+    })
+    frame['Confirmed'] = frame.groupby('Country')['Confirmed'].cumsum()
+    return frame
+
+
+def reference(frame):
+    return frame.groupby('Country')['Confirmed'].diff().fillna(0).to_numpy()
+
+
+def main():
+    frame = random_history(np.random.default_rng(1), 200, 400)
+    values = frame['Confirmed'].to_numpy()
+    countries = frame['Country'].to_numpy()
+    numpy_time = timeit.timeit(
+        lambda: segmented_diff(values, segment_starts(countries)), number=NUMBER)
+    pandas_time = timeit.timeit(lambda: reference(frame), number=NUMBER)
+    print(f'200 countries x 400 days: groupby {pandas_time / NUMBER * 1000:.2f} ms, '
+          f'segmented {numpy_time / NUMBER * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
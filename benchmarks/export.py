@@ -0,0 +1,124 @@
+"""Bulk export: re-processing the upstream CSV vs streaming the snapshot.
+
+The notebooks rebuilt grouped_country from countries-aggregated.csv; this
+times that against streaming the snapshot of it as Arrow IPC, Parquet and
+CSV and reading the download back into pandas, checking that every format
+reads back to the frame. Longer histories are then made up, and the time,
+size and peak memory of each export are measured (CSV only up to CSV_ROWS):
+the peak (numpy and pyarrow allocations) stays at a few batches whatever the
+number of rows. Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/export.py
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export
+import snapshot_cache
+from data_refresh import DATA_SOURCE, parse_world_data, read_source, source_version
+from datasets import transform_data
+
+ROWS = [100_000, 1_000_000, 10_000_000]
+
+# CSV is written row by row in Python; longer histories take minutes
+CSV_ROWS = 1_000_000
+
+
+def read_back(body, kind):
+    if kind == 'arrow':
+        return pa.ipc.open_stream(body).read_pandas()
+    if kind == 'parquet':
+        return pq.read_table(io.BytesIO(body)).to_pandas()
+    return pd.read_csv(io.BytesIO(body), parse_dates=['Date'])
+
+
+def download(columns, kind):
+    """(seconds, bytes, peak bytes allocated) of streaming `columns`; the
+    allocations are traced on a second run, tracing slowing it down."""
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in export.stream(columns, kind))
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    base = pa.total_allocated_bytes()
+    peak = 0
+    for _ in export.stream(columns, kind):
+        peak = max(peak, pa.total_allocated_bytes() - base)
+    peak += tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, size, peak
+
+
+def made_up(rows, countries=200):
+    """A grouped_country of `rows` rows, `countries` countries long."""
+    days = rows // countries
+    codes = np.repeat(np.arange(countries, dtype=np.int16), days)
+    dates = np.tile(np.datetime64('2020-01-22', 'ns')
+                    + np.arange(days).astype('timedelta64[D]'), countries)
+    rng = np.random.default_rng(0)
+    new = rng.integers(0, 1000, (countries, days)).astype(np.int32)
+    confirmed = np.cumsum(new, axis=1).ravel()
+    return pd.DataFrame({
+        'Country': pd.Categorical.from_codes(
+            codes, [f'Country {i}' for i in range(countries)]),
+        'Date': dates,
+        'Confirmed': confirmed,
+        'Deaths': confirmed // 50,
+        'newConfirmed': new.ravel(),
+        'newDeaths': new.ravel() // 50,
+    })
+
+
+def main():
+    raw = read_source(DATA_SOURCE)
+    version = source_version(raw)
+    snapshot_dir = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    frames = transform_data(parse_world_data(raw))
+    rebuild = time.perf_counter() - start
+    snapshot_cache.save(version, frames, snapshot_dir=snapshot_dir)
+    state = {'version': version}
+    columns = export.columns(state, 'grouped_country', snapshot_dir)
+
+    print(f'grouped_country, {len(frames["grouped_country"]):,} rows')
+    print(f'    parse + aggregate the CSV    {rebuild * 1000:8.1f} ms')
+    for kind in export.kinds():
+        start = time.perf_counter()
+        body = b''.join(export.stream(columns, kind))
+        frame = read_back(body, kind)
+        seconds = time.perf_counter() - start
+        pd.testing.assert_frame_equal(frame, frames['grouped_country'],
+                                      check_categorical=False,
+                                      check_dtype=False)
+        print(f'    {kind:<8} export + read back   {seconds * 1000:8.1f} ms '
+              f'{len(body) / 1e6:7.2f} MB')
+
+    for rows in ROWS:
+        version = f'made-up-{rows}'
+        snapshot_cache.save(version, {'grouped_country': made_up(rows)},
+                            snapshot_dir=snapshot_dir)
+        columns = export.columns({'version': version}, 'grouped_country',
+                                 snapshot_dir)
+        for kind in export.kinds():
+            if kind == 'csv' and rows > CSV_ROWS:
+                continue
+            seconds, size, peak = download(columns, kind)
+            print(f'{rows:>11,} rows {kind:<8} {seconds:7.2f} s '
+                  f'{size / 1e6:8.1f} MB, peak {peak / 1e6:6.1f} MB allocated')
+
+
+if __name__ == '__main__':
+    main()
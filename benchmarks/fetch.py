@@ -0,0 +1,189 @@
+"""Sequential urlopen() vs concurrent conditional downloads with fetch.py.
+
+Serves fixture files (countries-aggregated.csv and the two JHU US files)
+from a local stand-in for the upstream servers: HTTP/1.1 keep-alive, ETag
+and Last-Modified with 304s, Range requests, gzip, and LATENCY seconds plus
+BANDWIDTH bytes per second per response. Then checks that
+
+    - fetch_all() returns the bytes urlopen() does, in the time of the
+      largest file (less, gzipped) instead of the sum of them,
+    - a second, conditional fetch_all() only gets 304s,
+    - connections are reused and failures (503, dropped connections) retried,
+    - DataRefresher and USCounties refreshes of unchanged sources are 304s,
+      and an appended day is fetched with a Range request.
+
+Run from the repository root:
+
+    python benchmarks/fetch.py
+"""
+
+import gzip
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetch
+import jhu_timeseries
+from data_refresh import DataRefresher
+from datasets import append_data, transform_data
+from fixtures import Fixture, countries, write_fixture
+from us_counties import USCounties
+
+LATENCY = 0.05
+BANDWIDTH = 5e6
+COUNTIES, DAYS = 3340, 400
+HISTORY_DAYS = 400
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves the files of `directory`, throttled, failing the first
+    `failures[path]` requests to a path."""
+
+    protocol_version = 'HTTP/1.1'
+    directory = None
+    failures = {}
+    connections = 0
+    requests = []
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        path = os.path.join(self.directory, self.path.lstrip('/'))
+        if self.failures.get(self.path):
+            self.failures[self.path] -= 1
+            if self.failures[self.path] % 2:
+                # Drop the connection without answering
+                self.close_connection = True
+                return
+            self.send_error(503)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        modified = formatdate(os.path.getmtime(path), usegmt=True)
+        self.requests.append((self.path, self.headers.get('Range'),
+                              self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        status = 200
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            if start >= len(body):
+                self.send_error(416)
+                return
+            body, status = body[start:], 206
+        encoding = None
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body, encoding = gzip.compress(body, 1), 'gzip'
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modified)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        step = 1 << 16
+        for start in range(0, len(body), step):
+            self.wfile.write(body[start:start + step])
+            time.sleep(len(body[start:start + step]) / BANDWIDTH)
+
+
+def serve(directory):
+    StandIn.directory = directory
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    write_fixture(directory, COUNTIES, DAYS)
+    fixture = Fixture(os.path.join(directory, 'countries-aggregated.csv'),
+                      sorted(countries()))
+    for _ in range(HISTORY_DAYS):
+        fixture.add_day()
+    names = ['countries-aggregated.csv'] + list(jhu_timeseries.US_FILES.values())
+    server, base_url = serve(directory)
+    urls = [base_url + name for name in names]
+    sizes = [os.path.getsize(os.path.join(directory, name)) for name in names]
+    print(f'{len(urls)} files, {sum(sizes) / 1e6:.1f} MB, served with '
+          f'{LATENCY * 1000:.0f} ms latency at {BANDWIDTH / 1e6:.0f} MB/s')
+
+    def sequential():
+        bodies = []
+        for url in urls:
+            with urlopen(url) as response:
+                bodies.append(response.read())
+        return bodies
+
+    expected, seconds = timed(sequential)
+    print(f'    urlopen, one after the other    {seconds:6.2f} s')
+    largest = urls[sizes.index(max(sizes))]
+    _, seconds = timed(lambda: urlopen(largest).read())
+    print(f'    urlopen, largest file alone     {seconds:6.2f} s')
+    fetched, seconds = timed(lambda: fetch.fetch_all(urls))
+    assert [f.body for f in fetched] == expected
+    print(f'    fetch_all, concurrent, gzipped  {seconds:6.2f} s')
+
+    validators = {url: f.validators for url, f in zip(urls, fetched)}
+    StandIn.connections = 0
+    again, seconds = timed(lambda: fetch.fetch_all(urls * 4, validators))
+    assert all(f.status == 304 and f.body is None for f in again)
+    print(f'    fetch_all, conditional          {seconds:6.2f} s, '
+          f'{len(again)} requests on {StandIn.connections} new connections')
+
+    fetch.RETRY_DELAY = 0.01
+    StandIn.failures = {'/' + names[0]: 3}
+    assert fetch.fetch(urls[0]).body == expected[0]
+    assert not StandIn.failures['/' + names[0]]
+    print('    3 failures retried')
+
+    refresher = DataRefresher(transform_data, dict, source=urls[0],
+                              snapshot_dir=os.path.join(directory, 'snapshots'),
+                              append=append_data)
+    assert refresher.refresh()
+    StandIn.requests = []
+    assert not refresher.refresh()
+    assert len(StandIn.requests) == 1 and StandIn.requests[0][2]
+    fixture.add_day()
+    StandIn.requests = []
+    assert refresher.refresh()
+    assert StandIn.requests[0][1].startswith('bytes=')
+    print('    DataRefresher: unchanged source is a 304, a new day a Range request')
+
+    counties = USCounties(base_url=base_url)
+    _, first = timed(counties.refresh)
+    StandIn.requests = []
+    unchanged, seconds = timed(counties.refresh)
+    assert not unchanged and len(StandIn.requests) == 2
+    print(f'    USCounties: load {first:.2f} s, unchanged refresh {seconds:.2f} s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Build time and serialized JSON size of every chart in app.py.
+
+Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/figures.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plotly
+
+import app
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+from datasets import transform_data
+
+NUMBER = 20
+COUNTRY = 'US'
+
+
+def main():
+    state = app.build_state(transform_data(parse_world_data(read_source(DATA_SOURCE))))
+    grouped = state['grouped']
+    series = state['country_index'].series(COUNTRY)
+
+    charts = {
+        'world_map': lambda: app.world_map(grouped),
+        'lineChart': lambda: app.lineChart(series, 'Confirmed', 'linear'),
+        'newCases': lambda: app.newCases(series, 'Confirmed', 'linear'),
+        'fatalityRate': lambda: app.fatalityRate(grouped),
+        'fatalityRate_65': lambda: app.fatalityCorrelation(
+            grouped, 'over_65', state['correlations']['over_65']),
+    }
+
+    print(f'{"chart":<16} {"build (ms)":>10} {"json (ms)":>10} {"json (kB)":>10}')
+    for name, build in charts.items():
+        figure = build()
+        build_time = timeit.timeit(build, number=NUMBER) / NUMBER
+        encode = lambda: json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+        encode_time = timeit.timeit(encode, number=NUMBER) / NUMBER
+        print(f'{name:<16} {build_time * 1000:>10.1f} {encode_time * 1000:>10.1f} '
+              f'{len(encode()) / 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
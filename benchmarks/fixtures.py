@@ -0,0 +1,89 @@
+"""Made-up data files shared by the benchmarks and tests/.
+
+Fixture writes a countries-aggregated.csv lookalike one date at a time;
+write_fixture() writes JHU US files shaped like time_series_covid19_*_US.csv.
+"""
+
+import csv
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jhu_timeseries
+import reference_data
+
+# Region columns of the JHU US files
+ID_COLUMNS = ['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2',
+              'Province_State', 'Country_Region', 'Lat', 'Long_', 'Combined_Key']
+
+
+def countries():
+    """Countries of the reference table that have an ISO code."""
+    reference = reference_data.table()
+    return reference.names[~pd.isna(reference.columns['code'])]
+
+
+class Fixture:
+    """countries-aggregated.csv lookalike, written one date at a time."""
+
+    def __init__(self, path, countries):
+        self.path = path
+        self.countries = countries
+        self.date = pd.Timestamp('2020-01-22')
+        self.confirmed = np.zeros(len(countries), dtype=np.int64)
+        self.deaths = np.zeros(len(countries), dtype=np.int64)
+        self.rng = np.random.default_rng(0)
+        with open(path, 'w') as f:
+            f.write('Date,Country,Confirmed,Recovered,Deaths\n')
+
+    def add_day(self):
+        new = self.rng.poisson(100, size=len(self.countries))
+        self.confirmed += new
+        self.deaths += self.rng.binomial(new, 0.03)
+        day = self.date.strftime('%Y-%m-%d')
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            for row in zip(self.countries, self.confirmed, self.deaths):
+                writer.writerow([day, row[0], row[1], 0, row[2]])
+        self.date += pd.Timedelta(days=1)
+
+    def revise_first_day(self):
+        """Changes a total of the first date without changing the length of
+        the file."""
+        with open(self.path) as f:
+            lines = f.readlines()
+        day, country, confirmed, recovered, deaths = lines[1].split(',')
+        confirmed = str(int(confirmed) + (1 if confirmed[-1] != '9' else -1))
+        lines[1] = ','.join([day, country, confirmed, recovered, deaths])
+        stat = os.stat(self.path)
+        with open(self.path, 'w') as f:
+            f.writelines(lines)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def write_fixture(directory, counties, days, seed=0):
+    """Writes the JHU US files of `counties` counties over `days` dates to
+    `directory`, 60 counties per state."""
+    rng = np.random.default_rng(seed)
+    start = date(2020, 1, 22)
+    dates = [start + timedelta(days=d) for d in range(days)]
+    header = [f'{d.month}/{d.day}/{d:%y}' for d in dates]
+    confirmed = np.cumsum(rng.integers(0, 50, size=(counties, days)), axis=1)
+    files = {'Confirmed': confirmed, 'Deaths': confirmed // 30}
+    for metric, values in files.items():
+        name = jhu_timeseries.US_FILES[metric]
+        with open(os.path.join(directory, name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            extra = ['Population'] if metric == 'Deaths' else []
+            writer.writerow(ID_COLUMNS + extra + header)
+            for i in range(counties):
+                state, county = f'State {i // 60}', f'County {i % 60}'
+                ids = [84000001 + i, 'US', 'USA', 840, float(1001 + i), county,
+                       state, 'US', 40.0 + i % 10, -90.0 - i % 20,
+                       f'{county}, {state}, US']
+                writer.writerow(ids + ([1000 + i] if extra else []) + list(values[i]))
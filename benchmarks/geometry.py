@@ -0,0 +1,114 @@
+"""Country geometry: world_countries.json as is vs the simplified variants.
+
+Checks that the topology decodes back to the rings of world_countries.json
+(up to the grid) when nothing is simplified, then builds every detail of
+geometry.DETAILS and compares the size of its GeoJSON and TopoJSON to the
+original file, gzipped on both sides as they are served.
+
+It then compares the map bytes a page load downloads: before, the
+world_110m.json base map plotly.js fetches from its CDN; now, the TopoJSON
+of one detail served in its place. The base map is read from PLOTLY_BASE_MAP,
+or from the path or URL given as the first argument:
+
+    python benchmarks/geometry.py [world_110m.json]
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+from urllib.request import urlopen
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry
+
+# What plotly.js downloads for a world choropleth drawn with its own shapes
+PLOTLY_BASE_MAP = 'https://cdn.plot.ly/world_110m.json'
+
+
+def sizes(body):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, separators=(',', ':')).encode()
+    return len(body), len(gzip.compress(body, 9))
+
+
+def check(collection):
+    """Unsimplified, every ring decodes to its original points."""
+    topology = geometry.Topology(collection)
+    # A negative tolerance keeps even the points on a straight line
+    arcs, transform = topology.simplify(-1, geometry.QUANTIZATION)
+    decoded = topology.geojson(arcs, transform)['features']
+    assert len(decoded) == len(collection['features'])
+    step = np.array(transform['scale'])
+    for original, feature in zip(collection['features'], decoded):
+        for before, after in zip(geometry._polygons(original['geometry']),
+                                 geometry._polygons(feature['geometry'])):
+            for ring, ring_after in zip(before, after):
+                ring, ring_after = np.array(ring), np.array(ring_after)
+                # Same points, possibly starting elsewhere on the ring
+                nearest = np.abs(ring[:, None] - ring_after[None]).max(axis=2)
+                assert (nearest.min(axis=1) <= step.max()).all(), feature['id']
+    shared = sum(len(arc) for arc in topology.arcs)
+    total = sum(len(ring) for f in collection['features']
+                for polygon in geometry._polygons(f['geometry']) for ring in polygon)
+    print(f'{len(collection["features"])} countries decode back; '
+          f'{len(topology.arcs)} arcs hold {shared:,} of the {total:,} points')
+
+
+def base_map(source):
+    """The plotly base map at `source` (URL or path), None if unreachable."""
+    try:
+        if source.startswith(('http://', 'https://')):
+            with urlopen(source, timeout=30) as response:
+                return response.read()
+        with open(source, 'rb') as f:
+            return f.read()
+    except (OSError, ValueError) as error:
+        print(f'{source} could not be read ({error}); pass a copy of it as '
+              'the first argument to compare the page bytes')
+        return None
+
+
+def main():
+    with open(geometry.GEOMETRY_FILE, 'rb') as f:
+        raw = f.read()
+    check(json.loads(raw))
+
+    start = time.perf_counter()
+    _, variants = geometry.build()
+    print(f'all details built in {time.perf_counter() - start:.2f} s')
+
+    # plotly.js needs an id and a ct (hover label position) per country
+    for variant in variants.values():
+        for shape in variant['topojson']['objects']['countries']['geometries']:
+            assert shape['id'] and len(shape['properties']['ct']) == 2
+
+    original = sizes(raw)
+    print(f'{"world_countries.json":<20} {original[0] / 1000:>7.0f} kB '
+          f'{original[1] / 1000:>6.0f} kB gz')
+    for detail, variant in variants.items():
+        for kind in ['geojson', 'topojson']:
+            size, compressed = sizes(variant[kind])
+            print(f'{detail + " " + kind:<20} {size / 1000:>7.0f} kB '
+                  f'{compressed / 1000:>6.0f} kB gz  '
+                  f'{original[1] / compressed:>5.1f}x smaller gzipped')
+
+    body = base_map(sys.argv[1] if len(sys.argv) > 1 else PLOTLY_BASE_MAP)
+    before = sizes(body)[1] if body is not None else None
+    print('map bytes per page load, gzipped:')
+    if before is not None:
+        print(f'  {"before, plotly world_110m.json":<34} {before / 1000:>6.0f} kB')
+    for detail, variant in variants.items():
+        after = sizes(variant['topojson'])[1]
+        line = f'  {"now, " + detail + " world_110m.json":<34} {after / 1000:>6.0f} kB'
+        if before is not None:
+            line += f'  {before / after:>5.1f}x smaller'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Incremental refresh vs full reload on a fixture file that grows by one
+date per simulated day.
+
+tests/test_data_refresh.py checks that appending gives the frames of a full
+load; this times the two refresh paths. Run from the repository root:
+
+    python benchmarks/incremental.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_refresh import DataRefresher, parse_world_data, read_source
+from datasets import append_data, transform_data
+from fixtures import Fixture, countries
+
+HISTORY_DAYS = [100, 400, 800]
+SIMULATED_DAYS = 5
+
+
+def simulate(history_days):
+    workdir = tempfile.mkdtemp()
+    fixture = Fixture(os.path.join(workdir, 'countries-aggregated.csv'),
+                      sorted(countries()))
+    for _ in range(history_days):
+        fixture.add_day()
+
+    refresher = DataRefresher(transform_data,
+                              dict,
+                              source=fixture.path,
+                              snapshot_dir=os.path.join(workdir, 'snapshots'),
+                              append=append_data)
+    refresher.refresh()
+
+    for _ in range(SIMULATED_DAYS):
+        fixture.add_day()
+
+        start = time.perf_counter()
+        assert refresher.refresh()
+        incremental = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = transform_data(parse_world_data(read_source(fixture.path)))
+        full = time.perf_counter() - start
+
+        days = len(expected['grouped_country']) // len(fixture.countries)
+        print(f'{days:>5} {len(expected["world_data"]):>8} '
+              f'{incremental * 1000:>17.1f} {full * 1000:>10.1f}')
+
+
+def main():
+    print(f'{"days":>5} {"rows":>8} {"incremental (ms)":>17} {"full (ms)":>10}')
+    for history_days in HISTORY_DAYS:
+        simulate(history_days)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""World Bank indicator matrices vs the melt/groupby approach.
+
+Writes a few indicator files derived from country_data.csv (other
+indicator codes, other year ranges, values randomly removed), checks that
+the latest value of every (indicator, country) found on the matrices
+matches the one found by melting the files to long format, then times both,
+parsing included:
+
+    python benchmarks/indicators.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indicators import ID_COLUMNS, read_indicators
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'country_data.csv')
+FILES = 4
+INDICATORS_PER_FILE = 5
+NUMBER = 5
+
+
+def write_fixtures(directory, rng):
+    source = pd.read_csv(SOURCE)
+    years = [column for column in source.columns if column.isdigit()]
+    paths = []
+    for i in range(FILES):
+        frames = []
+        for j in range(INDICATORS_PER_FILE):
+            frame = source.copy()
+            frame['Indicator Code'] = f'TEST.{i}.{j}'
+            values = frame[years].to_numpy()
+            values[rng.random(values.shape) < 0.3] = np.nan
+            frame[years] = values
+            frames.append(frame)
+        frame = pd.concat(frames)
+        # Every other file stops earlier, so the years must be aligned
+        if i % 2:
+            frame = frame.drop(columns=years[-10:])
+        path = os.path.join(directory, f'indicators-{i}.csv')
+        frame.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def melt_latest(paths):
+    long = pd.concat([pd.read_csv(path) for path in paths]).melt(
+        id_vars=ID_COLUMNS, var_name='year')
+    long = long[long['year'].str.isdigit()].dropna(subset=['value'])
+    long['year'] = long['year'].astype(int)
+    return (long.sort_values('year', kind='mergesort')
+            .groupby(['Indicator Code', 'Country Code'])['value'].last())
+
+
+def matrix_latest(paths):
+    latest = {}
+    for code, indicator in read_indicators(paths).items():
+        values, _ = indicator.latest()
+        for country, value in zip(indicator.country_codes, values):
+            if not np.isnan(value):
+                latest[code, country] = value
+    return latest
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_fixtures(directory, np.random.default_rng(0))
+
+        expected = melt_latest(paths)
+        latest = matrix_latest(paths)
+        assert len(latest) == len(expected)
+        for key, value in expected.items():
+            assert latest[key] == value, key
+        print(f'{len(latest)} latest values match the melt reference')
+
+        indicators = read_indicators(paths)
+        melt_time = timeit.timeit(lambda: melt_latest(paths), number=NUMBER)
+        read_time = timeit.timeit(lambda: read_indicators(paths), number=NUMBER)
+        resolve_time = timeit.timeit(
+            lambda: [indicator.latest() for indicator in indicators.values()],
+            number=NUMBER)
+
+    print(f'{FILES} files, {len(indicators)} indicators: '
+          f'melt {melt_time / NUMBER * 1000:.1f} ms, '
+          f'matrices {read_time / NUMBER * 1000:.1f} ms '
+          f'(latest values alone {resolve_time / NUMBER * 1000:.2f} ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Streaming JHU loader vs read_csv + melt + merge on the US county files.
+
+Writes confirmed/deaths files shaped like time_series_covid19_*_US.csv
+(COUNTIES counties, DAYS dates), checks on a smaller copy that both loaders
+return the same counts, then loads the full files with each in a fresh
+process and reports the time taken and the peak RSS growth:
+
+    python benchmarks/jhu_loader.py
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jhu_timeseries
+from fixtures import ID_COLUMNS, write_fixture
+from instrumentation import worker_rss
+
+COUNTIES = 3340
+DAYS = 800
+
+
+def melt_load(directory):
+    """The loader commented out in app.py (usData)."""
+    frames = []
+    for metric, name in jhu_timeseries.US_FILES.items():
+        data = pd.read_csv(os.path.join(directory, name)) \
+                 .melt(id_vars=ID_COLUMNS + (['Population'] if metric == 'Deaths' else []),
+                       var_name='date', value_name=metric) \
+                 .fillna('<all>')
+        frames.append(data)
+    return frames[0].merge(frames[1])
+
+
+def stream_load(directory):
+    return jhu_timeseries.load(jhu_timeseries.US_FILES, jhu_timeseries.US_KEY,
+                               base_url=directory + os.sep)
+
+
+def check(directory):
+    series = stream_load(directory)
+    melted = melt_load(directory)
+    for metric, values in series.values.items():
+        pivot = melted.pivot(index='UID', columns='date', values=metric)
+        columns = [f'{d.month}/{d.day}/{d:%y}' for d in series.dates]
+        expected = pivot.loc[series.regions['UID'], columns].to_numpy()
+        assert np.array_equal(values, expected), metric
+
+
+def measure(kind, directory):
+    baseline = worker_rss()
+    start = time.perf_counter()
+    result = melt_load(directory) if kind == 'melt' else stream_load(directory)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if os.uname().sysname == 'Darwin' else peak * 1024
+    del result
+    return {'seconds': seconds, 'peak_rss': peak - baseline}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        write_fixture(directory, 200, 60)
+        check(directory)
+        print('streaming loader matches melt + merge')
+
+        write_fixture(directory, COUNTIES, DAYS)
+        print(f'{COUNTIES} counties x {DAYS} days')
+        for kind in ['melt', 'stream']:
+            output = subprocess.run([sys.executable, __file__, kind, directory],
+                                    check=True,
+                                    stdout=subprocess.PIPE).stdout
+            report = json.loads(output)
+            print(f'{kind:<8} {report["seconds"]:>6.2f} s '
+                  f'{report["peak_rss"] / 1e6:>8.0f} MB peak RSS growth')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print(json.dumps(measure(*sys.argv[1:])))
+    else:
+        main()
@@ -0,0 +1,78 @@
+"""Requests per second served by the app for the page-load and data API
+endpoints.
+
+Serves app.server on a local port with a threaded WSGI server and hammers
+it from several client threads, each reusing one HTTP connection. Every path
+is requested as on a first visit and, when it has an ETag, as a client
+polling with If-None-Match:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/load_test.py
+"""
+
+import http.client
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+import app
+
+CLIENTS = 8
+DURATION = 5
+PATHS = ['/', '/_dash-layout', '/api/v1/totals',
+         '/api/v1/series/US?start=2020-03-01&fields=Confirmed,newConfirmed',
+         '/api/v1/series/US?format=csv']
+
+
+def hammer(port, path, headers, deadline, counts):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    while time.perf_counter() < deadline:
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        assert response.status in (200, 304), response.status
+        done += 1
+    connection.close()
+    counts.append(done)
+
+
+def run(port, path, headers):
+    counts = []
+    deadline = time.perf_counter() + DURATION
+    clients = [
+        threading.Thread(target=hammer,
+                         args=(port, path, headers, deadline, counts))
+        for _ in range(CLIENTS)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return sum(counts) / DURATION
+
+
+def main():
+    app.refresher.wait()
+    server = make_server('127.0.0.1', 0, app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    client = app.server.test_client()
+    print(f'{CLIENTS} clients, {DURATION} s per run')
+    for path in PATHS:
+        scenarios = [('first visit', {'Accept-Encoding': 'gzip'})]
+        etag = client.get(path).headers.get('ETag')
+        if etag:
+            scenarios.append(('repeat visit', {'If-None-Match': etag}))
+        for name, headers in scenarios:
+            print(f'{path[:40]:<40} {name:<13} {run(port, path, headers):>8.0f} req/s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bytes per frame with the previous (object / int64) dtypes and with the
+compact ones, and the RSS growth of a fresh worker process holding each.
+
+Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/memory.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_refresh import DATA_SOURCE, parse_world_data, read_source
+import reference_data
+from datasets import transform_data
+from instrumentation import memory_report, worker_rss
+
+
+def legacy_frames(world_data):
+    """The frames as app.py used to hold them: object countries, int64
+    counts, float64 deltas and a population column on every row."""
+    reference = reference_data.table()
+    pop_dict = dict(zip(reference.names, reference.columns['population']))
+    world_data['population'] = world_data['Country'].map(pop_dict)
+    grouped_country = world_data.groupby(['Country', 'Date']).agg({
+        'Confirmed': 'max',
+        'Deaths': 'max'
+    }).reset_index()
+    grouped_country['newConfirmed'] = grouped_country['Confirmed'].diff().fillna(0)
+    grouped_country['newDeaths'] = grouped_country['Deaths'].diff().fillna(0)
+    return {'world_data': world_data, 'grouped_country': grouped_country}
+
+
+def measure(kind):
+    raw = read_source(DATA_SOURCE)
+    baseline = worker_rss()
+    world_data = parse_world_data(raw)
+    del raw
+    if kind == 'legacy':
+        frames = legacy_frames(world_data)
+    else:
+        frames = transform_data(world_data)
+        del frames['grouped']
+    report = memory_report(frames)
+    report['worker_rss'] -= baseline
+    return report
+
+
+def main():
+    reports = {}
+    for kind in ['legacy', 'compact']:
+        output = subprocess.run([sys.executable, __file__, kind],
+                                check=True,
+                                stdout=subprocess.PIPE).stdout
+        reports[kind] = json.loads(output)
+
+    print(f'{"":<16} {"before (kB)":>12} {"after (kB)":>11}')
+    for name, size in reports['compact']['frames'].items():
+        print(f'{name:<16} {reports["legacy"]["frames"][name] / 1000:>12.0f} '
+              f'{size / 1000:>11.0f}')
+    print(f'{"worker RSS":<16} {reports["legacy"]["worker_rss"] / 1000:>12.0f} '
+          f'{reports["compact"]["worker_rss"] / 1000:>11.0f}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print(json.dumps(measure(sys.argv[1])))
+    else:
+        main()
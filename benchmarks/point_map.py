@@ -0,0 +1,116 @@
+"""Point map: one folium marker per row vs clustered tiles.
+
+The old map_locations() added a folium.CircleMarker for every location on
+every date; its cost is measured on a sample of markers and scaled to the
+rows of the JHU fixture written by benchmarks/jhu_loader.py. PointClusters
+(version_1/update_map.py) is then built from the last date of random point
+sets of growing size, and the time and payload of one tile and of one
+viewport are measured at a few zooms. The clusters of every viewport are
+checked against a brute-force scan of all the clusters of its level first.
+Run from the repository root:
+
+    python benchmarks/point_map.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+import folium
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'version_1'))
+
+from update_map import PointClusters, mercator
+
+SAMPLE_MARKERS = 2000
+LOCATIONS, DAYS = 280, 800
+SIZES = [10_000, 100_000, 1_000_000]
+NUMBER = 50
+
+
+def folium_markers(n):
+    """Seconds and HTML bytes of a folium map of `n` markers."""
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    corona_map = folium.Map(location=[34.7, -40.8], zoom_start=3)
+    for lat, lon in zip(rng.uniform(-60, 70, n), rng.uniform(-180, 180, n)):
+        folium.CircleMarker((lat, lon), color='#3186cc', weight=0.1,
+                            fill_color='#C23208', fill=True, fill_opacity=0.1,
+                            tooltip='<H6>Country</H6><br>Confirmed: 1<br>'
+                            'Deaths: 1<br>').add_to(corona_map)
+    with tempfile.NamedTemporaryFile(suffix='.html') as f:
+        corona_map.save(f.name)
+        size = os.path.getsize(f.name)
+    return time.perf_counter() - start, size
+
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clumped like population: most points near a few hundred centers
+    centers = rng.uniform([-50, -170], [65, 170], (300, 2))
+    around = centers[rng.integers(0, len(centers), n)]
+    lat = np.clip(around[:, 0] + rng.normal(0, 2, n), -80, 80)
+    lon = np.clip(around[:, 1] + rng.normal(0, 2, n), -179.9, 179.9)
+    confirmed = rng.integers(0, 100_000, n)
+    names = np.array([f'Place {i}' for i in range(n)], dtype=object)
+    return names, lat, lon, {'Confirmed': confirmed,
+                             'Deaths': confirmed // 50}
+
+
+def check(clusters, zoom, bounds):
+    level, positions = clusters.viewport(zoom, *bounds)
+    found = set(positions.tolist())
+    lat, lon = clusters.levels[level]['lat'], clusters.levels[level]['lon']
+    west, south, east, north = bounds
+    inside = np.flatnonzero((lat >= south) & (lat <= north)
+                            & (lon >= west) & (lon <= east))
+    assert found.issuperset(inside.tolist()), (zoom, bounds)
+    # Only the covering tiles are returned
+    n = 1 << level
+    x0, y0 = mercator(north, west)
+    x1, y1 = mercator(south, east)
+    tiles = clusters.levels[level]['tile'][positions]
+    assert ((tiles % n >= int(x0 * n)) & (tiles % n <= int(x1 * n))
+            & (tiles // n >= int(y0 * n)) & (tiles // n <= int(y1 * n))).all()
+
+
+def main():
+    seconds, size = folium_markers(SAMPLE_MARKERS)
+    rows = LOCATIONS * DAYS
+    print(f'folium, one marker per row: {rows:,} markers, about '
+          f'{seconds / SAMPLE_MARKERS * rows:.0f} s and '
+          f'{size / SAMPLE_MARKERS * rows / 1e6:.0f} MB of HTML')
+
+    views = {
+        'world': (0.5, (-180, -85, 180, 85)),
+        'Europe': (4, (-10, 35, 30, 60)),
+        'a city': (8, (2.2, 48.8, 2.5, 48.95)),
+    }
+    for n in SIZES:
+        points = random_points(n)
+        start = time.perf_counter()
+        clusters = PointClusters(*points)
+        build = time.perf_counter() - start
+        for zoom, bounds in views.values():
+            check(clusters, zoom, bounds)
+        print(f'{n:>9,} points: clusters built in {build:.2f} s')
+        for name, (zoom, bounds) in views.items():
+            level, positions = clusters.viewport(zoom, *bounds)
+            query = timeit.timeit(lambda: clusters.viewport(zoom, *bounds),
+                                  number=NUMBER) / NUMBER
+            x, y = mercator(np.mean(bounds[1::2]), np.mean(bounds[::2]))
+            tile = (level, int(x * (1 << level)), int(y * (1 << level)))
+            body = json.dumps(clusters.geojson(*tile))
+            print(f'    {name:<8} zoom {zoom:<4} {len(positions):>6} clusters in '
+                  f'view, found in {query * 1e6:>6.0f} us; tile {tile} '
+                  f'{len(body) / 1000:>6.1f} kB')
+
+
+if __name__ == '__main__':
+    main()
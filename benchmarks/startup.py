@@ -0,0 +1,48 @@
+"""Cold vs warm worker startup: parsing the CSV vs loading the snapshot.
+
+Run from the repository root:
+
+    DATA_SOURCE=path/or/url/to/countries-aggregated.csv python benchmarks/startup.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot_cache
+from data_refresh import DATA_SOURCE, parse_world_data, read_source, source_version
+from datasets import transform_data
+
+REPEAT = 5
+
+
+def best_of(func, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    raw = read_source(DATA_SOURCE)
+    version = source_version(raw)
+    snapshot_dir = tempfile.mkdtemp()
+    snapshot_cache.save(version, transform_data(parse_world_data(raw)),
+                        snapshot_dir=snapshot_dir)
+
+    cold = best_of(lambda: transform_data(parse_world_data(raw)))
+    warm = best_of(lambda: snapshot_cache.load(version, snapshot_dir))
+
+    print(f'source: {DATA_SOURCE} ({len(raw) / 1e6:.1f} MB)')
+    print(f'cold (parse + aggregate): {cold * 1000:8.1f} ms')
+    print(f'warm (load snapshot):     {warm * 1000:8.1f} ms')
+    print(f'speed-up:                 {cold / warm:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
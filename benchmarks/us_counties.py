@@ -0,0 +1,82 @@
+"""US county pipeline: load time and drill-down query latency.
+
+Writes US files at full county scale (see jhu_loader.py), then times loading
+them into a CountyHierarchy and answering nation, state and county queries,
+against summing the state's county rows on every query. The rollups are
+checked against that per-query sum first, and their precomputed analytics
+against analytics.series_metrics():
+
+    python benchmarks/us_counties.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import write_fixture
+from jhu_loader import COUNTIES, DAYS
+
+import analytics
+import jhu_timeseries
+from us_counties import CountyHierarchy
+
+NUMBER = 200
+
+
+def rescan(series, state):
+    """A state's series the way it would be without the rollups."""
+    rows = series.rows(Province_State=state)
+    return {metric: series.total(metric, rows) for metric in series.values}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        write_fixture(directory, COUNTIES, DAYS)
+
+        start = time.perf_counter()
+        series = jhu_timeseries.load(jhu_timeseries.US_FILES,
+                                     jhu_timeseries.US_KEY,
+                                     base_url=directory + os.sep)
+        loaded = time.perf_counter()
+        hierarchy = CountyHierarchy(series)
+        built = time.perf_counter()
+
+    for state in hierarchy.state_names:
+        expected = rescan(series, state)
+        for metric, values in hierarchy.totals(state).items():
+            assert np.array_equal(values, expected[metric]), (state, metric)
+    for metric, values in hierarchy.nation.items():
+        assert np.array_equal(values, series.values[metric].sum(axis=0))
+    print(f'{len(hierarchy.state_names)} state rollups match the county sums')
+
+    for state in [None] + hierarchy.state_names:
+        rollup = hierarchy.series(state)
+        expected = analytics.series_metrics(rollup, list(hierarchy.nation))
+        for column, values in expected.items():
+            np.testing.assert_array_equal(rollup[column], values)
+    print('their analytics match series_metrics()')
+
+    print(f'{COUNTIES} counties x {DAYS} days: load {loaded - start:.2f} s, '
+          f'rollups {(built - loaded) * 1000:.0f} ms')
+
+    state = hierarchy.state_names[len(hierarchy.state_names) // 2]
+    county = hierarchy.counties_of(state)[0]
+    queries = {
+        'nation': lambda: hierarchy.series(),
+        'state': lambda: hierarchy.series(state),
+        'county': lambda: hierarchy.series(state, county),
+        'state, rescanning counties': lambda: rescan(series, state),
+    }
+    for name, query in queries.items():
+        seconds = timeit.timeit(query, number=NUMBER) / NUMBER
+        print(f'{name:<28} {seconds * 1e6:>8.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#############################
+# MULTI-COUNTRY COMPARISONS #
+#############################
+
+# The comparison charts overlay the curves of several countries. Their rows
+# are gathered from the CountryIndex in one take per column (see
+# CountryIndex.gather), and aligning on the Nth case and scaling per 100,000
+# people are done on the concatenated arrays, instead of filtering
+# grouped_country once per selected country.
+
+import numpy as np
+
+# Options of the comparison's x axis: calendar dates, or days counted from
+# the day a country reached that many confirmed cases
+ALIGN_OPTIONS = {'date': None, 'case100': 100, 'case1000': 1000}
+
+# People per unit of the population column (country_metadata.csv counts
+# them in thousands)
+POPULATION_UNIT = 1000
+
+
+def days_since(confirmed, starts, threshold):
+    """Day number of every row counted from the first day of its country with
+    at least `threshold` confirmed cases; negative before that day and for
+    countries that never reached it."""
+    n = len(confirmed)
+    if not n:
+        return np.zeros(0, dtype=np.intp)
+    positions = np.arange(n)
+    lengths = np.diff(np.append(starts, n))
+    reached = np.where(confirmed >= threshold, positions, n)
+    first = np.minimum.reduceat(reached, starts)
+    days = positions - np.repeat(first, lengths)
+    # Countries that never reached the threshold
+    days[np.repeat(first == n, lengths)] = -1
+    return days
+
+
+def compare(index, countries, metrics, population=None, align=None):
+    """Curves of `countries` for the comparison charts.
+
+    `population` maps countries to their population in thousands, as in
+    grouped['population']; when given, counts are per 100,000 people and countries without a population are left out.
+    `align` is a number of confirmed cases to count days from (None for
+    dates). Returns a list of (country, x, cumulative, daily) arrays.
+    """
+    known, starts, columns = index.gather(countries)
+    cumulative = columns[metrics].astype(np.float64)
+    daily = columns['new' + metrics].astype(np.float64)
+
+    if population is not None:
+        people = np.array([population.get(c, np.nan) for c in known],
+                          dtype=np.float64) * POPULATION_UNIT
+        lengths = np.diff(np.append(starts, len(cumulative)))
+        scale = np.repeat(100000 / people, lengths)
+        cumulative *= scale
+        daily *= scale
+
+    if align is None:
+        x = columns['Date']
+        keep = np.ones(len(x), dtype=bool)
+    else:
+        x = days_since(columns['Confirmed'], starts, align)
+        keep = x >= 0
+    if population is not None:
+        keep &= ~np.isnan(cumulative)
+
+    curves = []
+    stops = np.append(starts[1:], len(x)).astype(np.intp)
+    for country, start, stop in zip(known, starts, stops):
+        rows = slice(start, stop)
+        selected = keep[rows]
+        if selected.any():
+            curves.append((country, x[rows][selected],
+                           cumulative[rows][selected], daily[rows][selected]))
+    return curves
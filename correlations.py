@@ -0,0 +1,154 @@
+###################################
+# FATALITY RATE CORRELATION STATS #
+###################################
+
+# Pearson correlations of the case fatality rate (CFR) of every country with
+# more than MIN_CASES confirmed cases against its population over 65, its
+# human development index and its population, with bootstrap confidence
+# intervals. They used to be computed offline in the notebooks and saved as
+# PNGs in static_charts/.
+#
+# The bootstrap draws all the resamples as one (resamples x countries) index
+# matrix and computes every resample's r at once. With CORRELATION_WORKERS
+# set it runs in a process pool, so that a refresh does not hold the GIL of a
+# worker that is serving requests. The pool is started with 'spawn' (forking
+# from the refresh thread of a threaded worker can copy a held lock into the
+# child) and shut down once the results are in, so no process outlives the
+# computation; spawning re-imports the main module, which is gunicorn's in
+# production but would be app.py itself under `python app.py`, hence the
+# default of 0. Results are kept per data version: the key is a hash of the
+# inputs, so a refresh that does not change any country's totals reuses them.
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Countries with fewer confirmed cases have too noisy a CFR to be included
+MIN_CASES = 1000
+
+# Columns of grouped the CFR is correlated with, and the transform applied to
+# them first; populations span five orders of magnitude, so their log is used
+FACTORS = {
+    'over_65': None,
+    'humanDevelopmentIndex': None,
+    'population': np.log10,
+}
+
+# Resamples drawn for the bootstrap confidence intervals
+RESAMPLES = int(os.environ.get('CORRELATION_RESAMPLES', 2000))
+
+CONFIDENCE = 0.95
+
+# Processes of the pool running the bootstrap, 0 to run it in the caller
+WORKERS = int(os.environ.get('CORRELATION_WORKERS', 0))
+
+# Data versions whose results are kept
+MAX_CACHED = 4
+
+_results = OrderedDict()  # key -> results
+_lock = threading.Lock()
+
+
+def pearson(x, y):
+    """Pearson r of x and y along their last axis, so of every row of two
+    (resamples x n) matrices at once."""
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x * y).sum(axis=-1) / np.sqrt(
+            (x * x).sum(axis=-1) * (y * y).sum(axis=-1))
+
+
+def bootstrap(x, y, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0):
+    """Percentile bootstrap interval of pearson(x, y)."""
+    picks = np.random.default_rng(seed).integers(0, len(x), (resamples, len(x)))
+    r = pearson(x[picks], y[picks])
+    # A resample that drew the same point every time has no r
+    r = r[np.isfinite(r)]
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(r, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def correlate(cfr, factors, resamples=RESAMPLES, confidence=CONFIDENCE, seed=0):
+    """name -> {'r', 'low', 'high', 'n'} of `cfr` against each of `factors`,
+    using the countries where both are known."""
+    results = {}
+    for name, values in factors.items():
+        known = np.isfinite(cfr) & np.isfinite(values)
+        x, y = values[known], cfr[known]
+        if len(x) < 3:
+            results[name] = {'r': np.nan, 'low': np.nan, 'high': np.nan,
+                             'n': int(len(x))}
+            continue
+        low, high = bootstrap(x, y, resamples, confidence, seed)
+        results[name] = {'r': float(pearson(x, y)), 'low': low, 'high': high,
+                         'n': int(len(x))}
+    return results
+
+
+def inputs(grouped, min_cases=MIN_CASES):
+    """The CFR (%) of the countries of grouped with more than `min_cases`
+    confirmed cases, and the transformed FACTORS of the same countries."""
+    rows = grouped[grouped['Confirmed'] > min_cases]
+    cfr = (rows['Deaths'] / rows['Confirmed'] * 100).to_numpy(dtype=np.float64)
+    factors = {}
+    for name, transform in FACTORS.items():
+        values = rows[name].to_numpy(dtype=np.float64)
+        if transform is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = transform(values)
+        factors[name] = values
+    return cfr, factors
+
+
+def _key(cfr, factors, resamples, confidence):
+    digest = hashlib.sha256(cfr.tobytes())
+    for name, values in sorted(factors.items()):
+        digest.update(name.encode())
+        digest.update(values.tobytes())
+    digest.update(repr((resamples, confidence)).encode())
+    return digest.hexdigest()
+
+
+def compute(grouped, min_cases=MIN_CASES, resamples=RESAMPLES,
+            confidence=CONFIDENCE, workers=WORKERS):
+    """Correlations of the CFR in grouped with each of FACTORS, see
+    correlate(), computed once per data version."""
+    cfr, factors = inputs(grouped, min_cases)
+    key = _key(cfr, factors, resamples, confidence)
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    # Seeded by the data, so that a version always gets the same intervals
+    seed = int(key[:8], 16)
+    results = None
+    if workers:
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = pool.submit(correlate, cfr, factors, resamples,
+                                      confidence, seed).result()
+        except (OSError, BrokenProcessPool):
+            logger.exception('The correlation process pool failed, '
+                             'computing in process')
+    if results is None:
+        results = correlate(cfr, factors, resamples, confidence, seed)
+
+    with _lock:
+        _results[key] = results
+        while len(_results) > MAX_CACHED:
+            _results.popitem(last=False)
+    return results
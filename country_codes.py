@@ -0,0 +1,207 @@
+##############################
+# COUNTRY NAME TO ISO3 CODES #
+##############################
+
+# The data sources name countries their own way ('Korea, South', 'Taiwan*',
+# 'Congo (Kinshasa)'), so mapping them to the ISO 3166 alpha-3 codes the
+# choropleths use was done by walking every pycountry country and patching the
+# misses by row position, which silently broke whenever a country was added
+# upstream. CountryCodes resolves a name, in order, from
+#
+#   ALIASES         names pycountry does not know, or knows under another code
+#   the memo        every name resolved before, seeded from the codes of
+#                   country_metadata.csv and persisted in SNAPSHOT_DIR
+#   pycountry       exact match of a normalized name, official or common name
+#   fuzzy match     difflib's closest pycountry name, logged
+#
+# and raises UnknownCountry for names none of them resolves. pycountry takes
+# a while to import and index, so it is only imported for a name that is not
+# in the first two, which after the first run is none of them.
+
+import difflib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+import reference_data
+from snapshot_cache import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Names of the data sources pycountry does not resolve (or resolves wrongly);
+# None marks the entities with no country code, such as cruise ships
+ALIASES = {
+    'Bolivia': 'BOL',
+    'Brunei': 'BRN',
+    'Burma': 'MMR',
+    'Cabo Verde': 'CPV',
+    'Congo (Brazzaville)': 'COG',
+    'Congo (Kinshasa)': 'COD',
+    "Cote d'Ivoire": 'CIV',
+    'Diamond Princess': None,
+    'Holy See': 'VAT',
+    'Iran': 'IRN',
+    'Korea, North': 'PRK',
+    'Korea, South': 'KOR',
+    'Kosovo': 'RKS',
+    'Laos': 'LAO',
+    'Micronesia': 'FSM',
+    'Moldova': 'MDA',
+    'MS Zaandam': None,
+    'Russia': 'RUS',
+    'Summer Olympics 2020': None,
+    'Syria': 'SYR',
+    'Taiwan*': 'TWN',
+    'Tanzania': 'TZA',
+    'Turkey': 'TUR',
+    'US': 'USA',
+    'Venezuela': 'VEN',
+    'Vietnam': 'VNM',
+    'West Bank and Gaza': 'PSE',
+    'Winter Olympics 2022': None,
+}
+
+# Lowest difflib ratio accepted for a fuzzy match
+FUZZY_CUTOFF = float(os.environ.get('COUNTRY_FUZZY_CUTOFF', 0.85))
+
+TABLE_FILE = 'country-codes.json'
+
+
+class UnknownCountry(LookupError):
+    """Country names that resolve to no ISO3 code."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        super().__init__('No ISO3 code for ' + ', '.join(map(repr, self.names))
+                         + '; add them to country_codes.ALIASES')
+
+
+def normalize(name):
+    """Lowercase words of `name`, 'Korea, South' read as 'South Korea'."""
+    name = name.casefold().replace('&', ' and ')
+    if name.count(',') == 1:
+        head, tail = name.split(',')
+        name = tail + ' ' + head
+    name = re.sub(r'[^\w\s]', ' ', name)
+    words = name.split()
+    if words and words[0] == 'the':
+        words = words[1:]
+    return ' '.join(words)
+
+
+def _pycountry_names():
+    """Normalized name -> alpha-3 code of every pycountry country."""
+    import pycountry
+
+    names = {}
+    for country in pycountry.countries:
+        for attribute in ['name', 'official_name', 'common_name']:
+            name = getattr(country, attribute, None)
+            if name:
+                names.setdefault(normalize(name), country.alpha_3)
+    return names
+
+
+class CountryCodes:
+
+    def __init__(self, path=None, seed=None):
+        self.path = path
+        # name -> code (None for no code) of every name resolved so far; the
+        # seed wins over what was persisted and is not persisted itself
+        self._seed = dict(seed or {})
+        self._memo = {}
+        self._added = False
+        self._names = None
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._memo.update(json.load(f))
+            except (OSError, ValueError):
+                logger.exception('Reading %s failed', path)
+        self._memo.update(self._seed)
+
+    def _lookup(self, name):
+        if name in ALIASES:
+            return True, ALIASES[name]
+        if name in self._memo:
+            return True, self._memo[name]
+
+        if self._names is None:
+            self._names = _pycountry_names()
+        key = normalize(name)
+        if key in self._names:
+            return True, self._names[key]
+        matches = difflib.get_close_matches(key, self._names, n=1,
+                                            cutoff=FUZZY_CUTOFF)
+        if matches:
+            logger.warning('Resolved %r to %s, the code of %r', name,
+                           self._names[matches[0]], matches[0])
+            return True, self._names[matches[0]]
+        return False, None
+
+    def resolve_all(self, names):
+        """ISO3 code of each of `names` (None for the entities without one).
+
+        Raises UnknownCountry naming every name that could not be resolved.
+        """
+        codes, unknown = [], []
+        with self._lock:
+            for name in names:
+                resolved, code = self._lookup(name)
+                if not resolved:
+                    unknown.append(name)
+                elif name not in ALIASES and name not in self._memo:
+                    self._memo[name] = code
+                    self._added = True
+                codes.append(code)
+            if self._added:
+                self._save()
+        if unknown:
+            raise UnknownCountry(sorted(set(unknown)))
+        return codes
+
+    def resolve(self, name):
+        return self.resolve_all([name])[0]
+
+    def _save(self):
+        # Written to a temporary file and renamed, so that concurrent
+        # workers never read a partial table
+        if self.path is None:
+            return
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix='.codes-', dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({name: code for name, code in self._memo.items()
+                           if name not in self._seed}, f, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._added = False
+        except OSError:
+            logger.exception('Writing %s failed', self.path)
+
+
+def _metadata_codes():
+    """The codes of country_metadata.csv, which cover the data source."""
+    table = reference_data.table()
+    return {name: code for name, code in zip(table.names, table.columns['code'])
+            if isinstance(code, str) and code}
+
+
+_codes = None
+_lock = threading.Lock()
+
+
+def codes():
+    """The process-wide resolver, created on first use."""
+    global _codes
+    if _codes is None:
+        with _lock:
+            if _codes is None:
+                _codes = CountryCodes(os.path.join(SNAPSHOT_DIR, TABLE_FILE),
+                                      seed=_metadata_codes())
+    return _codes
@@ -0,0 +1,76 @@
+#################################
+# PER-COUNTRY TIME-SERIES INDEX #
+#################################
+
+# grouped_country is sorted by Country then Date, so each country's history is
+# one contiguous block of rows. CountryIndex records where every block starts
+# and stops once per data load; the chart callbacks then slice NumPy arrays
+# instead of scanning the whole frame with a boolean mask on every dropdown
+# change.
+
+import numpy as np
+import pandas as pd
+
+from daily_deltas import segment_starts
+
+SERIES_COLUMNS = ['Date', 'Confirmed', 'Deaths', 'newConfirmed', 'newDeaths']
+
+
+class CountryIndex:
+    """Maps each country to the slice of its rows in `grouped_country`.
+
+    `extra`, if given, holds more columns (name -> array) aligned with the
+    rows of grouped_country, such as the analytics columns.
+    """
+
+    def __init__(self, grouped_country, columns=SERIES_COLUMNS, extra=None):
+        # Integer codes compare faster than names (and are free for a
+        # categorical Country column)
+        codes, names = pd.factorize(grouped_country['Country'])
+        self.columns = {
+            column: grouped_country[column].to_numpy()
+            for column in columns
+        }
+        self.columns.update(extra or {})
+
+        # Rows where the country changes start a new block
+        starts = segment_starts(codes)
+        stops = np.append(starts[1:], len(codes))
+        names = np.asarray(names, dtype=object)[codes[starts]]
+        self.slices = {
+            name: slice(start, stop)
+            for name, start, stop in zip(names, starts, stops)
+        }
+
+    def __contains__(self, country):
+        return country in self.slices
+
+    def countries(self):
+        """Country names in sorted order, as grouped_country is sorted."""
+        return list(self.slices)
+
+    def series(self, country):
+        """Returns a dict of column name -> array view for `country`.
+
+        Unknown countries get empty arrays, like an empty boolean-mask result.
+        """
+        rows = self.slices.get(country, slice(0, 0))
+        return {column: values[rows] for column, values in self.columns.items()}
+
+    def gather(self, countries):
+        """Series of several countries, concatenated with one take per column.
+
+        Returns (known, starts, columns): the `countries` that are in the
+        index, in the order given, the position of each one's first row in
+        the concatenated arrays, and a dict of column name -> array.
+        """
+        known = [country for country in countries if country in self.slices]
+        first = np.array([self.slices[c].start for c in known], dtype=np.intp)
+        lengths = np.array([self.slices[c].stop for c in known],
+                           dtype=np.intp) - first
+        starts = np.cumsum(lengths) - lengths
+        # Row of the index behind every row of the result
+        rows = np.arange(lengths.sum()) + np.repeat(first - starts, lengths)
+        return known, starts, {
+            column: values[rows] for column, values in self.columns.items()
+        }
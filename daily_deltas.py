@@ -0,0 +1,44 @@
+#################################
+# DAILY DELTAS OF THE COUNTRIES #
+#################################
+
+# newConfirmed/newDeaths used to be a .diff() over the whole of
+# grouped_country, so the first day of every country had the previous
+# country's last total subtracted from it. The diff here is segmented: rows
+# are sorted by country then date and the first row of each country gets a
+# delta of 0 (or the difference to the country's last known total when a
+# block of new dates is appended to an existing history).
+
+import numpy as np
+
+
+def segment_starts(keys):
+    """Returns the positions where a sorted array of `keys` changes value."""
+    keys = np.asarray(keys)
+    if not len(keys):
+        return np.zeros(0, dtype=np.intp)
+    return np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+
+
+def segmented_diff(values, starts, previous=None):
+    """Day-over-day differences of `values` within each segment.
+
+    `starts` are the first positions of the segments (see segment_starts).
+    `previous`, if given, holds for each segment the value that preceded it
+    (NaN for a segment without history); the first delta of a segment is
+    then taken against it instead of being 0.
+    """
+    values = np.asarray(values)
+    deltas = np.empty_like(values)
+    if not len(values):
+        return deltas
+    deltas[0] = 0
+    np.subtract(values[1:], values[:-1], out=deltas[1:])
+    deltas[starts] = 0
+
+    if previous is not None:
+        previous = np.asarray(previous, dtype=np.float64)
+        known = ~np.isnan(previous)
+        deltas[starts[known]] = values[starts[known]] - previous[known]
+    return deltas
+
@@ -0,0 +1,293 @@
+######################
+# READ-ONLY DATA API #
+######################
+
+# JSON and CSV endpoints over the data the dashboard already holds, for the
+# partners who used to scrape the charts:
+#
+#   /api/v1/countries                  country names and codes
+#   /api/v1/series/<country>           daily series of a country
+#   /api/v1/totals                     latest totals per country (grouped)
+#   /api/v1/cfr                        fatality rates and the factors of
+#                                      correlations.py, and
+#   /api/v1/cfr/correlations           the correlations themselves
+#   /api/v1/export/<frame>.<format>    a whole frame, see export.py
+#
+# The tables accept ?fields= (comma separated columns), ?limit= and ?cursor=
+# (the `next` of the previous page, also sent as a Link header), the series
+# ?start= and ?end= (inclusive dates), and all of them ?format=csv. Rows are
+# written a chunk at a time from the arrays built once per data version, and
+# every response carries an ETag made of the data version and the request,
+# so a client polling with If-None-Match gets a 304 without a body being
+# built while the data is unchanged.
+
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+from flask import Response, jsonify, request, url_for
+
+import correlations
+import export
+import snapshot_cache
+
+PREFIX = '/api/v1'
+
+# Rows per page when the request does not say, and at most
+DEFAULT_LIMIT = int(os.environ.get('API_DEFAULT_LIMIT', 1000))
+MAX_LIMIT = int(os.environ.get('API_MAX_LIMIT', 10000))
+
+# Rows serialized at a time
+CHUNK_ROWS = 500
+
+TOTALS_FIELDS = ['Country', 'code', 'Confirmed', 'Deaths', 'fatalityRate',
+                 'over_65', 'population', 'humanDevelopmentIndex']
+
+CFR_FIELDS = ['Country', 'code', 'Confirmed', 'Deaths', 'fatalityRate'
+              ] + list(correlations.FACTORS)
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def tables(grouped):
+    """The totals and CFR tables (name -> field -> array) of grouped."""
+    totals = {field: _column(grouped[field]) for field in TOTALS_FIELDS}
+    rows = np.flatnonzero(totals['Confirmed'] > correlations.MIN_CASES)
+    # By decreasing fatality rate, as the fatality chart
+    rows = rows[np.argsort(-totals['fatalityRate'][rows], kind='stable')]
+    cfr = {field: totals[field][rows] for field in CFR_FIELDS}
+    return {'totals': totals, 'cfr': cfr}
+
+
+def _column(series):
+    values = series.to_numpy()
+    if values.dtype.kind == 'M':
+        return np.datetime_as_string(values, unit='D').astype(object)
+    if values.dtype.kind == 'f':
+        return np.round(values.astype(np.float64), 4)
+    return values
+
+
+def _encode_cursor(version, offset):
+    raw = json.dumps([version, int(offset)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, version):
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        decoded = json.loads(raw)
+    except ValueError:
+        raise ApiError(400, 'Invalid cursor')
+    # Only _encode_cursor()'s [version, offset] pairs are cursors
+    if (not isinstance(decoded, list) or len(decoded) != 2
+            or not isinstance(decoded[0], str)
+            or type(decoded[1]) is not int or decoded[1] < 0):
+        raise ApiError(400, 'Invalid cursor')
+    cursor_version, offset = decoded
+    if cursor_version != version:
+        raise ApiError(410, 'The data was updated since this cursor was '
+                       'issued, start again without a cursor')
+    return offset
+
+
+def _limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, 'limit must be an integer')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _fields(available, always=()):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(available)
+    fields = [f for f in requested.split(',') if f]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ApiError(400, f"Unknown fields {', '.join(unknown)}; "
+                       f"available: {', '.join(available)}")
+    return list(always) + [f for f in fields if f not in always]
+
+
+def _values(column):
+    """JSON-ready list of an array, NaN as None."""
+    if column.dtype.kind == 'f':
+        return [None if v != v else v for v in column.tolist()]
+    return column.tolist()
+
+
+def _chunks(columns, fields, kind, head, tail):
+    """Yields the body a CHUNK_ROWS rows at a time."""
+    rows = len(columns[fields[0]]) if fields else 0
+    if kind == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for start in range(0, rows, CHUNK_ROWS):
+            chunk = [_values(columns[f][start:start + CHUNK_ROWS]) for f in fields]
+            writer.writerows(zip(*chunk))
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        if not rows:
+            yield out.getvalue()
+        return
+
+    yield head[:-1] + ', "data": ['
+    for start in range(0, rows, CHUNK_ROWS):
+        chunk = [_values(columns[f][start:start + CHUNK_ROWS]) for f in fields]
+        body = ', '.join(json.dumps(dict(zip(fields, row)))
+                         for row in zip(*chunk))
+        yield (', ' if start else '') + body
+    yield '], ' + tail[1:]
+
+
+def _page(version, columns, fields, offset, limit, endpoint, **values):
+    """The streamed response of rows offset to offset + limit of `columns`."""
+    kind = request.args.get('format', 'json')
+    if kind not in ('json', 'csv'):
+        raise ApiError(400, 'format must be json or csv')
+    total = len(next(iter(columns.values()))) if columns else 0
+    stop = min(offset + limit, total)
+    page = {field: columns[field][offset:stop] for field in fields}
+
+    next_cursor = _encode_cursor(version, stop) if stop < total else None
+    head = json.dumps({'version': version, 'fields': fields})
+    tail = json.dumps({'next': next_cursor, 'total': total})
+    response = Response(_chunks(page, fields, kind, head, tail),
+                        mimetype='text/csv' if kind == 'csv' else 'application/json')
+    if next_cursor is not None:
+        # Path arguments (the country) are not repeated in the query string
+        args = {name: value for name, value in request.args.items()
+                if name not in values}
+        args['cursor'] = next_cursor
+        response.headers['Link'] = '<{}>; rel="next"'.format(
+            url_for(endpoint, **values, **args))
+    return response
+
+
+def register(server, get_state, snapshot_dir=snapshot_cache.SNAPSHOT_DIR):
+    """Adds the endpoints to the Flask `server`; `get_state()` returns the
+    current state of the refresher (None while loading), whose snapshots are
+    in `snapshot_dir`."""
+
+    def etag(version):
+        return hashlib.sha256(
+            f'{version} {request.full_path}'.encode()).hexdigest()[:32]
+
+    @server.errorhandler(ApiError)
+    def api_error(error):
+        response = jsonify(error=str(error))
+        response.status_code = error.status
+        return response
+
+    def endpoint(view):
+
+        def respond(**values):
+            state = get_state()
+            if state is None:
+                response = jsonify(error='The data is being loaded')
+                response.status_code = 503
+                response.headers['Retry-After'] = '5'
+                return response
+            tag = etag(state['version'])
+            if request.if_none_match.contains(tag):
+                response = Response(status=304)
+            else:
+                response = view(state, **values)
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        respond.__name__ = 'api_' + view.__name__
+        return respond
+
+    def countries(state):
+        table = state['api_tables']['totals']
+        order = np.argsort(table['Country'], kind='stable')
+        return _page(state['version'],
+                     {f: table[f][order] for f in ['Country', 'code']},
+                     ['Country', 'code'], _decode_cursor(
+                         request.args.get('cursor'), state['version']),
+                     _limit(), 'api_countries')
+
+    def series(state, country):
+        index = state['country_index']
+        if country not in index:
+            raise ApiError(404, f'Unknown country {country}')
+        columns = index.series(country)
+        dates = columns['Date']
+        try:
+            first = np.searchsorted(
+                dates, np.datetime64(request.args.get('start', dates[0])))
+            last = np.searchsorted(
+                dates, np.datetime64(request.args.get('end', dates[-1])),
+                side='right')
+        except ValueError:
+            raise ApiError(400, 'start and end must be dates (YYYY-MM-DD)')
+        fields = _fields(list(columns), always=['Date'])
+        rows = {field: columns[field][first:last] for field in fields}
+        rows['Date'] = np.datetime_as_string(rows['Date'], unit='D')
+        rows = {f: (np.round(v.astype(np.float64), 4)
+                    if v.dtype.kind == 'f' else v) for f, v in rows.items()}
+        return _page(state['version'], rows, fields,
+                     _decode_cursor(request.args.get('cursor'), state['version']),
+                     _limit(), 'api_series', country=country)
+
+    def table(name):
+
+        def view(state):
+            columns = state['api_tables'][name]
+            return _page(state['version'], columns,
+                         _fields(list(columns), always=['Country']),
+                         _decode_cursor(request.args.get('cursor'),
+                                        state['version']),
+                         _limit(), 'api_' + name)
+
+        view.__name__ = name
+        return view
+
+    def cfr_correlations(state):
+        return jsonify(version=state['version'], min_cases=correlations.MIN_CASES,
+                       confidence=correlations.CONFIDENCE,
+                       correlations={
+                           name: {k: (None if v != v else v)
+                                  for k, v in result.items()}
+                           for name, result in state['correlations'].items()
+                       })
+
+    def export_frame(state, frame, kind):
+        if frame not in export.FRAMES:
+            raise ApiError(404, f"Unknown frame {frame}; available: "
+                           f"{', '.join(export.FRAMES)}")
+        body = export.stream(export.columns(state, frame, snapshot_dir), kind)
+        response = Response(body, mimetype=export.MIMETYPES[kind])
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename={frame}-{state["version"]}.{kind}')
+        return response
+
+    routes = [
+        ('/countries', countries),
+        ('/series/<country>', series),
+        ('/totals', table('totals')),
+        ('/cfr', table('cfr')),
+        ('/cfr/correlations', cfr_correlations),
+        ('/export/<frame>.<any(arrow, parquet, csv):kind>', export_frame),
+    ]
+    for rule, view in routes:
+        wrapped = endpoint(view)
+        server.add_url_rule(PREFIX + rule, wrapped.__name__, wrapped)
+    return server
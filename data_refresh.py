@@ -0,0 +1,360 @@
+##################################
+# BACKGROUND REFRESH OF THE DATA #
+##################################
+
+# The dashboard used to download the countries-aggregated CSV when app.py was
+# imported, so every gunicorn worker blocked on the download at boot and then
+# served that copy until it was restarted. DataRefresher loads the data in a
+# daemon thread instead, rebuilds everything the charts need with a `build`
+# callable supplied by the app and swaps the finished state in with a single
+# assignment, so callbacks always see either the old or the new data.
+#
+# The aggregated frames are also written to a snapshot_cache snapshot, which a
+# restarted worker loads before it even contacts the source. The snapshot
+# records the `reference` digest of the other data the frames were built from
+# (for the app, datasets.reference_version()), and one made from other
+# reference data is rebuilt from the source instead of loaded.
+#
+# The upstream file only ever grows by one date per country at its end, so
+# after the first full load a refresh reads just the bytes past the end of
+# what was ingested (an HTTP Range request for URLs) and appends them to the
+# frames. The last CHECK_WINDOW bytes already ingested are read back and
+# compared to what was ingested; if they differ, or the new rows do not come
+# after the last ingested date, the source was rewritten and is reloaded in
+# full. A revision further back that keeps the length of the file would go
+# unnoticed that way, so every FULL_RELOAD_INTERVAL seconds the refresh is a
+# (conditional) full reload instead.
+#
+# Only the new rows are downloaded, parsed and aggregated, but appending
+# still copies the frames (see datasets.append_data), the snapshot of the new
+# version is written in full and `build` runs over the whole history, so a
+# refresh still takes longer as the history grows, only much less so than a
+# full reload (benchmarks/incremental.py).
+#
+# The data version is a hash of the lines ingested that adds up the hashes of
+# the lines, so appending a tail adds the hash of its lines to the version:
+# the same bytes get the same version whether they were loaded at once or
+# appended a day at a time, in one worker or another.
+#
+# Downloads go through fetch.py. The validators (ETag, Last-Modified) of the
+# last download are kept in the cursor, so both kinds of refresh are
+# conditional GETs and an unchanged source costs a bodiless 304.
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.error import HTTPError
+
+import numpy as np
+import pandas as pd
+
+import snapshot_cache
+from fetch import FETCH_TIMEOUT, fetch, is_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCE = 'https://raw.githubusercontent.com/datasets/covid-19/master/data/countries-aggregated.csv'
+
+# Either a URL or a path to a local copy of countries-aggregated.csv
+DATA_SOURCE = os.environ.get('DATA_SOURCE', DEFAULT_SOURCE)
+
+# Seconds between two refreshes of the data
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 3600))
+
+# Seconds after which a refresh reloads the source in full rather than
+# appending to what was ingested
+FULL_RELOAD_INTERVAL = int(os.environ.get('FULL_RELOAD_INTERVAL', 86400))
+
+# Bytes before the end of the ingested data read back to check that the
+# source was only appended to
+CHECK_WINDOW = 4096
+
+
+class SourceChanged(Exception):
+    """The source was rewritten rather than appended to since the last read."""
+
+
+def read_source(source, timeout=FETCH_TIMEOUT):
+    """Returns the raw bytes of `source`, which is a URL or a file path."""
+    return fetch(source, timeout=timeout).body
+
+
+def parse_world_data(raw, columns=None):
+    """Parses CSV bytes; `columns` names the columns of headerless bytes."""
+    if columns is None:
+        return pd.read_csv(io.BytesIO(raw), parse_dates=['Date'])
+    return pd.read_csv(io.BytesIO(raw),
+                       header=None,
+                       names=columns,
+                       parse_dates=['Date'])
+
+
+def source_version(raw, base=None):
+    """Version of the complete lines `raw`, or of the bytes of version
+    `base` followed by them."""
+    lines = raw.decode('latin-1').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    # uint64 sums wrap around, so versions add up modulo 2 ** 64
+    total = int(pd.util.hash_array(np.array(lines, dtype=object)).sum(
+        dtype=np.uint64))
+    if base is not None:
+        total = (total + int(base, 16)) % 2 ** 64
+    return f'{total:016x}'
+
+
+def _digest(raw):
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def _complete_lines(raw):
+    # A source caught mid-write may end with a partial row
+    return raw[:raw.rfind(b'\n') + 1]
+
+
+def make_cursor(raw, columns, last_date, validators=None):
+    """Records how far `raw` (complete lines only) has been ingested, the
+    `validators` of the download it came from, and when it was read in full."""
+    return {
+        'offset': len(raw),
+        'window': _digest(raw[-CHECK_WINDOW:]),
+        'columns': list(columns),
+        'last_date': last_date.isoformat(),
+        'validators': validators,
+        'reloaded_at': time.time(),
+    }
+
+
+def read_tail(source, cursor, timeout=FETCH_TIMEOUT):
+    """Returns (tail, cursor): the complete lines appended to `source` since
+    `cursor` and the cursor advanced past them.
+
+    Raises SourceChanged if the source no longer starts with the bytes that
+    were ingested.
+    """
+    offset = cursor['offset']
+    start = max(offset - CHECK_WINDOW, 0)
+    validators = None
+    if is_url(source):
+        try:
+            fetched = fetch(source, cursor.get('validators'),
+                            headers={'Range': f'bytes={start}-'},
+                            timeout=timeout)
+        except HTTPError as error:
+            if error.code == 416:
+                raise SourceChanged(f'{source} is shorter than before')
+            raise
+        if not fetched.modified:
+            return b'', cursor
+        data = fetched.body
+        if fetched.status != 206:
+            # The server ignored the range and sent the whole file
+            data = data[start:]
+        validators = fetched.validators
+    else:
+        with open(source, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+
+    ingested = data[:offset - start]
+    if (len(ingested) < offset - start
+            or _digest(ingested) != cursor['window']):
+        raise SourceChanged(f'{source} was rewritten')
+
+    tail = _complete_lines(data[offset - start:])
+    window = (ingested + tail)[-CHECK_WINDOW:]
+    return tail, dict(cursor,
+                      offset=offset + len(tail),
+                      window=_digest(window),
+                      validators=validators)
+
+
+class DataRefresher:
+    """Keeps the latest state built from `source` and refreshes it on a schedule.
+
+    `transform` turns the parsed world data into a dict of aggregated frames,
+    which are cached on disk per source version. `append`, if given, adds the
+    rows of new dates to such a dict; without it every refresh that finds new
+    data reloads the source in full, as do the refreshes that come
+    `full_reload_interval` seconds after the last full reload. `build` receives the frames
+    and returns a dict with everything the app serves from (frames, figures,
+    ...). The refresher adds `version` (see source_version()) and
+    `loaded_at` to it. `state` is None until the first load has finished.
+    `on_load`, if given, is called with every new state right after the swap.
+    `reference`, if given, digests whatever else `transform` depends on;
+    snapshots written under another digest are not loaded.
+    """
+
+    def __init__(self,
+                 transform,
+                 build,
+                 source=DATA_SOURCE,
+                 interval=REFRESH_INTERVAL,
+                 snapshot_dir=snapshot_cache.SNAPSHOT_DIR,
+                 on_load=None,
+                 append=None,
+                 full_reload_interval=FULL_RELOAD_INTERVAL,
+                 reference=None):
+        self.transform = transform
+        self.append = append
+        self.build = build
+        self.on_load = on_load
+        self.source = source
+        self.snapshot_dir = snapshot_dir
+        self.interval = interval
+        self.full_reload_interval = full_reload_interval
+        self.reference = reference
+        self._state = None
+        self._frames = None
+        self._cursor = None
+        self._loaded = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def refresh(self):
+        """Loads new data from the source and swaps in a freshly built state.
+
+        Returns True when the state changed. Unchanged source bytes skip the
+        rebuild, since the figures would come out identical.
+        """
+        with self._lock:
+            if (self.append is not None and self._cursor is not None
+                    and time.time() - self._cursor.get('reloaded_at', 0)
+                    < self.full_reload_interval):
+                try:
+                    return self._append()
+                except SourceChanged as error:
+                    logger.info('%s, reloading it in full', error)
+            return self._reload()
+
+    def _append(self):
+        tail, cursor = read_tail(self.source, self._cursor)
+        if not tail:
+            logger.info('No new data in %s', self.source)
+            return False
+
+        new_data = parse_world_data(tail, cursor['columns'])
+        last_date = pd.Timestamp(cursor['last_date'])
+        if (new_data['Date'] <= last_date).any():
+            raise SourceChanged(
+                f'{self.source} has new rows dated {last_date:%Y-%m-%d} or before')
+
+        frames = self.append(self._frames, new_data)
+        cursor['last_date'] = new_data['Date'].max().isoformat()
+        version = source_version(tail, base=self._state['version'])
+        self._store(frames, version, datetime.now(), cursor)
+        logger.info('Appended %d rows to data version %s from %s',
+                    len(new_data), version, self.source)
+        return True
+
+    def _reload(self):
+        current = self._state
+        validators = None
+        if current is not None and self._cursor is not None:
+            validators = self._cursor.get('validators')
+        fetched = fetch(self.source, validators)
+        if not fetched.modified:
+            self._cursor = dict(self._cursor, reloaded_at=time.time())
+            logger.info('Data source not modified (version %s)',
+                        current['version'])
+            return False
+        raw = _complete_lines(fetched.body)
+        version = source_version(raw)
+        if (current is not None and current['version'] == version
+                and self._cursor is not None):
+            self._cursor = dict(self._cursor, validators=fetched.validators,
+                                reloaded_at=time.time())
+            logger.info('Data source unchanged (version %s)', version)
+            return False
+
+        cached = snapshot_cache.load(version, self.snapshot_dir,
+                                     self.reference)
+        if cached is not None and cached[1]['cursor'] is not None:
+            frames, meta = cached
+            self._frames = frames
+            self._cursor = dict(meta['cursor'], validators=fetched.validators,
+                                reloaded_at=time.time())
+            self._swap(frames, version, meta['loaded_at'])
+        else:
+            world_data = parse_world_data(raw)
+            cursor = make_cursor(raw, world_data.columns,
+                                 world_data['Date'].max(), fetched.validators)
+            frames = self.transform(world_data)
+            self._store(frames, version, datetime.now(), cursor)
+        logger.info('Loaded data version %s from %s', version, self.source)
+        return True
+
+    def _store(self, frames, version, loaded_at, cursor):
+        try:
+            snapshot_cache.save(version, frames, loaded_at, self.snapshot_dir,
+                                cursor, self.reference)
+        except OSError:
+            # A read-only disk only costs the next worker a parse
+            logger.exception('Writing the snapshot of %s failed', version)
+        self._frames, self._cursor = frames, cursor
+        self._swap(frames, version, loaded_at)
+
+    def load_snapshot(self):
+        """Serves the latest on-disk snapshot, if any, without reading the source.
+
+        Returns True when a snapshot was loaded.
+        """
+        with self._lock:
+            version = snapshot_cache.latest_version(self.snapshot_dir)
+            cached = snapshot_cache.load(version, self.snapshot_dir,
+                                         self.reference)
+            if cached is None:
+                return False
+            frames, meta = cached
+            self._frames, self._cursor = frames, meta['cursor']
+            self._swap(frames, version, meta['loaded_at'])
+            logger.info('Loaded data version %s from snapshot', version)
+            return True
+
+    def _swap(self, frames, version, loaded_at):
+        state = self.build(frames)
+        state['version'] = version
+        state['loaded_at'] = loaded_at
+        self._state = state
+        self._loaded.set()
+        if self.on_load is not None:
+            self.on_load(state)
+
+    def start(self):
+        """Starts refreshing in a daemon thread; returns immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='data-refresh',
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the first load has finished; returns whether it did."""
+        return self._loaded.wait(timeout)
+
+    def _run(self):
+        try:
+            self.load_snapshot()
+        except Exception:
+            logger.exception('Loading the snapshot from %s failed',
+                              self.snapshot_dir)
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the previous state and try again next time
+                logger.exception('Refreshing data from %s failed', self.source)
+            self._stop.wait(self.interval)
@@ -0,0 +1,197 @@
+#########################################
+# AGGREGATED DATASETS BEHIND THE CHARTS #
+#########################################
+
+# Kept apart from app.py so the snapshot cache and the benchmarks can build
+# the frames without creating the Dash app.
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import country_codes
+import reference_data
+from daily_deltas import segment_starts, segmented_diff
+
+# Counts stored in 4 bytes unless a country ever outgrows them
+COUNT_COLUMNS = ['Confirmed', 'Recovered', 'Deaths']
+
+
+def _count_dtype(values):
+    if len(values) and values.max() > np.iinfo(np.int32).max:
+        return np.int64
+    return np.int32
+
+
+def compact(world_data, countries=None):
+    """Stores Country as a categorical over the sorted country names (plus
+    `countries`, if given) and the counts as int32, in place.
+
+    With sorted categories the category codes order rows like the names do,
+    so the codes can stand in for the names when sorting and slicing.
+    """
+    names = pd.Index(world_data['Country'].unique()).astype(object)
+    if countries is not None:
+        names = names.union(pd.Index(countries).astype(object))
+    world_data['Country'] = pd.Categorical(world_data['Country'],
+                                           categories=names.sort_values())
+    for column in COUNT_COLUMNS:
+        if column in world_data and pd.api.types.is_integer_dtype(
+                world_data[column]):
+            world_data[column] = world_data[column].astype(
+                _count_dtype(world_data[column]))
+    return world_data
+
+
+def country_totals(world_data):
+    """Sorted per-country totals (grouped) from any frame with a Country,
+    Confirmed and Deaths column."""
+
+    #sorting based on confirmed cases to identify top-10 countries with highest confirmed cases
+    grouped = world_data.groupby(['Country'], observed=True).agg({
+        'Confirmed': 'max',
+        'Deaths': 'max'
+    }).sort_values(by=['Confirmed'], ascending=False).reset_index()
+    # Only ~200 rows, plain strings are simpler for the charts
+    grouped['Country'] = grouped['Country'].astype(object)
+
+    grouped['fatalityRate'] = round(grouped.Deaths / grouped.Confirmed * 100, 2)
+
+    # grouped['newConfirmed'] = grouped['Confirmed'].diff().fillna(0)
+    # grouped['newDeaths'] = grouped['Deaths'].diff().fillna(0)
+
+    # ISO3 codes of the countries, raising for names that resolve to none
+    grouped['code'] = country_codes.codes().resolve_all(grouped['Country'])
+
+    # Mapping population over 65 and populations to countries in dataset,
+    # once per country; countries missing any of them are logged
+    reference_data.table().join(grouped,
+                                ['over_65', 'population',
+                                 'humanDevelopmentIndex'])
+
+    # # Calculating cases per 100,000 population
+    # grouped['casesPerCapita'] = grouped['Confirmed'] / grouped[
+    #     'population'] * 100000
+    # grouped['deathsPerCapita'] = grouped['Deaths'] / grouped[
+    #     'population'] * 100000
+
+    return grouped
+
+
+def reference_version():
+    """Digest of the reference data country_totals() joins: the country
+    metadata and indicator files (see reference_data.version) and the
+    aliases of country_codes. Frames joined under another one are stale."""
+    digest = hashlib.sha256(reference_data.version().encode())
+    digest.update(repr(sorted(country_codes.ALIASES.items())).encode())
+    return digest.hexdigest()[:16]
+
+
+def country_dates(world_data, previous=None):
+    """Per-country daily rows (grouped_country) of a compact `world_data`,
+    sorted by Country then Date.
+
+    `previous`, if given, maps each country to its last Confirmed and Deaths
+    totals before the first date of `world_data`, so the daily deltas of
+    appended dates continue the existing history.
+    """
+
+    grouped_country = world_data.groupby(['Country', 'Date'], observed=True).agg({
+        'Confirmed': 'max',
+        'Deaths': 'max'
+    }).reset_index()
+
+    # Differences restart at the first day of every country
+    countries = grouped_country['Country']
+    starts = segment_starts(countries.cat.codes.to_numpy())
+    for metric in ['Confirmed', 'Deaths']:
+        last = None
+        if previous is not None:
+            first_rows = pd.Series(np.asarray(countries)[starts])
+            last = first_rows.map(previous[metric]).to_numpy(dtype=float)
+        grouped_country['new' + metric] = segmented_diff(
+            grouped_country[metric].to_numpy(), starts, last)
+
+    return grouped_country
+
+
+def transform_data(world_data):
+    """Aggregates the raw world data into the frames used by the charts."""
+
+    # Transforming datasets
+    world_data = compact(world_data)
+    return {
+        'world_data': world_data,
+        'grouped': country_totals(world_data),
+        'grouped_country': country_dates(world_data),
+    }
+
+
+def _insert_rows(old, positions, new):
+    # np.insert on the category codes keeps categorical columns compact
+    if isinstance(old.dtype, pd.CategoricalDtype):
+        codes = np.insert(old.cat.codes.to_numpy(), positions,
+                          new.cat.codes.to_numpy())
+        return pd.Categorical.from_codes(codes, old.cat.categories)
+    return np.insert(old.to_numpy(), positions, new.to_numpy())
+
+
+def append_data(frames, new_data):
+    """Appends rows of dates after the last ingested one to the frames built
+    by transform_data(), without re-aggregating the existing history.
+
+    The per-country totals are recomputed from the previous totals and the
+    new rows only, and the daily deltas of the new dates are taken against
+    each country's last row. The existing rows are still copied into the
+    returned frames (grouped_country is sorted by country, so the new dates
+    go inside every country's block), which keeps a cost proportional to the
+    history, if a far smaller one than transform_data().
+    """
+
+    world_data = frames['world_data']
+    old_rows = frames['grouped_country']
+
+    # Countries seen for the first time extend the categories of the history
+    countries = world_data['Country'].cat.categories
+    new_data = compact(new_data, countries)
+    categories = new_data['Country'].cat.categories
+    if len(categories) != len(countries):
+        world_data = world_data.assign(
+            Country=world_data['Country'].cat.set_categories(categories))
+        old_rows = old_rows.assign(
+            Country=old_rows['Country'].cat.set_categories(categories))
+
+    world_data = pd.concat([world_data, new_data], ignore_index=True)
+
+    # The running max of the totals only needs the old max and the new rows
+    grouped = country_totals(
+        pd.concat([frames['grouped'][['Country', 'Confirmed', 'Deaths']],
+                   new_data[['Country', 'Confirmed', 'Deaths']]]))
+
+    codes = old_rows['Country'].cat.codes.to_numpy()
+    starts = segment_starts(codes)
+    stops = np.append(starts[1:], len(old_rows))
+    last_rows = old_rows.iloc[stops - 1]
+    new_rows = country_dates(
+        new_data, last_rows.set_index(last_rows['Country'].astype(object)))
+
+    # Each new row goes right after its country's block (or where a new
+    # country sorts), so the result stays sorted by Country then Date
+    block_codes = codes[starts]
+    new_codes = new_rows['Country'].cat.codes.to_numpy()
+    block = np.searchsorted(block_codes, new_codes)
+    known = block < len(block_codes)
+    known[known] = block_codes[block[known]] == new_codes[known]
+    positions = np.where(known, np.append(stops, len(old_rows))[block],
+                         np.append(starts, len(old_rows))[block])
+    grouped_country = pd.DataFrame({
+        column: _insert_rows(old_rows[column], positions, new_rows[column])
+        for column in old_rows.columns
+    })
+
+    return {
+        'world_data': world_data,
+        'grouped': grouped,
+        'grouped_country': grouped_country,
+    }
@@ -0,0 +1,158 @@
+########################################
+# BULK EXPORT OF THE AGGREGATED FRAMES #
+########################################
+
+# The notebooks used to download countries-aggregated.csv and redo the
+# aggregation of datasets.py to get grouped_country. The export streams the
+# frames of the current data version instead, as an Arrow IPC stream, as
+# Parquet or as CSV, BATCH_ROWS rows at a time, so the memory a download
+# takes does not grow with the history.
+#
+# The columns are read from the snapshot_cache snapshot of the version, which
+# is memory-mapped: numbers and dates are handed to pyarrow without being
+# copied, and the categorical columns become dictionary arrays over their
+# stored codes. Without a snapshot (a read-only disk) the frames in memory are
+# exported the same way.
+
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import snapshot_cache
+
+# Frames that can be exported
+FRAMES = ['grouped_country', 'world_data']
+
+# Rows per record batch (and per Parquet row group)
+BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', 65536))
+
+MIMETYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv',
+}
+
+
+def columns(state, frame, snapshot_dir=snapshot_cache.SNAPSHOT_DIR):
+    """(name, values, categories) of the columns of `frame` in `state`, as
+    snapshot_cache.columns() returns them."""
+    stored = snapshot_cache.columns(state['version'], frame, snapshot_dir)
+    if stored is not None:
+        return stored
+    result = []
+    for name, values in state[frame].items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            result.append((name, values.cat.codes.to_numpy(),
+                           list(values.cat.categories)))
+        elif values.dtype == object:
+            codes, categories = pd.factorize(values)
+            result.append((name, codes.astype(np.int32), list(categories)))
+        else:
+            result.append((name, values.to_numpy(), None))
+    return result
+
+
+def schema(columns):
+    """The Arrow schema of `columns`."""
+    fields = []
+    for name, values, categories in columns:
+        kind = pa.from_numpy_dtype(values.dtype)
+        if categories is not None:
+            kind = pa.dictionary(kind, pa.string())
+        fields.append(pa.field(name, kind))
+    return pa.schema(fields)
+
+
+def batches(columns, batch_rows=BATCH_ROWS):
+    """Yields the record batches of `columns`."""
+    table_schema = schema(columns)
+    dictionaries = [None if categories is None
+                    else pa.array(categories, pa.string())
+                    for _, _, categories in columns]
+    rows = len(columns[0][1]) if columns else 0
+    for start in range(0, rows, batch_rows):
+        arrays = []
+        for (_, values, _), dictionary in zip(columns, dictionaries):
+            chunk = values[start:start + batch_rows]
+            if dictionary is None:
+                arrays.append(pa.array(chunk))
+                continue
+            missing = chunk < 0
+            codes = pa.array(chunk, mask=missing if missing.any() else None)
+            arrays.append(pa.DictionaryArray.from_arrays(codes, dictionary))
+        yield pa.RecordBatch.from_arrays(arrays, schema=table_schema)
+
+
+class _Sink(io.RawIOBase):
+    """A file that keeps what is written to it until take() is called."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream(columns, kind, batch_rows=BATCH_ROWS):
+    """Yields `columns` written as `kind` (a key of MIMETYPES), a batch of
+    rows at a time."""
+    if kind == 'csv':
+        yield from _csv(columns, batch_rows)
+        return
+    sink = _Sink()
+    if kind == 'arrow':
+        writer = pa.ipc.new_stream(sink, schema(columns))
+    else:
+        writer = pq.ParquetWriter(sink, schema(columns))
+    with writer:
+        for batch in batches(columns, batch_rows):
+            writer.write_batch(batch)
+            yield sink.take()
+    # The end of stream marker, or the Parquet footer
+    yield sink.take()
+
+
+def _csv(columns, batch_rows):
+    # Categories are looked up with their codes, -1 picking the trailing ''
+    lookups = [None if categories is None
+               else np.array(categories + [''], dtype=object)
+               for _, _, categories in columns]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([name for name, _, _ in columns])
+    rows = len(columns[0][1]) if columns else 0
+    for start in range(0, rows, batch_rows):
+        chunk = []
+        for (_, values, _), lookup in zip(columns, lookups):
+            part = values[start:start + batch_rows]
+            if lookup is not None:
+                part = lookup[part]
+            elif part.dtype.kind == 'M':
+                part = np.datetime_as_string(part, unit='D')
+            chunk.append(part.tolist())
+        writer.writerows(zip(*chunk))
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+    if not rows:
+        yield out.getvalue().encode()
@@ -0,0 +1,258 @@
+####################################
+# CONCURRENT CONDITIONAL DOWNLOADS #
+####################################
+
+# Every source used to be read with a blocking urlopen() one after the
+# other, so a refresh took the sum of its downloads, and an unchanged file
+# was downloaded whole to find out it was unchanged. fetch_all() downloads a
+# list of sources concurrently with aiohttp and returns when the slowest is
+# done:
+#
+#   - keep-alive connections are reused, at most FETCH_CONNECTIONS open per
+#     host at once, from one ClientSession that lives as long as the process;
+#   - the proxies of HTTP_PROXY, HTTPS_PROXY and NO_PROXY are used as
+#     urlopen() uses them;
+#   - connecting and every read of the response are abandoned after
+#     FETCH_TIMEOUT seconds, so a slow but steady download is not cut off,
+#     and connection errors, timeouts, 429 and 5xx answers are retried
+#     FETCH_RETRIES times with an exponential backoff;
+#   - given the validators (ETag, Last-Modified) of an earlier download, the
+#     request is conditional and an unchanged source answers a bodiless 304;
+#   - bodies are asked for compressed, except for Range requests.
+#
+# Local paths are read in the default executor, with their modification time
+# and size as validators, so fixtures and JHU_BASE_URL directories go through
+# the same code. Callers run in threads (the refreshers, the app2 import), so
+# fetch_all() hands the downloads to an event loop running in a daemon thread
+# of its own, which keeps the session, and blocks until they are done;
+# fetch_each() hands each download over as soon as it is complete instead.
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+from urllib.error import HTTPError
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Seconds before giving up on connecting, or on the next bytes of a download
+FETCH_TIMEOUT = int(os.environ.get('FETCH_TIMEOUT', 60))
+
+# Attempts made after the first one fails
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', 3))
+
+# Connections open at once to one host
+FETCH_CONNECTIONS = int(os.environ.get('FETCH_CONNECTIONS', 4))
+
+# Seconds before the first retry, doubled before each of the next ones
+RETRY_DELAY = 1.0
+
+MAX_REDIRECTS = 5
+
+USER_AGENT = 'coronavirus-tracker'
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+class Fetched:
+    """The outcome of downloading a source: its `status` (200, 206, or 304
+    when unchanged since `validators` were given), its `body` (None when
+    unchanged) and the `validators` to make the next download conditional."""
+
+    def __init__(self, status, body, validators):
+        self.status = status
+        self.body = body
+        self.validators = validators
+
+    @property
+    def modified(self):
+        return self.status != 304
+
+
+def client_session(connections=FETCH_CONNECTIONS):
+    """A ClientSession for fetch_many(), keeping at most `connections`
+    connections open per host; to be created and closed on the loop it
+    serves."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0, limit_per_host=connections),
+        headers={'User-Agent': USER_AGENT},
+        trust_env=True)
+
+
+def _timeout(seconds):
+    # Per operation: a large file arriving steadily is never cut off, and
+    # the wait for a free connection of the pool is not counted
+    return aiohttp.ClientTimeout(total=None, sock_connect=seconds,
+                                 sock_read=seconds)
+
+
+async def _get(session, url, validators, headers, timeout, retries):
+    headers = dict(headers or {})
+    if 'Range' in headers:
+        # Offsets are into the file as stored, not a compressed copy of it
+        headers['Accept-Encoding'] = 'identity'
+    validators = validators or {}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last-modified' in validators:
+        headers['If-Modified-Since'] = validators['last-modified']
+
+    attempt = 0
+    while True:
+        try:
+            async with session.get(url, headers=headers,
+                                   timeout=_timeout(timeout),
+                                   max_redirects=MAX_REDIRECTS) as response:
+                status = response.status
+                body = await response.read()
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                asyncio.TimeoutError) as error:
+            failure = error
+        else:
+            if status == 304:
+                return Fetched(304, None, validators)
+            if status < 400:
+                return Fetched(status, body, {
+                    name: response.headers[name]
+                    for name in ['etag', 'last-modified']
+                    if name in response.headers
+                })
+            failure = HTTPError(url, status, response.reason,
+                                response.headers, None)
+            if status != 429 and status < 500:
+                raise failure
+        if attempt >= retries:
+            raise failure
+        delay = RETRY_DELAY * 2 ** attempt
+        attempt += 1
+        logger.warning('Downloading %s failed (%s), attempt %d of %d in %.0f s',
+                       url, str(failure) or type(failure).__name__, attempt + 1,
+                       retries + 1, delay)
+        await asyncio.sleep(delay)
+
+
+def _read_file(path, validators):
+    stat = os.stat(path)
+    current = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+    if validators == current:
+        return Fetched(304, None, current)
+    with open(path, 'rb') as f:
+        return Fetched(200, f.read(), current)
+
+
+async def fetch_many(sources, validators=None, headers=None,
+                     timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES,
+                     session=None):
+    """Coroutine of fetch_all(). Without `session` (a client_session() of
+    the running loop) its connections are closed when it is done."""
+    validators = validators or {}
+    client = session or client_session()
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.gather(*[
+            _get(client, source, validators.get(source), headers,
+                 timeout, retries)
+            if is_url(source) else
+            loop.run_in_executor(None, _read_file, source,
+                                 validators.get(source))
+            for source in sources
+        ])
+    finally:
+        if session is None:
+            await client.close()
+
+
+_loop = None
+_session = None
+_lock = threading.Lock()
+
+
+def _event_loop():
+    """The event loop of the fetch thread, started on first use."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='fetch',
+                                 daemon=True).start()
+                atexit.register(_close_session, loop)
+                _loop = loop
+    return _loop
+
+
+def _close_session(loop):
+    if _session is not None:
+        asyncio.run_coroutine_threadsafe(_session.close(), loop).result(5)
+
+
+async def _shared_fetch_many(*args):
+    # The session is created on the loop it serves
+    global _session
+    if _session is None:
+        _session = client_session()
+    return await fetch_many(*args, session=_session)
+
+
+def fetch_all(sources, validators=None, headers=None, timeout=FETCH_TIMEOUT,
+              retries=FETCH_RETRIES):
+    """Downloads `sources` (URLs or file paths) concurrently and returns
+    their Fetched, in the same order.
+
+    `validators` maps sources to the validators of an earlier Fetched of
+    them, which come back as 304s without a body if they did not change.
+    `headers` are sent with every request. Raises the error of the first
+    source that failed, HTTPError for HTTP errors.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        _shared_fetch_many(sources, validators, headers, timeout, retries),
+        _event_loop()).result()
+
+
+def fetch_each(sources, validators=None, headers=None, timeout=FETCH_TIMEOUT,
+               retries=FETCH_RETRIES):
+    """fetch_all() yielding (source, Fetched) as each download completes,
+    so that a body can be used and dropped while the others download.
+
+    Only the bodies not taken yet are kept. Leaving the loop early cancels
+    the downloads still running.
+    """
+    validators = validators or {}
+    done = queue.Queue()
+
+    async def one(source):
+        try:
+            fetched, = await _shared_fetch_many([source],
+                                                {source: validators.get(source)},
+                                                headers, timeout, retries)
+        except Exception as error:
+            done.put((source, None, error))
+        else:
+            done.put((source, fetched, None))
+
+    loop = _event_loop()
+    futures = [asyncio.run_coroutine_threadsafe(one(source), loop)
+               for source in sources]
+    try:
+        for _ in futures:
+            source, fetched, error = done.get()
+            if error is not None:
+                raise error
+            yield source, fetched
+            del fetched
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def fetch(source, validators=None, headers=None, timeout=FETCH_TIMEOUT,
+          retries=FETCH_RETRIES):
+    """fetch_all() of a single source."""
+    return fetch_all([source], {source: validators}, headers, timeout,
+                     retries)[0]
@@ -0,0 +1,127 @@
+############################
+# LRU CACHE OF THE FIGURES #
+############################
+
+# The country charts only have a few hundred distinct (country, metric, axis
+# type) combinations, so FigureCache keeps the built figures instead of
+# rebuilding them through plotly express on every interaction. Entries belong
+# to one data version: reset() drops them when the refresher swaps in new
+# data. The cache is bounded both by number of entries and by an estimate of
+# the memory the figures' arrays use, evicting least recently used first.
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = int(os.environ.get('FIGURE_CACHE_ENTRIES', 1024))
+MAX_BYTES = int(os.environ.get('FIGURE_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Trace attributes that hold one value per point
+POINT_ATTRIBUTES = ['x', 'y', 'z', 'text', 'customdata', 'hovertemplate',
+                    'hovertext', 'locations']
+
+
+def _approx_size(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(len(str(v)) for v in value.flat)
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(8 + _approx_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+
+def figure_size(figure):
+    """Estimates the bytes held by the per-point arrays of `figure`,
+    animation frames included."""
+    size = 0
+    traces = list(figure.data)
+    for frame in figure.frames:
+        traces.extend(frame.data)
+    for trace in traces:
+        for attribute in POINT_ATTRIBUTES:
+            value = trace[attribute] if attribute in trace else None
+            if value is not None:
+                size += _approx_size(value)
+    return size
+
+
+class FigureCache:
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self._entries = OrderedDict()  # key -> (figure, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def reset(self, version):
+        """Drops every figure built from data older than `version`."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self._bytes = 0
+                self.version = version
+
+    def get(self, version, key, build):
+        """Returns the figure cached under `key`, building it on a miss.
+
+        Figures built from a `version` other than the current one (a request
+        that raced a refresh) are returned but not stored.
+        """
+        with self._lock:
+            if self.version is None:
+                self.version = version
+            cached = self._entries.get(key) if version == self.version else None
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        # Built outside the lock so misses on other keys are not serialized
+        figure = build()
+        self.put(version, key, figure)
+        return figure
+
+    def put(self, version, key, figure):
+        size = figure_size(figure)
+        with self._lock:
+            if version != self.version or size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (figure, size)
+            self._bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+            }
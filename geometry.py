@@ -0,0 +1,313 @@
+###############################
+# SIMPLIFIED COUNTRY GEOMETRY #
+###############################
+
+# The choropleth drew the countries with the geometry built into plotly,
+# whose detail and size the dashboard has no say in. This module reads
+# world_countries.json once and turns it into a topology: coordinates are
+# quantized to a QUANTIZATION x QUANTIZATION grid, and the country rings are
+# cut at the points where three or more boundaries meet into arcs, stored
+# once however many countries share them. Every arc is then simplified with
+# Douglas-Peucker at the tolerance of each of DETAILS, so the shared borders
+# of two countries are simplified the same way and never open gaps, and
+# re-quantized to the coarser grid of that detail.
+#
+# Each detail is served both as TopoJSON (delta-encoded arcs) and as GeoJSON,
+# and detail_for() picks the smallest one a client is happy with: 'low' for
+# phones and Save-Data requests. The TopoJSON has the layout of plotly's own
+# base maps (a 'countries' object of features with an ISO3 id and a `ct`
+# centroid), so the world maps load it in place of the world_110m.json
+# plotly.js would otherwise download from its CDN: the choropleths keep
+# locationmode ISO-3 and the page downloads one geometry, not two.
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+GEOMETRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'world_countries.json')
+
+# Grid the topology is built on
+QUANTIZATION = 100000
+
+# Detail -> (Douglas-Peucker tolerance in degrees, grid of the output)
+DETAILS = {
+    'high': (0.01, 100000),
+    'medium': (0.1, 10000),
+    'low': (0.4, 2000),
+}
+
+DEFAULT_DETAIL = os.environ.get('GEOMETRY_DETAIL', 'medium')
+
+# world_countries.json ids that differ from the codes of country_codes
+ID_FIXES = {
+    'Kosovo': 'RKS',
+    'South Sudan': 'SSD',
+    'Western Sahara': 'ESH',
+}
+
+
+def _polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    return geometry['coordinates']
+
+
+def douglas_peucker(points, tolerance):
+    """Mask of the points of a (n x 2) line kept at `tolerance`; the ends
+    are always kept."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last]
+        direction = end - start
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(inner - start).T)
+        else:
+            distances = np.abs(direction[0] * (inner[:, 1] - start[1])
+                               - direction[1] * (inner[:, 0] - start[0])) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.extend([(first, middle), (middle, last)])
+    return keep
+
+
+def _join(arcs, references):
+    """Points of a ring given as arc references (see Topology)."""
+    parts = [arcs[r] if r >= 0 else arcs[~r][::-1] for r in references]
+    return np.vstack([parts[0]] + [p[1:] for p in parts[1:]])
+
+
+def centroid(rings):
+    """[lon, lat] of the centroid of the largest of the outer `rings`
+    ((n x 2) arrays of degrees), where plotly puts the hover label."""
+    largest, point = 0, None
+    for ring in rings:
+        x, y = ring[:, 0], ring[:, 1]
+        cross = x * np.roll(y, -1) - np.roll(x, -1) * y
+        area = cross.sum() / 2
+        if abs(area) > largest:
+            largest = abs(area)
+            point = [((x + np.roll(x, -1)) * cross).sum() / (6 * area),
+                     ((y + np.roll(y, -1)) * cross).sum() / (6 * area)]
+    if point is None:
+        # Rings flattened to lines or points
+        point = np.concatenate(rings).mean(axis=0)
+    return np.round(point, 2).tolist()
+
+
+class Topology:
+    """The features of a GeoJSON FeatureCollection as shared arcs.
+
+    `arcs` are (n x 2) int64 arrays of grid coordinates, and `shapes` give,
+    per feature, its polygons as lists of rings, a ring being a list of arc
+    references: i for arc i, ~i for arc i reversed (as in TopoJSON).
+    """
+
+    def __init__(self, collection, quantization=QUANTIZATION):
+        features = collection['features']
+        self.ids = [ID_FIXES.get(f['properties'].get('name'), f.get('id'))
+                    for f in features]
+        self.names = [f['properties'].get('name') for f in features]
+
+        rings = [np.asarray(ring, dtype=np.float64)
+                 for f in features for polygon in _polygons(f['geometry'])
+                 for ring in polygon]
+        every = np.concatenate(rings)
+        self.low = every.min(axis=0)
+        self.scale = (every.max(axis=0) - self.low) / (quantization - 1)
+        self.quantization = quantization
+
+        self.arcs = []
+        self._index = {}
+        quantized = iter(self._ring_points(rings))
+        self.shapes = [[[self._ring_arcs(next(quantized)) for _ in polygon]
+                        for polygon in _polygons(f['geometry'])]
+                       for f in features]
+
+    def _ring_points(self, rings):
+        """Quantized rings without their closing point, and the junctions."""
+        quantized = []
+        for ring in rings:
+            points = np.round((ring - self.low) / self.scale).astype(np.int64)
+            # Points merged by the grid, and the closing point
+            points = points[np.any(points != np.roll(points, -1, axis=0), axis=1)]
+            quantized.append(points)
+
+        # A junction is a point with three or more distinct neighbours
+        width = np.int64(self.quantization)
+        keys = [p[:, 0] * width + p[:, 1] for p in quantized]
+        edges = np.concatenate([np.stack([k, np.roll(k, -1)], axis=1)
+                                for k in keys if len(k)])
+        edges = np.unique(np.sort(edges, axis=1), axis=0)
+        points, degree = np.unique(edges, return_counts=True)
+        junctions = set(points[degree >= 3].tolist())
+        self._junctions = junctions
+        return [(p, k) for p, k in zip(quantized, keys)]
+
+    def _ring_arcs(self, ring):
+        points, keys = ring
+        if len(points) == 0:
+            return []
+        cuts = [i for i, key in enumerate(keys.tolist())
+                if key in self._junctions]
+        if not cuts:
+            # A ring touching no other boundary is one closed arc, starting
+            # at its smallest point so that it is found again whichever way
+            # round another ring has it
+            start = int(np.argmin(keys))
+            arc = np.roll(points, -start, axis=0)
+            return [self._arc(np.vstack([arc, arc[:1]]), closed=True)]
+        rotated = np.roll(points, -cuts[0], axis=0)
+        cuts = [c - cuts[0] for c in cuts] + [len(points)]
+        closed = np.vstack([rotated, rotated[:1]])
+        return [self._arc(closed[a:b + 1]) for a, b in zip(cuts, cuts[1:])]
+
+    def _arc(self, points, closed=False):
+        key = points.tobytes()
+        if key in self._index:
+            return self._index[key]
+        reverse = points[::-1]
+        if closed:
+            start = int(np.argmin(reverse[:-1, 0] * self.quantization
+                                  + reverse[:-1, 1]))
+            reverse = np.vstack([np.roll(reverse[:-1], -start, axis=0),
+                                 reverse[start:start + 1]])
+        if reverse.tobytes() in self._index:
+            return ~self._index[reverse.tobytes()]
+        self._index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return self._index[key]
+
+    def simplify(self, tolerance, quantization):
+        """Arcs simplified at `tolerance` (degrees) and quantized to a
+        `quantization` grid, and the transform of that grid."""
+        ratio = (self.quantization - 1) / (quantization - 1)
+        arcs = []
+        for arc in self.arcs:
+            degrees = arc * self.scale
+            keep = douglas_peucker(degrees, tolerance)
+            if np.array_equal(arc[0], arc[-1]) and keep.sum() < 4:
+                # A closed arc keeps at least a triangle: its start, the
+                # point farthest from it and the one farthest from both
+                start = np.hypot(*(degrees - degrees[0]).T)
+                far = int(np.argmax(start))
+                keep[far] = True
+                keep[np.argmax(start + np.hypot(*(degrees - degrees[far]).T))] = True
+            coarse = np.round(arc[keep] / ratio).astype(np.int64)
+            moved = np.ones(len(coarse), dtype=bool)
+            moved[1:] = np.any(np.diff(coarse, axis=0) != 0, axis=1)
+            arcs.append(coarse[moved])
+        return arcs, {'scale': (self.scale * ratio).tolist(),
+                      'translate': self.low.tolist()}
+
+    def topojson(self, arcs, transform):
+        scale = np.array(transform['scale'])
+        translate = np.array(transform['translate'])
+        geometries = []
+        for id_, name, polygons in zip(self.ids, self.names, self.shapes):
+            outer = [_join(arcs, polygon[0]) * scale + translate
+                     for polygon in polygons if polygon and polygon[0]]
+            geometry = {'id': id_,
+                        'properties': {'name': name, 'ct': centroid(outer)}}
+            if len(polygons) == 1:
+                geometry.update(type='Polygon', arcs=polygons[0])
+            else:
+                geometry.update(type='MultiPolygon', arcs=polygons)
+            geometries.append(geometry)
+        deltas = [np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist()
+                  for arc in arcs]
+        return {
+            'type': 'Topology',
+            'transform': transform,
+            'objects': {
+                'countries': {'type': 'GeometryCollection',
+                              'geometries': geometries}
+            },
+            'arcs': deltas,
+        }
+
+    def geojson(self, arcs, transform):
+        scale = np.array(transform['scale'])
+        translate = np.array(transform['translate'])
+        # As many decimals as one step of the grid needs
+        decimals = int(np.ceil(-np.log10(scale.min())))
+
+        def ring(references):
+            return np.round(_join(arcs, references) * scale + translate,
+                            decimals)
+
+        features = []
+        for id_, name, polygons in zip(self.ids, self.names, self.shapes):
+            coordinates = []
+            for polygon in polygons:
+                # Rings the simplification flattened are left out, and so
+                # are the polygons whose outer ring was
+                rings = [ring(r) for r in polygon]
+                if len(np.unique(rings[0], axis=0)) < 3:
+                    continue
+                coordinates.append([r.tolist() for r in rings
+                                    if len(np.unique(r, axis=0)) >= 3])
+            if not coordinates:
+                continue
+            geometry = ({'type': 'Polygon', 'coordinates': coordinates[0]}
+                        if len(coordinates) == 1 else
+                        {'type': 'MultiPolygon', 'coordinates': coordinates})
+            features.append({'type': 'Feature', 'id': id_,
+                             'properties': {'name': name},
+                             'geometry': geometry})
+        return {'type': 'FeatureCollection', 'features': features}
+
+
+def build(path=GEOMETRY_FILE, details=DETAILS):
+    """(version, detail -> {'topojson': ..., 'geojson': ...}) of `path`, the
+    version being a hash of the file."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    topology = Topology(json.loads(raw))
+    variants = {}
+    for detail, (tolerance, quantization) in details.items():
+        arcs, transform = topology.simplify(tolerance, quantization)
+        variants[detail] = {
+            'topojson': topology.topojson(arcs, transform),
+            'geojson': topology.geojson(arcs, transform),
+        }
+    return hashlib.sha256(raw).hexdigest()[:16], variants
+
+
+def detail_for(headers, args):
+    """The detail to send a client: the one it asks for with ?detail=, else
+    'low' for phones and Save-Data requests, else DEFAULT_DETAIL."""
+    detail = args.get('detail')
+    if detail in DETAILS:
+        return detail
+    if (headers.get('Save-Data', '').lower() == 'on'
+            or 'Mobi' in headers.get('User-Agent', '')):
+        return 'low'
+    return DEFAULT_DETAIL
+
+
+_geometry = None
+_lock = threading.Lock()
+
+
+def geometry():
+    """The process-wide (version, variants) of build(), built on first use."""
+    global _geometry
+    if _geometry is None:
+        with _lock:
+            if _geometry is None:
+                _geometry = build()
+    return _geometry
+
@@ -0,0 +1,96 @@
+#################################
+# WORLD BANK INDICATOR MATRICES #
+#################################
+
+# World Bank exports such as country_data.csv are wide: one row per country
+# and indicator, one column per year. Each indicator is read into a dense
+# (countries x years) float matrix, and the latest reported value of every
+# country is found with one vectorized pass over it, instead of melting the
+# file to one row per (country, year) and grouping.
+#
+# INDICATOR_COLUMNS maps a column of the country reference table to the
+# World Bank code of the indicator that fills it. Adding an indicator only
+# takes its export in INDICATOR_FILES and a line here.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+INDICATOR_FILES = os.environ.get(
+    'INDICATOR_FILES', os.path.join(HERE, 'country_data.csv')).split(os.pathsep)
+
+INDICATOR_COLUMNS = {
+    'over_65': 'SP.POP.65UP.TO.ZS',
+}
+
+ID_COLUMNS = ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+
+
+class Indicator:
+    """One indicator as a (countries x years) matrix, NaN where unreported."""
+
+    def __init__(self, code, name, countries, country_codes, years, values):
+        self.code = code
+        self.name = name
+        self.countries = countries
+        self.country_codes = country_codes
+        self.years = years
+        self.values = values
+
+    def latest(self):
+        """Latest reported value of each country and its year (NaN and -1
+        for countries that never reported one)."""
+        reported = ~np.isnan(self.values)
+        # argmax finds the first reported year of the reversed rows
+        last = self.values.shape[1] - 1 - np.argmax(reported[:, ::-1], axis=1)
+        found = reported.any(axis=1)
+        values = np.where(found, self.values[np.arange(len(last)), last], np.nan)
+        years = np.where(found, self.years[last], -1)
+        return values, years
+
+    def rows(self, codes, names):
+        """Row of each country, matched on its ISO3 code or else on its
+        name, -1 when the indicator does not have it."""
+        by_code = {code: row for row, code in enumerate(self.country_codes)}
+        by_name = {name: row for row, name in enumerate(self.countries)}
+        return np.array([
+            by_code.get(code, by_name.get(name, -1))
+            for code, name in zip(codes, names)
+        ], dtype=np.intp)
+
+
+def _year_columns(columns):
+    return [column for column in columns if str(column).isdigit()]
+
+
+def read_indicators(paths=INDICATOR_FILES):
+    """Reads the World Bank exports `paths` into one Indicator per indicator
+    code. Files covering different years are aligned on their union."""
+    frames = [pd.read_csv(path) for path in paths]
+    years = np.array(sorted({int(column) for frame in frames
+                             for column in _year_columns(frame.columns)}))
+
+    ids, blocks = [], []
+    for frame in frames:
+        columns = _year_columns(frame.columns)
+        block = np.full((len(frame), len(years)), np.nan)
+        block[:, np.searchsorted(years, [int(c) for c in columns])] = (
+            frame[columns].to_numpy(dtype=np.float64))
+        ids.append(frame[ID_COLUMNS])
+        blocks.append(block)
+    ids = pd.concat(ids, ignore_index=True)
+    values = np.concatenate(blocks) if blocks else np.zeros((0, len(years)))
+
+    indicators = {}
+    codes, uniques = pd.factorize(ids['Indicator Code'])
+    for i, code in enumerate(uniques):
+        rows = np.flatnonzero(codes == i)
+        indicators[code] = Indicator(
+            code, ids['Indicator Name'].iat[rows[0]],
+            ids['Country Name'].to_numpy(dtype=object)[rows],
+            ids['Country Code'].to_numpy(dtype=object)[rows],
+            years, values[rows])
+    return indicators
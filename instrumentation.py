@@ -0,0 +1,77 @@
+###########################
+# REQUEST INSTRUMENTATION #
+###########################
+
+# Logs how long every request took server-side and how many bytes it
+# returned, and exposes the duration to the browser through a Server-Timing
+# header (visible in the network tab of the dev tools). Dash callback
+# requests all share one path, so their log line also names the outputs.
+#
+# memory_report() sizes the in-memory frames and the worker process, since
+# memory is what limits the number of gunicorn workers per dyno.
+
+import logging
+import os
+import resource
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+
+def _label():
+    if request.path.endswith('_dash-update-component'):
+        body = request.get_json(silent=True) or {}
+        return f"{request.path} [{body.get('output', '')}]"
+    return request.path
+
+
+def instrument(server):
+    """Registers the timing hooks on a Flask `server`."""
+
+    @server.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @server.after_request
+    def record_timing(response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        duration = (time.perf_counter() - start) * 1000
+        size = response.calculate_content_length()
+        response.headers.add('Server-Timing', f'app;dur={duration:.1f}')
+        logger.info('%s %s %s %.1f ms %s bytes', request.method, _label(),
+                    response.status_code, duration,
+                    'streamed' if size is None else size)
+        return response
+
+    return server
+
+
+def worker_rss():
+    """Current resident set size of this process in bytes (peak where the
+    current value is not available)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def memory_report(frames):
+    """Deep size in bytes of each frame in `frames` plus the worker RSS."""
+    return {
+        'frames': {
+            name: int(frame.memory_usage(deep=True).sum())
+            for name, frame in frames.items()
+        },
+        'worker_rss': worker_rss(),
+        'pid': os.getpid(),
+    }
@@ -0,0 +1,209 @@
+###########################################
+# STREAMING LOADER OF THE JHU TIME SERIES #
+###########################################
+
+# The JHU/CSSE time series (time_series_covid19_*_global.csv and *_US.csv)
+# are wide: one row per region and one column per date. They used to be read
+# whole, melted to one row per (region, date) with every id column repeated,
+# and merged metric by metric on those string columns, which for the US
+# county files meant millions of object rows in memory at once.
+#
+# read_wide() streams a file in CHUNK_ROWS rows at a time straight into a
+# (regions x dates) int32 matrix, so only one chunk of parsed text exists at
+# any time, and keeps the id columns once per region. load() downloads the
+# file of every metric at once with fetch.fetch_each(), so it takes about as
+# long as the largest file rather than the sum of them, and reads each file
+# as soon as its download completes, dropping its bytes before taking the
+# next one: only the downloads not read yet are held whole. The rows of the
+# files are then lined up on the region key.
+
+import csv
+import io
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fetch import fetch, fetch_each
+
+logger = logging.getLogger(__name__)
+
+# URL (or local directory, with a trailing slash) the time series are read from
+BASE_URL = os.environ.get(
+    'JHU_BASE_URL',
+    'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/')
+
+# Rows parsed at a time
+CHUNK_ROWS = int(os.environ.get('JHU_CHUNK_ROWS', 500))
+
+DATE_FORMAT = '%m/%d/%y'
+
+GLOBAL_FILES = {
+    'Confirmed': 'time_series_covid19_confirmed_global.csv',
+    'Deaths': 'time_series_covid19_deaths_global.csv',
+}
+GLOBAL_KEY = ['Province/State', 'Country/Region']
+
+US_FILES = {
+    'Confirmed': 'time_series_covid19_confirmed_US.csv',
+    'Deaths': 'time_series_covid19_deaths_US.csv',
+}
+US_KEY = ['UID']
+
+
+class WideTimeSeries:
+    """Regions (one row each), their dates and one (regions x dates) int32
+    matrix per metric, rows in the order of `regions`."""
+
+    def __init__(self, regions, dates, values):
+        self.regions = regions
+        self.dates = dates
+        self.values = values
+
+    def rows(self, **conditions):
+        """Positions of the regions whose columns equal `conditions`."""
+        mask = np.ones(len(self.regions), dtype=bool)
+        for column, value in conditions.items():
+            mask &= (self.regions[column] == value).to_numpy()
+        return np.flatnonzero(mask)
+
+    def total(self, metric, rows):
+        """Sum over `rows` of `metric`, one int64 value per date."""
+        return self.values[metric][rows].sum(axis=0, dtype=np.int64)
+
+
+def _is_date(column):
+    try:
+        datetime.strptime(column, DATE_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def read_wide(source, chunk_rows=CHUNK_ROWS, capacity=None, body=None):
+    """Reads one wide time series file into (regions, dates, values).
+
+    `capacity` is the expected number of regions; the matrix is allocated
+    for that many rows (chunk_rows if unknown) and doubled when exceeded.
+    `body`, if given, holds the bytes of `source` already downloaded.
+    """
+    if body is None:
+        body = fetch(source).body
+    with io.BytesIO(body) as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        date_columns = [column for column in header if _is_date(column)]
+        id_columns = [column for column in header if not _is_date(column)]
+
+        values = np.empty((capacity or chunk_rows, len(date_columns)), np.int32)
+        ids = []
+        n = 0
+        # Counts are parsed as floats so that a blank cell does not fail
+        # the whole file
+        chunks = pd.read_csv(f, header=None, names=header, chunksize=chunk_rows,
+                             dtype={column: np.float64 for column in date_columns})
+        for chunk in chunks:
+            if n + len(chunk) > len(values):
+                grown = np.empty((max(2 * len(values), n + len(chunk)),
+                                  len(date_columns)), np.int32)
+                grown[:n] = values[:n]
+                values = grown
+            block = chunk[date_columns].to_numpy()
+            missing = np.isnan(block)
+            if missing.any():
+                logger.warning('%d blank counts in %s read as 0',
+                               missing.sum(), source)
+                block[missing] = 0
+            values[n:n + len(chunk)] = block
+            ids.append(chunk[id_columns])
+            n += len(chunk)
+
+    if n < len(values):
+        values = values[:n].copy()
+    regions = (pd.concat(ids, ignore_index=True) if ids
+               else pd.DataFrame(columns=id_columns))
+    dates = pd.to_datetime(date_columns, format=DATE_FORMAT)
+    return regions, dates, values
+
+
+def _align(regions, other, key):
+    # Position in `other` of every region of `regions`, -1 if it is missing
+    left = pd.MultiIndex.from_frame(regions[key].fillna(''))
+    right = pd.MultiIndex.from_frame(other[key].fillna(''))
+    return right.get_indexer(left)
+
+
+def _read_each(sources, chunk_rows, validators=None):
+    """Reads `sources` (source -> metric) as their downloads complete:
+    (metric -> (regions, dates, values), source -> validators), the first
+    empty when `validators` show that no source changed."""
+    read, unchanged, latest = {}, [], {}
+    capacity = None
+    for source, fetched in fetch_each(list(sources), validators):
+        latest[source] = fetched.validators
+        if fetched.modified:
+            read[sources[source]] = read_wide(source, chunk_rows, capacity,
+                                              body=fetched.body)
+            # The files list the same regions
+            capacity = len(read[sources[source]][0])
+        else:
+            unchanged.append(source)
+        del fetched
+    if read and unchanged:
+        # The files are updated together, but one that has not been yet is
+        # still needed in full
+        more, validators = _read_each({s: sources[s] for s in unchanged},
+                                      chunk_rows)
+        read.update(more)
+        latest.update(validators)
+    return read, latest
+
+
+def load_modified(files=GLOBAL_FILES, key=GLOBAL_KEY, validators=None,
+                  base_url=BASE_URL, chunk_rows=CHUNK_ROWS):
+    """load() returning (series, validators), or None when `validators`,
+    those returned by an earlier call, show that no file changed since."""
+    sources = {base_url + name: metric for metric, name in files.items()}
+    read, latest = _read_each(sources, chunk_rows, validators)
+    if not read:
+        return None
+
+    regions = dates = None
+    values = {}
+    for metric, name in files.items():
+        metric_regions, metric_dates, matrix = read.pop(metric)
+        if regions is None:
+            regions, dates = metric_regions, metric_dates
+        else:
+            rows = _align(regions, metric_regions, key)
+            if not np.array_equal(rows, np.arange(len(regions))):
+                aligned = matrix[rows]
+                aligned[rows < 0] = 0
+                matrix = aligned
+                if (rows < 0).any():
+                    logger.warning('%d regions missing from %s',
+                                   (rows < 0).sum(), name)
+            width = min(len(dates), len(metric_dates))
+            if not dates[:width].equals(metric_dates[:width]):
+                raise ValueError(f'{name} does not share the dates of '
+                                 f'{files[next(iter(files))]}')
+            dates = dates[:width]
+        values[metric] = matrix
+
+    width = len(dates)
+    for metric, matrix in values.items():
+        if matrix.shape[1] != width:
+            values[metric] = np.ascontiguousarray(matrix[:, :width])
+    return WideTimeSeries(regions, dates, values), latest
+
+
+def load(files=GLOBAL_FILES, key=GLOBAL_KEY, base_url=BASE_URL,
+         chunk_rows=CHUNK_ROWS):
+    """Reads one file per metric of `files` (metric -> file name under
+    `base_url`) into a WideTimeSeries.
+
+    The rows of every metric are lined up on the regions of the first file
+    by the `key` columns, and the dates cut to those all files have.
+    """
+    return load_modified(files, key, None, base_url, chunk_rows)[0]
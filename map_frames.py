@@ -0,0 +1,79 @@
+####################################
+# FRAMES OF THE CHOROPLETH HISTORY #
+####################################
+
+# The animated map shows log10 of the confirmed cases of every country on
+# every date. px.choropleth(animation_frame=...) repeats the locations, the
+# hover text and the trace styling in every frame, which over the whole
+# history is megabytes of JSON. Here the (dates x countries) matrix of values
+# is computed once per data load; the map trace carries the locations and
+# names, each frame only its row of z, and the frames are sent PAGE_DAYS
+# dates at a time, the page being picked with a slider.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from daily_deltas import segment_starts
+
+# Dates per page of frames
+PAGE_DAYS = int(os.environ.get('MAP_PAGE_DAYS', 30))
+
+
+class ChoroplethFrames:
+    """log10 confirmed cases as a (dates x countries) float32 matrix, NaN
+    where a country had no case yet."""
+
+    def __init__(self, grouped_country, codes, page_days=PAGE_DAYS):
+        # grouped_country is sorted by country, so each country is one block
+        # of rows; only countries with an ISO code can be drawn
+        country_codes, countries = pd.factorize(grouped_country['Country'])
+        countries = np.asarray(countries, dtype=object).astype(str)
+        located = np.array([isinstance(codes.get(c), str) for c in countries],
+                           dtype=bool)
+        rows = located[country_codes]
+        country_codes = country_codes[rows]
+        dates = grouped_country['Date'].to_numpy()[rows]
+        confirmed = grouped_country['Confirmed'].to_numpy()[rows]
+
+        starts = segment_starts(country_codes)
+        self.names = list(countries[country_codes[starts]])
+        self.locations = [codes[name] for name in self.names]
+        columns = np.repeat(np.arange(len(starts)),
+                            np.diff(np.append(starts, len(country_codes))))
+
+        self.dates = np.unique(dates)
+        rows = np.searchsorted(self.dates, dates)
+        self.z = np.full((len(self.dates), len(self.names)), np.nan, np.float32)
+        with np.errstate(divide='ignore'):
+            values = np.log10(confirmed.astype(np.float64))
+        values[confirmed <= 0] = np.nan
+        self.z[rows, columns] = values
+        # One color scale for all the dates
+        self.zmax = float(np.nanmax(self.z)) if np.isfinite(self.z).any() else 1.0
+        self.page_days = page_days
+
+    @property
+    def pages(self):
+        return max(-(-len(self.dates) // self.page_days), 1)
+
+    def page_dates(self, page):
+        """Range of the date positions on `page`."""
+        return range(page * self.page_days,
+                     min((page + 1) * self.page_days, len(self.dates)))
+
+    def label(self, position):
+        return str(self.dates[position])[:10]
+
+    def values(self, position):
+        """z of the date at `position`, rounded to keep the payload small."""
+        return np.round(self.z[position].astype(np.float64), 2)
+
+    def frames(self, page):
+        """The frames of `page`: a name and the z of the map trace each."""
+        return [{
+            'name': self.label(position),
+            'data': [{'type': 'choropleth', 'z': self.values(position)}],
+            'traces': [0],
+        } for position in self.page_dates(page)]
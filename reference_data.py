@@ -0,0 +1,190 @@
+###########################
+# COUNTRY REFERENCE TABLE #
+###########################
+
+# Everything the app knows about a country besides its case counts (ISO3
+# code, share of the population over 65, population, human development
+# index) used to come from separate pickles in pickled_files/, each mapped
+# over whole frames. It now lives in one table loaded once per process from
+# country_metadata.csv: one row per ISO3 code, one NumPy array per column.
+# A binary copy of the table (.npz, no pickle) is cached next to the data
+# snapshots and reused while the CSV is unchanged.
+#
+# country_metadata.csv was exported from the pickles the notebooks produced,
+# which named the same country several ways ('US', 'United States'); their
+# rows were merged per ISO3 code under the name the data source uses, and
+# frames are joined on the code country_codes.py resolves, so a country
+# named differently upstream still finds its row. Columns filled from World Bank
+# indicators (see indicators.py) are refreshed from the indicator files when
+# the table is loaded; the CSV's own values only remain for countries the
+# World Bank does not report on.
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from snapshot_cache import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'country_metadata.csv')
+
+COLUMNS = ['code', 'over_65', 'population', 'humanDevelopmentIndex']
+
+
+class ReferenceTable:
+    """Country metadata keyed by ISO3 code, stored column-wise. `names`
+    are the country names of the data source."""
+
+    def __init__(self, names, columns):
+        self.names = np.asarray(names, dtype=object)
+        self.columns = columns
+        self.rows = {code: row for row, code in enumerate(columns['code'])
+                     if isinstance(code, str) and code}
+        self._reported = set()
+
+    @classmethod
+    def from_csv(cls, path):
+        table = pd.read_csv(path, dtype={'code': str})
+        columns = {
+            'code': table['code'].to_numpy(dtype=object),
+            'over_65': table['over_65'].to_numpy(dtype=np.float64),
+            'population': table['population'].to_numpy(dtype=np.float64),
+            'humanDevelopmentIndex':
+            table['humanDevelopmentIndex'].to_numpy(dtype=np.float64),
+        }
+        return cls(table['Country'], columns)
+
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            columns = {column: data[column]
+                       for column in data.files if column != 'names'}
+            names = data['names'].astype(object)
+        # Missing codes are stored as empty strings
+        code = columns['code'].astype(object)
+        code[code == ''] = np.nan
+        columns['code'] = code
+        return cls(names, columns)
+
+    def save_npz(self, path):
+        code = np.where(pd.isna(self.columns['code']), '',
+                        self.columns['code']).astype(str)
+        fd, tmp = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f,
+                     names=self.names.astype(str),
+                     code=code,
+                     **{column: values for column, values
+                        in self.columns.items() if column != 'code'})
+        os.replace(tmp, path)
+
+    def fill_from_indicator(self, name, indicator):
+        """Sets column `name` to the latest value of `indicator` (an
+        indicators.Indicator), keeping the current value where it has none."""
+        rows = indicator.rows(self.columns['code'], self.names)
+        latest, _ = indicator.latest()
+        values = np.where(rows >= 0, latest[rows], np.nan)
+        current = self.columns.get(name)
+        if current is not None:
+            values = np.where(np.isnan(values), current, values)
+        self.columns[name] = values
+
+    def lookup(self, codes):
+        """Row of each of the ISO3 `codes` in the table, -1 when unknown."""
+        return np.array([self.rows.get(code, -1) for code in codes],
+                        dtype=np.intp)
+
+    def column(self, name, rows):
+        """Values of column `name` for `rows` (from lookup()), NaN for -1."""
+        values = self.columns[name]
+        result = values[rows]
+        if values.dtype != object:
+            result = result.astype(np.float64)
+        result[rows < 0] = np.nan
+        return result
+
+    def join(self, frame, columns=COLUMNS):
+        """Adds `columns` to `frame` (one row per country) by its code."""
+        rows = self.lookup(frame['code'])
+        for name in columns:
+            frame[name] = self.column(name, rows)
+        self.report_unmapped(frame['Country'], rows, columns)
+        return frame
+
+    def report_unmapped(self, countries, rows, columns=COLUMNS):
+        """Logs, once per country, the countries missing from the table or
+        missing one of `columns`."""
+        missing = {}
+        for name in columns:
+            values = self.column(name, rows)
+            for country in np.asarray(countries, dtype=object)[pd.isna(values)]:
+                if country not in self._reported:
+                    missing.setdefault(country, []).append(name)
+        for country, names in sorted(missing.items()):
+            self._reported.add(country)
+            logger.warning('No %s for %s in %s', ', '.join(names), country,
+                           os.path.basename(METADATA_FILE))
+
+
+def version(path=METADATA_FILE, indicator_files=indicators.INDICATOR_FILES):
+    """Digest of the files the table of `path` is built from and of the
+    columns the indicators fill."""
+    digest = hashlib.sha256()
+    for name in [path] + list(indicator_files):
+        with open(name, 'rb') as f:
+            digest.update(f.read())
+    digest.update(repr(sorted(indicators.INDICATOR_COLUMNS.items())).encode())
+    return digest.hexdigest()[:16]
+
+
+def _cache_path(version, snapshot_dir):
+    return os.path.join(snapshot_dir, f'reference-{version}.npz')
+
+
+def load(path=METADATA_FILE, indicator_files=indicators.INDICATOR_FILES,
+         snapshot_dir=SNAPSHOT_DIR):
+    """Returns the table of `path` with its indicator columns filled from
+    `indicator_files`, from its binary cache when it is fresh."""
+    cache = _cache_path(version(path, indicator_files), snapshot_dir)
+    if os.path.exists(cache):
+        try:
+            return ReferenceTable.from_npz(cache)
+        except (OSError, ValueError, KeyError):
+            logger.exception('Reading %s failed', cache)
+
+    table = ReferenceTable.from_csv(path)
+    by_code = indicators.read_indicators(indicator_files)
+    for column, code in indicators.INDICATOR_COLUMNS.items():
+        if code in by_code:
+            table.fill_from_indicator(column, by_code[code])
+        else:
+            logger.warning('Indicator %s (%s) is in none of %s', code, column,
+                           ', '.join(indicator_files))
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        table.save_npz(cache)
+    except OSError:
+        logger.exception('Writing %s failed', cache)
+    return table
+
+
+_table = None
+_lock = threading.Lock()
+
+
+def table():
+    """The process-wide reference table, loaded on first use."""
+    global _table
+    if _table is None:
+        with _lock:
+            if _table is None:
+                _table = load()
+    return _table
@@ -0,0 +1,255 @@
+############################################
+# ON-DISK COLUMNAR SNAPSHOTS OF THE FRAMES #
+############################################
+
+# Parsing countries-aggregated.csv and re-running the groupbys is most of the
+# time a worker spends before it can serve. The frames returned by
+# datasets.transform_data() are written once per source version as one .npy
+# file per column; later boots read them back into frames, so nothing is
+# parsed or aggregated. The frames are copies in each worker's memory (the
+# DataFrame, categorical and object columns are built from the files); only
+# columns() serves the files memory-mapped, to the bulk export.
+#
+# Every source version gets its own snapshot, so save() removes all but the
+# SNAPSHOT_KEEP most recent ones.
+#
+# The frames also depend on data besides the source, such as the country
+# metadata joined to the totals. The caller sums that up in a `reference`
+# digest stored in the manifest; a snapshot with another one is not loaded,
+# and is replaced by the next save() of its version.
+#
+# Layout:  SNAPSHOT_DIR/<version>/manifest.json
+#          SNAPSHOT_DIR/<version>/<frame>/<column>.npy
+#          SNAPSHOT_DIR/<version>/<frame>/<column>.categories.json
+#          SNAPSHOT_DIR/LATEST  (version of the last snapshot written)
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+
+# Snapshots kept on disk, the one just written included
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 3))
+
+# Bump when the on-disk layout or the frames produced by transform_data change
+FORMAT_VERSION = 8
+
+LATEST = 'LATEST'
+
+
+def _column_files(frame_dir, column):
+    return (os.path.join(frame_dir, column + '.npy'),
+            os.path.join(frame_dir, column + '.categories.json'))
+
+
+def _write_frame(frame, frame_dir):
+    os.makedirs(frame_dir)
+    columns = []
+    for column in frame.columns:
+        values = frame[column]
+        data_file, categories_file = _column_files(frame_dir, column)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Categoricals already are codes into their categories
+            np.save(data_file, values.cat.codes.to_numpy())
+            with open(categories_file, 'w') as f:
+                json.dump(list(values.cat.categories), f)
+            columns.append({'name': column, 'kind': 'category'})
+        elif values.dtype == object:
+            # Object columns (country names, codes, the odd 'no data' among
+            # numbers) are stored as integer codes into a JSON list of their
+            # distinct values; -1 marks missing values
+            codes, categories = pd.factorize(values)
+            np.save(data_file, codes.astype(np.int32))
+            with open(categories_file, 'w') as f:
+                json.dump(list(categories), f)
+            columns.append({'name': column, 'kind': 'categorical'})
+        else:
+            np.save(data_file, values.to_numpy())
+            columns.append({'name': column, 'kind': 'array'})
+    return columns
+
+
+def _read_columns(frame_dir, columns):
+    """(column, values, categories) of the columns of a frame, the values
+    memory-mapped and the categories None for plain arrays."""
+    for column in columns:
+        data_file, categories_file = _column_files(frame_dir, column['name'])
+        values = np.load(data_file, mmap_mode='r')
+        categories = None
+        if column['kind'] != 'array':
+            with open(categories_file) as f:
+                categories = json.load(f)
+        yield column, values, categories
+
+
+def _read_frame(frame_dir, columns):
+    data = {}
+    for column, values, categories in _read_columns(frame_dir, columns):
+        if column['kind'] == 'categorical':
+            # Code -1 picks the trailing NaN
+            values = np.array(categories + [np.nan], dtype=object)[values]
+        elif column['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, categories)
+        data[column['name']] = values
+    return pd.DataFrame(data, columns=[c['name'] for c in columns])
+
+
+def snapshot_path(version, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, version)
+
+
+def save(version,
+         frames,
+         loaded_at=None,
+         snapshot_dir=SNAPSHOT_DIR,
+         cursor=None,
+         reference=None):
+    """Writes `frames` (a dict of DataFrames) as the snapshot of `version`.
+
+    `cursor` records how far into the source the frames go (see
+    data_refresh.make_cursor), so a worker starting from the snapshot can
+    append to it. `reference` is the digest of the other data the frames
+    were built from (see load()).
+
+    The snapshot is written to a temporary directory and renamed into place,
+    so concurrent workers never see a partial snapshot; whichever worker
+    renames first wins and the others discard their copy.
+    """
+    target = snapshot_path(version, snapshot_dir)
+    if _manifest(version, snapshot_dir, reference) is not None:
+        return target
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.' + version + '-', dir=snapshot_dir)
+    try:
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'loaded_at': (loaded_at or datetime.now()).isoformat(),
+            'cursor': cursor,
+            'reference': reference,
+            'frames': {},
+        }
+        for name, frame in frames.items():
+            manifest['frames'][name] = _write_frame(frame,
+                                                    os.path.join(tmp, name))
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        if os.path.isdir(target):
+            # A snapshot of another format or reference data
+            os.rename(target, tmp + '.stale')
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(target):
+            raise
+    else:
+        logger.info('Wrote snapshot %s', target)
+    finally:
+        shutil.rmtree(tmp + '.stale', ignore_errors=True)
+
+    _write_latest(version, snapshot_dir)
+    prune(snapshot_dir, keep=version)
+    return target
+
+
+def prune(snapshot_dir=SNAPSHOT_DIR, count=None, keep=None):
+    """Removes all but the `count` (SNAPSHOT_KEEP) most recently written
+    snapshots, never that of version `keep`.
+
+    A worker still exporting from a removed snapshot keeps reading the files
+    it has open; one that has not opened them yet falls back to its frames.
+    """
+    count = SNAPSHOT_KEEP if count is None else count
+    snapshots = []
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        # Temporary directories of snapshots being written start with a dot
+        if name.startswith('.') or name == keep or not os.path.isfile(
+                os.path.join(path, 'manifest.json')):
+            continue
+        try:
+            snapshots.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    snapshots.sort(reverse=True)
+    for _, path in snapshots[max(count - (keep is not None), 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info('Removed snapshot %s', path)
+
+
+def _write_latest(version, snapshot_dir):
+    fd, tmp = tempfile.mkstemp(dir=snapshot_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(snapshot_dir, LATEST))
+
+
+def latest_version(snapshot_dir=SNAPSHOT_DIR):
+    """Returns the version of the last snapshot written, or None."""
+    try:
+        with open(os.path.join(snapshot_dir, LATEST)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _manifest(version, snapshot_dir, reference=None):
+    if not version:
+        return None
+    try:
+        with open(os.path.join(snapshot_path(version, snapshot_dir),
+                               'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION:
+        return None
+    if reference is not None and manifest.get('reference') != reference:
+        return None
+    return manifest
+
+
+def load(version, snapshot_dir=SNAPSHOT_DIR, reference=None):
+    """Returns (frames, meta) for `version`, or None if there is no usable
+    snapshot of it, or, when `reference` is given, the snapshot was saved
+    with another. `meta` holds the `loaded_at` datetime and the `cursor`
+    given to save()."""
+    manifest = _manifest(version, snapshot_dir, reference)
+    if manifest is None:
+        return None
+
+    target = snapshot_path(version, snapshot_dir)
+    frames = {
+        name: _read_frame(os.path.join(target, name), columns)
+        for name, columns in manifest['frames'].items()
+    }
+    meta = {
+        'loaded_at': datetime.fromisoformat(manifest['loaded_at']),
+        'cursor': manifest.get('cursor'),
+    }
+    return frames, meta
+
+
+def columns(version, frame, snapshot_dir=SNAPSHOT_DIR):
+    """Returns the columns of `frame` in the snapshot of `version` as a list
+    of (name, values, categories), or None if there is no usable snapshot of
+    it. The values are memory-mapped as stored: categorical columns are
+    integer codes (-1 for missing values) into the list `categories`, which
+    is None for the other columns."""
+    manifest = _manifest(version, snapshot_dir)
+    if manifest is None or frame not in manifest['frames']:
+        return None
+    frame_dir = os.path.join(snapshot_path(version, snapshot_dir), frame)
+    return [(column['name'], values, categories)
+            for column, values, categories
+            in _read_columns(frame_dir, manifest['frames'][frame])]
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the caches the modules write at import or first use out of the tree
+os.environ.setdefault('SNAPSHOT_DIR', tempfile.mkdtemp())
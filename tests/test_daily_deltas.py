@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from daily_deltas import segment_starts, segmented_diff
+
+
+def random_history(rng):
+    """Cumulative totals of up to 30 countries with 1 to 60 days each."""
+    days = rng.integers(1, 60, size=rng.integers(1, 30))
+    frame = pd.DataFrame({
+        'Country': np.repeat(np.arange(len(days)), days),
+        'Confirmed': rng.integers(0, 100, size=days.sum()),
+    })
+    frame['Confirmed'] = frame.groupby('Country')['Confirmed'].cumsum()
+    return frame
+
+
+def reference(frame):
+    return frame.groupby('Country')['Confirmed'].diff().fillna(0).to_numpy()
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_full_history_matches_groupby_diff(seed):
+    frame = random_history(np.random.default_rng(seed))
+    starts = segment_starts(frame['Country'].to_numpy())
+    deltas = segmented_diff(frame['Confirmed'].to_numpy(), starts)
+    assert np.array_equal(deltas, reference(frame))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_appended_dates_match_groupby_diff(seed):
+    rng = np.random.default_rng(seed)
+    frame = random_history(rng)
+    # Each country's last days are appended to the rest of its history;
+    # those whose whole history is appended have none before it
+    lengths = frame.groupby('Country').size().to_numpy()
+    split = rng.integers(1, lengths + 1)
+    countries = frame['Country'].to_numpy()
+    day = frame.groupby('Country').cumcount().to_numpy()
+    appended = day >= (lengths - split)[countries]
+    block = frame[appended]
+
+    history = frame[~appended].groupby('Country')['Confirmed'].last()
+    starts = segment_starts(block['Country'].to_numpy())
+    previous = (block['Country'].iloc[starts].map(history)
+                .to_numpy(dtype=np.float64))
+    deltas = segmented_diff(block['Confirmed'].to_numpy(), starts, previous)
+    assert np.array_equal(deltas, reference(frame)[appended])
+
+
+def test_empty():
+    assert not len(segment_starts(np.array([], dtype=np.int64)))
+    assert not len(segmented_diff(np.array([], dtype=np.int64),
+                                  np.zeros(0, dtype=np.intp)))
@@ -0,0 +1,171 @@
+import base64
+import csv
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+
+import data_api
+from country_index import CountryIndex
+from datasets import transform_data
+
+COUNTRIES = ['France', 'Italy', 'Korea, South', 'US']
+DAYS = 20
+
+
+def world_data():
+    dates = pd.date_range('2020-03-01', periods=DAYS)
+    confirmed = np.cumsum(np.full((len(COUNTRIES), DAYS), 100), axis=1)
+    confirmed *= np.arange(1, len(COUNTRIES) + 1)[:, None]
+    return pd.DataFrame({
+        'Date': np.tile(dates, len(COUNTRIES)),
+        'Country': np.repeat(COUNTRIES, DAYS),
+        'Confirmed': confirmed.ravel(),
+        'Recovered': 0,
+        'Deaths': confirmed.ravel() // 20,
+    })
+
+
+def build_state(version):
+    frames = transform_data(world_data())
+    return {
+        'version': version,
+        'country_index': CountryIndex(frames['grouped_country']),
+        'correlations': {},
+        'api_tables': data_api.tables(frames['grouped']),
+    }
+
+
+@pytest.fixture
+def api():
+    server = Flask(__name__)
+    api = {'state': build_state('v1')}
+    data_api.register(server, lambda: api['state'])
+    api['client'] = server.test_client()
+    return api
+
+
+def cursor(version, offset):
+    raw = json.dumps([version, offset]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def next_link(response):
+    link = response.headers.get('Link')
+    if link is None:
+        return None
+    assert link.endswith('>; rel="next"')
+    return link[1:link.index('>')]
+
+
+def test_pages_follow_the_link_header_to_every_row(api):
+    url = '/api/v1/totals?limit=3'
+    pages = []
+    while url is not None:
+        response = api['client'].get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['data']) <= 3
+        assert page['total'] == len(COUNTRIES)
+        pages.append(page)
+        url = next_link(response)
+        if url is not None:
+            assert 'limit=3' in url
+            assert f'cursor={page["next"]}' in url
+        else:
+            assert page['next'] is None
+    assert len(pages) == 2
+    rows = [row['Country'] for page in pages for row in page['data']]
+    assert sorted(rows) == COUNTRIES
+
+
+def test_series_link_keeps_the_country_in_the_path(api):
+    response = api['client'].get('/api/v1/series/US?limit=5')
+    url = next_link(response)
+    assert url.startswith('/api/v1/series/US?')
+    assert 'country=' not in url
+    second = api['client'].get(url).get_json()
+    assert second['data'][0]['Date'] == '2020-03-06'
+
+
+@pytest.mark.parametrize('value', [
+    'not a cursor', cursor('v1', -1), cursor('v1', 'x'),
+    base64.urlsafe_b64encode(b'{"v1": 3}').decode(),
+    base64.urlsafe_b64encode(b'["v1", 3, 4]').decode(),
+])
+def test_invalid_cursors_are_400(api, value):
+    response = api['client'].get('/api/v1/totals', query_string={'cursor': value})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+
+def test_cursor_of_an_older_version_is_410(api):
+    response = api['client'].get('/api/v1/totals?limit=1')
+    api['state'] = build_state('v2')
+    assert api['client'].get(next_link(response)).status_code == 410
+
+
+def test_fields(api):
+    page = api['client'].get('/api/v1/totals?fields=Deaths,Confirmed').get_json()
+    assert page['fields'] == ['Country', 'Deaths', 'Confirmed']
+    assert set(page['data'][0]) == {'Country', 'Deaths', 'Confirmed'}
+
+    response = api['client'].get('/api/v1/totals?fields=Confirmed,votes')
+    assert response.status_code == 400
+    assert 'votes' in response.get_json()['error']
+
+
+def test_start_and_end_are_inclusive(api):
+    page = api['client'].get(
+        '/api/v1/series/Italy?start=2020-03-05&end=2020-03-07').get_json()
+    assert [row['Date'] for row in page['data']] == [
+        '2020-03-05', '2020-03-06', '2020-03-07']
+    assert page['total'] == 3
+
+    response = api['client'].get('/api/v1/series/Italy?start=yesterday')
+    assert response.status_code == 400
+    assert api['client'].get('/api/v1/series/Atlantis').status_code == 404
+
+
+def test_csv(api):
+    response = api['client'].get('/api/v1/series/France?format=csv&limit=4'
+                                 '&fields=Confirmed')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['Date', 'Confirmed']
+    assert rows[1:] == [[f'2020-03-0{day}', str(100 * day)]
+                        for day in range(1, 5)]
+    assert 'format=csv' in next_link(response)
+
+    response = api['client'].get('/api/v1/totals?format=xml')
+    assert response.status_code == 400
+
+
+def test_if_none_match_is_304_until_the_data_changes(api):
+    response = api['client'].get('/api/v1/cfr')
+    tag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    cached = api['client'].get('/api/v1/cfr', headers={'If-None-Match': tag})
+    assert cached.status_code == 304
+    assert cached.get_data() == b''
+
+    # Another request or another version of the data is another tag
+    other = api['client'].get('/api/v1/cfr?limit=2',
+                              headers={'If-None-Match': tag})
+    assert other.status_code == 200
+    api['state'] = build_state('v2')
+    updated = api['client'].get('/api/v1/cfr', headers={'If-None-Match': tag})
+    assert updated.status_code == 200
+    assert updated.headers['ETag'] != tag
+
+
+def test_503_while_loading(api):
+    api['state'] = None
+    response = api['client'].get('/api/v1/countries')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
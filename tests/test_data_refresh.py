@@ -0,0 +1,112 @@
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.fixtures import Fixture
+from data_refresh import (CHECK_WINDOW, DataRefresher, parse_world_data,
+                          source_version)
+from datasets import append_data, transform_data
+
+COUNTRIES = ['France', 'Italy', 'Korea, South', 'US']
+# Long enough for the first date to be outside data_refresh.CHECK_WINDOW
+HISTORY_DAYS = 100
+
+
+def full_frames(fixture):
+    with open(fixture.path, 'rb') as f:
+        return transform_data(parse_world_data(f.read()))
+
+
+def full_version(fixture):
+    with open(fixture.path, 'rb') as f:
+        return source_version(f.read())
+
+
+@pytest.fixture
+def fixture(tmp_path):
+    fixture = Fixture(str(tmp_path / 'countries-aggregated.csv'), COUNTRIES)
+    for _ in range(HISTORY_DAYS):
+        fixture.add_day()
+    return fixture
+
+
+def refresher(fixture, tmp_path, name='snapshots', **kwargs):
+    full_loads = []
+
+    def transform(world_data):
+        full_loads.append(len(world_data))
+        return transform_data(world_data)
+
+    refresher = DataRefresher(transform, dict, source=fixture.path,
+                              snapshot_dir=str(tmp_path / name),
+                              append=append_data, **kwargs)
+    refresher.full_loads = full_loads
+    return refresher
+
+
+def assert_same_frames(actual, expected):
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(actual[name].reset_index(drop=True),
+                                      frame.reset_index(drop=True))
+
+
+def test_appended_days_match_a_full_load(fixture, tmp_path):
+    daily = refresher(fixture, tmp_path)
+    assert daily.refresh()
+    for _ in range(5):
+        fixture.add_day()
+        assert daily.refresh()
+        assert_same_frames(daily._frames, full_frames(fixture))
+        assert daily.state['version'] == full_version(fixture)
+    assert len(daily.full_loads) == 1
+    assert not daily.refresh()
+
+
+def test_version_does_not_depend_on_refresh_timing(fixture, tmp_path):
+    daily = refresher(fixture, tmp_path, 'daily')
+    weekly = refresher(fixture, tmp_path, 'weekly')
+    daily.refresh()
+    weekly.refresh()
+    for _ in range(7):
+        fixture.add_day()
+        daily.refresh()
+    weekly.refresh()
+    assert len(daily.full_loads) == len(weekly.full_loads) == 1
+    assert daily.state['version'] == weekly.state['version']
+    assert daily.state['version'] == full_version(fixture)
+
+
+def test_revision_of_a_past_day_is_picked_up_by_a_full_reload(fixture,
+                                                              tmp_path):
+    appending = refresher(fixture, tmp_path)
+    appending.refresh()
+    version = appending.state['version']
+    assert os.path.getsize(fixture.path) > 2 * CHECK_WINDOW
+    fixture.revise_first_day()
+    # Past the check window, appending cannot see the revision...
+    assert not appending.refresh()
+    assert appending.state['version'] == version
+
+    # ...until the next full reload
+    appending.full_reload_interval = 0
+    assert appending.refresh()
+    assert len(appending.full_loads) == 2
+    assert appending.state['version'] == full_version(fixture) != version
+    assert_same_frames(appending._frames, full_frames(fixture))
+
+
+def test_snapshot_of_other_reference_data_is_rebuilt(fixture, tmp_path):
+    before = refresher(fixture, tmp_path, reference='before')
+    before.refresh()
+    assert refresher(fixture, tmp_path, reference='before').load_snapshot()
+
+    # A restart with other reference data neither serves the snapshot...
+    after = refresher(fixture, tmp_path, reference='after')
+    assert not after.load_snapshot()
+    # ...nor reuses it for the unchanged source, but replaces it
+    assert after.refresh()
+    assert len(after.full_loads) == 1
+    assert after.state['version'] == before.state['version']
+    assert refresher(fixture, tmp_path, reference='after').load_snapshot()
+    assert not refresher(fixture, tmp_path, reference='before').load_snapshot()
@@ -0,0 +1,213 @@
+##############################
+# US COUNTY -> STATE ROLLUPS #
+##############################
+
+# The JHU US files hold one row per county (plus a few per-state rows such as
+# "Unassigned" and the cruise ships) and one column per date. CountyHierarchy
+# keeps the county counts as int32 matrices sorted by state then county, and
+# sums them into one row per state and one for the nation when the data is
+# loaded, so a state or the whole country is a single row lookup at request
+# time instead of a scan over the 3,000+ county rows. The daily deltas and
+# analytics columns of those rollups are computed at load time as well, for
+# all states at once; only a county's are computed when it is asked for.
+#
+# USCounties reloads the files in a daemon thread on the world data's
+# schedule and swaps the new hierarchy in with a single assignment. The
+# downloads are conditional, so files that did not change are not read.
+
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import jhu_timeseries
+from daily_deltas import segment_starts, segmented_diff
+from data_refresh import REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to leave the US drill-down out
+US_COUNTIES = os.environ.get('US_COUNTIES', '1') == '1'
+
+METRICS = ['Confirmed', 'Deaths']
+
+# Name shown for the rows of a state that have no county
+NO_COUNTY = 'Unassigned'
+
+
+def _series_columns(totals):
+    """Totals, daily deltas and analytics columns, like those of
+    CountyHierarchy.series(), of metric -> (regions x dates) `totals`."""
+    columns = {}
+    for metric, values in totals.items():
+        daily = np.zeros_like(values)
+        daily[:, 1:] = np.diff(values, axis=1)
+        columns[metric] = values
+        columns['new' + metric] = daily
+    for metric in totals:
+        growth = analytics.growth_metrics(
+            columns[metric].astype(np.float64),
+            columns['new' + metric].astype(np.float64))
+        for kind, matrix in growth.items():
+            columns[kind + metric] = matrix.astype(np.float32)
+    return columns
+
+
+class CountyHierarchy:
+    """County, state and nation series of the US files."""
+
+    def __init__(self, series, metrics=METRICS):
+        regions = series.regions
+        states = regions['Province_State'].astype(str)
+        counties = regions['Admin2'].fillna(NO_COUNTY).astype(str)
+        order = pd.DataFrame({'state': states, 'county': counties}).sort_values(
+            ['state', 'county'], kind='mergesort').index.to_numpy()
+
+        self.dates = series.dates.to_numpy()
+        self.county_names = counties.to_numpy(dtype=object)[order]
+        county_states = states.to_numpy(dtype=object)[order]
+        self.counties = {metric: series.values[metric][order]
+                         for metric in metrics}
+
+        starts = segment_starts(county_states)
+        stops = np.append(starts[1:], len(order))
+        self.state_names = list(county_states[starts])
+        self.state_rows = {name: row for row, name in enumerate(self.state_names)}
+        self.state_slices = {
+            name: slice(start, stop)
+            for name, start, stop in zip(self.state_names, starts, stops)
+        }
+        self.county_rows = {
+            (state, county): row
+            for row, (state, county) in enumerate(
+                zip(county_states, self.county_names))
+        }
+
+        # Rollups: one int64 row per state, one for the nation
+        self.states = {
+            metric: np.add.reduceat(values, starts, axis=0, dtype=np.int64)
+            if len(values) else np.zeros((0, len(self.dates)), np.int64)
+            for metric, values in self.counties.items()
+        }
+        self.nation = {metric: values.sum(axis=0)
+                       for metric, values in self.states.items()}
+        self.state_series = _series_columns(self.states)
+        self.nation_series = {
+            column: values[0] for column, values in _series_columns(
+                {metric: values[None] for metric, values in self.nation.items()}
+            ).items()
+        }
+
+        digest = hashlib.sha256(self.dates.tobytes())
+        for metric in metrics:
+            digest.update(self.counties[metric].tobytes())
+        self.version = digest.hexdigest()[:16]
+
+    def counties_of(self, state):
+        """County names of `state` in sorted order."""
+        rows = self.state_slices.get(state, slice(0, 0))
+        return list(self.county_names[rows])
+
+    def totals(self, state=None, county=None):
+        """Cumulative counts of the nation, a state or a county, as metric ->
+        one row of the rollups; None for an unknown region."""
+        if state is None:
+            return self.nation
+        if county is None:
+            row, rows = self.state_rows.get(state), self.states
+        else:
+            row, rows = self.county_rows.get((state, county)), self.counties
+        if row is None:
+            return None
+        return {metric: values[row] for metric, values in rows.items()}
+
+    def series(self, state=None, county=None):
+        """Date, totals, daily deltas and analytics columns of a region, like
+        CountryIndex.series(). Unknown regions get empty arrays."""
+        if county is None and (state is None or state in self.state_rows):
+            series = {'Date': self.dates}
+            if state is None:
+                series.update(self.nation_series)
+            else:
+                row = self.state_rows[state]
+                series.update((column, values[row])
+                              for column, values in self.state_series.items())
+            return series
+        totals = self.totals(state, county)
+        dates = self.dates
+        if totals is None:
+            dates = dates[:0]
+            totals = {metric: np.zeros(0, np.int64) for metric in self.nation}
+        series = {'Date': dates}
+        starts = segment_starts(np.zeros(len(dates)))
+        for metric, values in totals.items():
+            series[metric] = values
+            series['new' + metric] = segmented_diff(values, starts)
+        series.update(analytics.series_metrics(series, list(totals)))
+        return series
+
+
+class USCounties:
+    """Keeps the latest CountyHierarchy and reloads it on a schedule.
+
+    `hierarchy` is None until the first load has finished.
+    """
+
+    def __init__(self, files=jhu_timeseries.US_FILES,
+                 base_url=jhu_timeseries.BASE_URL, interval=REFRESH_INTERVAL):
+        self.files = files
+        self.base_url = base_url
+        self.interval = interval
+        self.hierarchy = None
+        self._validators = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Reloads the files; returns True when the data changed."""
+        loaded = jhu_timeseries.load_modified(self.files, jhu_timeseries.US_KEY,
+                                              self._validators, self.base_url)
+        if loaded is None:
+            logger.info('US county files not modified')
+            return False
+        series, validators = loaded
+        del loaded
+        hierarchy = CountyHierarchy(series)
+        del series
+        current = self.hierarchy
+        if current is not None and current.version == hierarchy.version:
+            logger.info('US county data unchanged (version %s)',
+                        hierarchy.version)
+            self._validators = validators
+            return False
+        self.hierarchy = hierarchy
+        self._validators = validators
+        logger.info('Loaded US county data version %s: %d counties, %d dates',
+                    hierarchy.version, len(hierarchy.county_names),
+                    len(hierarchy.dates))
+        return True
+
+    def start(self):
+        """Starts refreshing in a daemon thread; returns immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='us-counties-refresh',
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the previous data and try again next time
+                logger.exception('Refreshing the US county data failed')
+            self._stop.wait(self.interval)
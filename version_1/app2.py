@@ -1,46 +1,50 @@
+import json
+import os
+import sys
+
 import dash
 import folium
-import pycountry
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objects as go
 from dash.dependencies import Input, Output
+from flask import abort, request
 import dash_bootstrap_components as dbc
 import pandas as pd
 import datetime
 import plotly.express as px
 import numpy as np
-# from update_map import loadData
-# from update_map import map_locations
+from update_map import PointClusters, latest_points, mercator, to_latlon
+
+# The loaders are shared with the main app one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import country_codes
+import jhu_timeseries
+from http_cache import ResponseCache
 
 ####################################################
 # GATHERING AND PARSING DATA FOR CHARTS AND GRAPHS #
 ####################################################
-base_url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/"  # Github link to data
-
-
-# Function to collect new data on every reload of the page
-def loadData(fileName, columnName):
-    data = pd.read_csv(base_url + fileName) \
-             .melt(id_vars=['Province/State', 'Country/Region', 'Lat', 'Long'], var_name='date', value_name=columnName) \
-             .fillna('<all>')
-    data['date'] = data['date'].astype('datetime64[ns]')
-    return data
-
-
-# Getting data
-all_data = loadData("time_series_covid19_confirmed_global.csv", "CumConfirmed") \
-    .merge(loadData("time_series_covid19_deaths_global.csv", "CumDeaths"))
 
-# Combining lat and lon into a new 'location' column
-all_data['location'] = list(zip(all_data['Lat'], all_data['Long']))
+# Confirmed cases and deaths as one (region x date) matrix each, regions
+# being a country or one of its provinces (see jhu_timeseries)
+all_data = jhu_timeseries.load(jhu_timeseries.GLOBAL_FILES,
+                               jhu_timeseries.GLOBAL_KEY)
+all_data.regions['Province/State'] = all_data.regions['Province/State'].fillna(
+    '<all>')
 
 country_list = sorted(
-    all_data['Country/Region'].unique())  # For callback functions
-
-# Grouping data by country
-grouped_country = all_data.groupby('Country/Region').max().reset_index()
-grouped_country.drop('Province/State', axis=1, inplace=True)
+    all_data.regions['Country/Region'].unique())  # For callback functions
+
+# Grouping data by country: the largest region of each country (its latest
+# count, the counts being cumulative)
+regions = all_data.regions.assign(
+    CumConfirmed=all_data.values['Confirmed'].max(axis=1, initial=0),
+    CumDeaths=all_data.values['Deaths'].max(axis=1, initial=0))
+grouped_country = regions.groupby('Country/Region')[
+    ['Lat', 'Long', 'CumConfirmed', 'CumDeaths']].max().reset_index()
+grouped_country['date'] = all_data.dates[-1]
 # total_confirmed = grouped_country['CumConfirmed'].sum().astype(str)
 # total_deaths = grouped_country['CumDeaths'].sum().astype(str)
 total_confirmed = format(grouped_country['CumConfirmed'].sum(), ",")
@@ -57,40 +61,10 @@ mean = more_than_100.DeathRate.mean()
 #print(total_confirmed)
 #print(total_deaths)
 
-# Adding 3-letter country codes
-input_countries = grouped_country['Country/Region']
-
-countries = {}
-for country in pycountry.countries:
-    countries[country.name] = country.alpha_3
-
-codes = [countries.get(country, 'Unknown code') for country in input_countries]
-
-#print(codes)
-grouped_country[
-    'code'] = codes  # Creating new column with 3-letter country code for each country
-
-# Manually updating missing 3-letter codes
-grouped_country.loc[20, 'code'] = 'BOL'
-grouped_country.loc[24, 'code'] = 'BWN'
-grouped_country.loc[27, 'code'] = 'MMR'
-grouped_country.loc[38, 'code'] = 'COG'
-grouped_country.loc[39, 'code'] = 'COD'
-grouped_country.loc[41, 'code'] = 'CIV'
-grouped_country.loc[74, 'code'] = 'VAT'
-grouped_country.loc[80, 'code'] = 'IRN'
-grouped_country.loc[90, 'code'] = 'KOR'
-grouped_country.loc[91, 'code'] = 'RKS'
-grouped_country.loc[94, 'code'] = 'LAO'
-grouped_country.loc[112, 'code'] = 'MDA'
-grouped_country.loc[138, 'code'] = 'RUS'
-grouped_country.loc[160, 'code'] = 'SYR'
-grouped_country.loc[161, 'code'] = 'TWN'
-grouped_country.loc[162, 'code'] = 'TZA'
-grouped_country.loc[169, 'code'] = 'USA'
-grouped_country.loc[176, 'code'] = 'VEN'
-grouped_country.loc[177, 'code'] = 'VNM'
-grouped_country.loc[178, 'code'] = 'PSE'
+# Adding 3-letter country codes (see country_codes), raising for country
+# names that resolve to none
+grouped_country['code'] = country_codes.codes().resolve_all(
+    grouped_country['Country/Region'])
 
 #grouped_country.head()
 
@@ -159,41 +133,78 @@ def world_map():
 
 world_map = world_map()
 
-# For map
-# latitude = 37.0902
-# longitude = -95.7129
-
-# locations = all_data['location']
-# confirmed_cases = all_data.CumConfirmed
-# deaths = all_data.CumDeaths
-# countries = all_data['Country/Region']
-
-# def map_locations():
-
-#     locations = all_data['location']
-#     confirmed_cases = all_data.CumConfirmed
-#     deaths = all_data.CumDeaths
-#     countries = all_data['Country/Region']
-#     corona_map = folium.Map(location=[latitude, longitude], zoom_start=3)
-
-#     for location, confirmed, death, country in zip(locations, confirmed_cases,
-#                                                    deaths, countries):
-#         folium.CircleMarker(
-#             location,
-#             color='#3186cc',
-#             weight=0.1,
-#             fill_color='#C23208',
-#             fill=True,
-#             fill_opacity=0.1,
-#             tooltip=('<H6>' + country + '</H6>' + '<br>'
-#                      'Confirmed: ' + '<strong style="color:#C23208;">' +
-#                      str(confirmed) + '</strong>' + '<br>'
-#                      'Deaths: ' + '<strong style="color:#C23208;">' +
-#                      str(death) + '</strong>' + '<br>')).add_to(corona_map)
-#     return corona_map
-
-# location_map = map_locations()
-# location_map.save(outfile='location_map.html')
+##############################
+# CLUSTERED MAP OF LOCATIONS #
+##############################
+
+# Confirmed cases and deaths of every location on the last date, clustered
+# per zoom level (see update_map); the map only gets the clusters in view
+point_clusters = PointClusters(
+    *latest_points(all_data, ['Province/State', 'Country/Region']))
+
+# The data is loaded once, its last date versions the cached tiles
+data_version = str(all_data.dates[-1].date())
+
+# Pixels of the map, to find its bounds when plotly only sends the center
+MAP_VIEW_PX = (1000, 500)
+
+
+def map_view(relayout):
+    """(zoom, west, south, east, north) of the map after `relayout`."""
+    relayout = relayout or {}
+    zoom = relayout.get('mapbox.zoom', 0)
+    derived = relayout.get('mapbox._derived')
+    if derived and derived.get('coordinates'):
+        lon, lat = np.array(derived['coordinates'], dtype=np.float64).T
+        return zoom, lon.min(), lat.min(), lon.max(), lat.max()
+    center = relayout.get('mapbox.center')
+    if center is None:
+        return zoom, -180, -90, 180, 90
+    x, y = mercator(center['lat'], center['lon'])
+    world = 512 * 2**zoom
+    dx, dy = MAP_VIEW_PX[0] / 2 / world, MAP_VIEW_PX[1] / 2 / world
+    north, west = to_latlon(x - dx, y - dy)
+    south, east = to_latlon(x + dx, y + dy)
+    if dx >= 0.5:
+        west, east = -180, 180
+    return zoom, west, south, east, north
+
+
+def point_map(level, positions):
+    clusters = point_clusters.levels[level]
+    confirmed = clusters['Confirmed'][positions]
+    size = clusters['size'][positions]
+    text = [
+        f'<b>{name}</b>' + ('' if n == 1 else f' and {n - 1} more') + '<br>'
+        f'Confirmed: {c:,}<br>Deaths: {d:,}'
+        for name, n, c, d in zip(clusters['name'][positions], size, confirmed,
+                                 clusters['Deaths'][positions])
+    ]
+    fig = go.Figure(
+        go.Scattermapbox(
+            lat=np.round(clusters['lat'][positions], 4),
+            lon=np.round(clusters['lon'][positions], 4),
+            text=text,
+            hoverinfo='text',
+            marker=dict(
+                size=np.sqrt(confirmed),
+                sizemode='area',
+                # The same scale at every position of a level
+                sizeref=2 * np.sqrt(clusters['Confirmed'].max(initial=1)) / 40**2,
+                sizemin=3,
+                color='#C23208',
+                opacity=0.6)))
+    fig.update_layout(mapbox=dict(style='carto-darkmatter'),
+                      margin={
+                          "r": 0,
+                          "t": 0,
+                          "l": 0,
+                          "b": 0
+                      },
+                      # Keeps the user's zoom when the clusters are replaced
+                      uirevision='point_map')
+    return fig
+
 
 ######################
 # BUILDING DASHBOARD #
@@ -224,7 +235,9 @@ app.layout = html.Div(
                    'font-size': '12px',
                    'margin-top': '0px'
                }),
-        #html.Iframe(id='map', srcDoc = open('./location_map.html', 'r').read(), width='95%', height='500'),
+        dcc.Graph(id='point_map',
+                  figure=point_map(*point_clusters.viewport(*map_view(None))),
+                  config={'displayModeBar': False}),
         #dcc.Graph(id='world_map', figure=world_map),
         #html.Button(id='map-submit-button', n_clicks=0, children='Refresh Map'),
         html.Div(
@@ -336,7 +349,7 @@ app.layout = html.Div(
                Output('state', 'value')], [Input('country', 'value')])
 def update_states(country):
     states = sorted(
-        list(all_data.loc[all_data['Country/Region'] == country]
+        list(all_data.regions.loc[all_data.regions['Country/Region'] == country]
              ['Province/State'].unique()))
     states.insert(0, '<all>')
     state_options = [{'label': s, 'value': s} for s in states]
@@ -345,17 +358,16 @@ def update_states(country):
 
 
 def nonreactive_data(country, state):
-    data = all_data.loc[all_data['Country/Region'] == country]
     if state == '<all>':
-        data = data.drop('Province/State',
-                         axis=1).groupby("date").sum().reset_index()
+        rows = all_data.rows(**{'Country/Region': country})
     else:
-        data = data.loc[data['Province/State'] == state]
-    new_cases = data.select_dtypes(include='int64').diff().fillna(0)
-    new_cases.columns = [
-        column.replace('Cum', 'New') for column in new_cases.columns
-    ]
-    data = data.join(new_cases)
+        rows = all_data.rows(**{'Country/Region': country,
+                                'Province/State': state})
+    data = pd.DataFrame({'date': all_data.dates})
+    for metric in ['Confirmed', 'Deaths']:
+        cumulative = all_data.total(metric, rows)
+        data['Cum' + metric] = cumulative
+        data['New' + metric] = np.diff(cumulative, prepend=cumulative[:1])
     data['dateStr'] = data['date'].dt.strftime('%b %d, %Y')
     return data
 
@@ -433,15 +445,31 @@ def update_plot_cum_metrics(country, state, metrics):
                      yaxisTitle="Cumulative Cases")
 
 
-# @app.callback(dash.dependencies.Output('map', 'srcDoc'),
-#               [dash.dependencies.Input('map-submit-button', 'n_clicks')])
-# def update_map(n_clicks):
-#     if n_clicks is None:
-#         return dash.no_update
-#     else:
-#         return open('location_map.html', 'r').read()
+# Zooming or panning the map swaps in the clusters of the new view
+@app.callback(Output('point_map', 'figure'),
+              [Input('point_map', 'relayoutData')])
+def update_point_map(relayout):
+    return point_map(*point_clusters.viewport(*map_view(relayout)))
+
 
 server = app.server
 
+# The clusters of one tile as GeoJSON, serialized once per tile
+tile_cache = ResponseCache()
+
+
+@server.route('/tiles/points/<int:zoom>/<int:x>/<int:y>.geojson')
+def point_tile(zoom, x, y):
+    try:
+        positions = point_clusters.tile(zoom, x, y)
+    except ValueError:
+        abort(404)
+    # Most tiles are empty and share one response
+    name = f'{zoom}/{x}/{y}' if len(positions) else 'empty'
+    return tile_cache.get(
+        name, data_version,
+        lambda: json.dumps(point_clusters.geojson(zoom, x, y)),
+        mimetype='application/geo+json').respond(request)
+
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -1,85 +1,166 @@
-# import dash
-# import folium
-# import dash_core_components as dcc
-# import dash_html_components as html
-# import plotly.graph_objects as go
-# from dash.dependencies import Input, Output
-# import dash_bootstrap_components as dbc
-# import pandas as pd
-# import datetime
-
-# base_url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/"
-
-# tick_font = {
-#     'size': 12,
-#     'color': "rgb(30,30,30)",
-#     'family': "Helvetica, sans-serif"
-# }
-
-# colors = {'background': '#111111', 'text': '#7FDBFF'}
-
-
-# def loadData(fileName, columnName):
-#     data = pd.read_csv(base_url + fileName) \
-#              .melt(id_vars=['Province/State', 'Country/Region', 'Lat', 'Long'], var_name='date', value_name=columnName) \
-#              .fillna('<all>')
-#     data['date'] = data['date'].astype('datetime64[ns]')
-#     return data
-
-
-# all_data = loadData("time_series_covid19_confirmed_global.csv", "CumConfirmed") \
-#     .merge(loadData("time_series_covid19_deaths_global.csv", "CumDeaths")) \
-#     .merge(loadData("time_series_covid19_recovered_global.csv", "CumRecovered"))
-
-# all_data['location'] = list(zip(all_data['Lat'], all_data['Long']))
-
-# countries = sorted(all_data['Country/Region'].unique())
-
-# # Grouping data by country
-# grouped_country = all_data.groupby('Country/Region').max().reset_index()
-# grouped_country.drop('Province/State', axis=1, inplace=True)
-# total_confirmed = grouped_country['CumConfirmed'].sum().astype(str)
-# total_deaths = grouped_country['CumDeaths'].sum().astype(str)
-# #print(total_confirmed)
-# #print(total_deaths)
-# last_updated = grouped_country.date.iloc[-1].strftime("%d-%B-%Y")
-
-# # For map
-# # latitude = 34.717911
-# # longitude = -40.819474
-
-# # locations = all_data['location']
-# # confirmed_cases = all_data.CumConfirmed
-# # deaths = all_data.CumDeaths
-# # countries = all_data['Country/Region']
-
-# def map_locations():
-
-#     # For map
-#     latitude = 34.717911
-#     longitude = -40.819474
-
-#     locations = all_data['location']
-#     confirmed_cases = all_data.CumConfirmed
-#     deaths = all_data.CumDeaths
-#     countries = all_data['Country/Region']
-#     corona_map = folium.Map(location=[latitude, longitude], zoom_start=3)
-
-#     for location, confirmed, death, country in zip(locations, confirmed_cases,
-#                                                    deaths, countries):
-#         folium.CircleMarker(
-#             location,
-#             color='#3186cc',
-#             weight=0.1,
-#             fill_color='#C23208',
-#             fill=True,
-#             fill_opacity=0.1,
-#             tooltip=('<H6>' + country + '</H6>' + '<br>'
-#                      'Confirmed: ' + '<strong style="color:#C23208;">' +
-#                      str(confirmed) + '</strong>' + '<br>'
-#                      'Deaths: ' + '<strong style="color:#C23208;">' +
-#                      str(death) + '</strong>' + '<br>')).add_to(corona_map)
-#     return corona_map
-
-# location_map = map_locations() # Uncomment if timeout
-# location_map.save(outfile='./location_map.html') # Uncomment if timeout
\ No newline at end of file
+###################################
+# CLUSTERED MAP OF THE JHU POINTS #
+###################################
+
+# The point map used to add one folium.CircleMarker per row of the melted
+# time series, so every location once per date, and the resulting HTML was so
+# large it had to be saved to a file ahead of time. PointClusters keeps the
+# counts of each location on the last date only and groups the locations into
+# clusters at every zoom level up front: at zoom z the Web Mercator square is
+# a grid of (CELLS * 2**z)**2 cells of CELL_PX pixels, the points of a cell
+# make one cluster, and the clusters of a level are sorted by the
+# TILE_SIZE-pixel tile they fall in. A tile is then one slice of its level and
+# a viewport one slice per row of tiles, so what is served depends on the
+# viewport, not on how many points there are.
+#
+# Zoom levels and tiles follow the mapbox convention of 512 pixel tiles.
+
+import os
+
+import numpy as np
+
+# Deepest zoom level with its own clusters; deeper views use its clusters
+MAX_ZOOM = int(os.environ.get('POINT_MAP_MAX_ZOOM', 8))
+
+TILE_SIZE = 512
+
+# Side in pixels of the cells a cluster gathers, a divisor of TILE_SIZE
+CELL_PX = 64
+CELLS = TILE_SIZE // CELL_PX
+
+# Latitudes Web Mercator can show
+MAX_LAT = 85.0511287798
+
+METRICS = ['Confirmed', 'Deaths']
+
+
+def mercator(lat, lon):
+    """Position of `lat`, `lon` on the Web Mercator square, in [0, 1)."""
+    sin = np.sin(np.radians(np.clip(lat, -MAX_LAT, MAX_LAT)))
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    return np.clip(x, 0, np.nextafter(1, 0)), np.clip(y, 0, np.nextafter(1, 0))
+
+
+def to_latlon(x, y):
+    """Inverse of mercator()."""
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y)))))
+    return lat, np.asarray(x) * 360 - 180
+
+
+def latest_points(series, name_columns, lat='Lat', lon='Long'):
+    """(names, lat, lon, counts) of the regions of a WideTimeSeries, counts
+    being metric -> counts on the last date. A name joins the non-blank
+    `name_columns` of its region with commas."""
+    parts = series.regions[name_columns].fillna('<all>').astype(str).to_numpy()
+    names = np.array([', '.join(p for p in row if p != '<all>') for row in parts],
+                     dtype=object)
+    counts = {metric: series.values[metric][:, -1].astype(np.int64)
+              for metric in METRICS if metric in series.values}
+    return (names, series.regions[lat].to_numpy(dtype=np.float64),
+            series.regions[lon].to_numpy(dtype=np.float64), counts)
+
+
+class PointClusters:
+    """Clusters of located points at zoom levels 0 to max_zoom.
+
+    Each level is a dict of arrays, one entry per cluster: 'tile' (the key of
+    its tile, y * 2**zoom + x, the arrays being sorted by it), 'lat' and
+    'lon' (the mean position of its points), 'size' (its number of points),
+    'name' (that of its point with the most confirmed cases) and one entry
+    per metric (its total).
+    """
+
+    def __init__(self, names, lat, lon, counts, max_zoom=MAX_ZOOM):
+        # JHU has no position for some regions, written as 0, 0
+        located = (np.isfinite(lat) & np.isfinite(lon)
+                   & ~((lat == 0) & (lon == 0)))
+        self.names = np.asarray(names, dtype=object)[located]
+        self.lat, self.lon = lat[located], lon[located]
+        self.counts = {m: np.asarray(c)[located] for m, c in counts.items()}
+        self.max_zoom = max_zoom
+
+        self._x, self._y = mercator(self.lat, self.lon)
+        # Points by decreasing confirmed cases, so that the first point of a
+        # cluster names it
+        first = next(iter(self.counts.values()), np.zeros(len(self.lat)))
+        self._order = np.argsort(-first, kind='stable')
+        self.levels = [self._level(zoom) for zoom in range(max_zoom + 1)]
+
+    def _level(self, zoom):
+        side = CELLS << zoom
+        cx = (self._x * side).astype(np.int64)
+        cy = (self._y * side).astype(np.int64)
+        tile = (cy // CELLS) * (1 << zoom) + cx // CELLS
+        # Cells of a tile are numbered after the tile, so sorting the cells
+        # sorts the clusters by tile
+        cell = (tile * CELLS + cy % CELLS) * CELLS + cx % CELLS
+        cells, cluster = np.unique(cell, return_inverse=True)
+        size = np.bincount(cluster, minlength=len(cells))
+
+        ordered = cluster[self._order]
+        named = self._order[np.unique(ordered, return_index=True)[1]]
+        level = {
+            'tile': cells // (CELLS * CELLS),
+            'lat': np.bincount(cluster, self.lat, len(cells)) / size,
+            'lon': np.bincount(cluster, self.lon, len(cells)) / size,
+            'size': size,
+            'name': self.names[named],
+        }
+        for metric, values in self.counts.items():
+            level[metric] = np.bincount(cluster, values,
+                                        len(cells)).astype(np.int64)
+        return level
+
+    def level_of(self, zoom):
+        """The level whose clusters are shown at (fractional) `zoom`."""
+        return int(min(max(np.floor(zoom), 0), self.max_zoom))
+
+    def tile(self, zoom, x, y):
+        """Positions in level `zoom` of the clusters of tile x, y."""
+        if not 0 <= zoom <= self.max_zoom or not 0 <= x < 1 << zoom \
+                or not 0 <= y < 1 << zoom:
+            raise ValueError(f'No tile {zoom}/{x}/{y}')
+        key = y * (1 << zoom) + x
+        tiles = self.levels[zoom]['tile']
+        return np.arange(np.searchsorted(tiles, key),
+                         np.searchsorted(tiles, key, side='right'))
+
+    def viewport(self, zoom, west, south, east, north):
+        """(level, positions) of the clusters in the tiles that cover the
+        bounds, at the level of `zoom`."""
+        level = self.level_of(zoom)
+        tiles = self.levels[level]['tile']
+        n = 1 << level
+        if east - west >= 360 or west > east:
+            # The whole width, or across the antimeridian
+            west, east = -180, 180
+        x0, y0 = mercator(north, west)
+        x1, y1 = mercator(south, east)
+        columns = int(x0 * n), int(x1 * n)
+        # One slice per row of tiles, the tiles of a row being consecutive
+        slices = [np.arange(np.searchsorted(tiles, row * n + columns[0]),
+                            np.searchsorted(tiles, row * n + columns[1],
+                                            side='right'))
+                  for row in range(int(y0 * n), int(y1 * n) + 1)]
+        return level, np.concatenate(slices)
+
+    def geojson(self, zoom, x, y):
+        """The clusters of tile x, y at `zoom` as a GeoJSON FeatureCollection."""
+        level = self.levels[zoom]
+        features = []
+        for position in self.tile(zoom, x, y):
+            properties = {'name': level['name'][position],
+                          'size': int(level['size'][position])}
+            for metric in self.counts:
+                properties[metric] = int(level[metric][position])
+            features.append({
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [round(float(level['lon'][position]), 5),
+                                    round(float(level['lat'][position]), 5)],
+                },
+                'properties': properties,
+            })
+        return {'type': 'FeatureCollection', 'features': features}